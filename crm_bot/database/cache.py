@@ -0,0 +1,93 @@
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Tuple
+from config import Config
+import time
+
+MISSING = object()
+
+
+class TTLCache:
+    """Bounded in-process LRU cache whose entries also expire after ``ttl`` seconds"""
+
+    def __init__(self, name: str, max_size: int, ttl: float):
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Any:
+        """Return the cached value or the ``MISSING`` sentinel"""
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return MISSING
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return MISSING
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        if self.max_size <= 0:
+            return
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def discard_where(self, predicate: Callable[[Any], bool]) -> None:
+        """Drop every entry whose value matches ``predicate``"""
+        for key in [key for key, (_, value) in self._data.items() if predicate(value)]:
+            del self._data[key]
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+# Keys: ("id", seller_id) / ("passport", passport_serial)
+seller_cache = TTLCache("sellers", Config.LOOKUP_CACHE_SIZE, Config.LOOKUP_CACHE_TTL)
+# Keys: passport_serial
+client_cache = TTLCache("clients", Config.LOOKUP_CACHE_SIZE, Config.LOOKUP_CACHE_TTL)
+# Keys: lower-cased name prefix ("" for all sellers); values: pre-rendered keyboard pages
+seller_picker_cache = TTLCache("seller_picker", 64, Config.LOOKUP_CACHE_TTL)
+
+
+def invalidate_seller(seller_id: int = None, passport_serial: str = None) -> None:
+    if seller_id is not None:
+        seller_cache.pop(("id", seller_id))
+        seller_cache.discard_where(lambda seller: seller is not None and seller.id == seller_id)
+    if passport_serial is not None:
+        seller_cache.pop(("passport", passport_serial))
+
+
+def invalidate_seller_listing() -> None:
+    """Sellers were added, renamed or removed: drop the pre-rendered picker pages"""
+    seller_picker_cache.clear()
+
+
+def invalidate_client(passport_serial: str) -> None:
+    client_cache.pop(passport_serial)
+
+
+def get_cache_stats() -> Dict[str, Dict[str, Any]]:
+    return {cache.name: cache.stats() for cache in (seller_cache, client_cache, seller_picker_cache)}
@@ -1,170 +1,242 @@
-from sqlalchemy import select, join, update, func
+from sqlalchemy import select, insert, join, update, delete, func, case, null, true
 from sqlalchemy.orm import joinedload, selectinload
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
-from openpyxl import Workbook
-from io import BytesIO
-from database.models import Seller, Client, Order, Consumptions
-from database.utils import async_session
-from .database import AsyncSessionLocal
+from utilities.workers import report_pool
+from database.models import Seller, Client, Order, Consumptions, REMINDER_INTERVAL
+from database.utils import session_scope
+from database.rollup import ROLLUP_COLUMNS, added_orders_cte, apply_order_change, locked_previous, previous_columns, snapshot
+from database.instrumentation import tag_queries, query_tag
+from database.cache import MISSING, seller_cache, client_cache, invalidate_seller, invalidate_seller_listing, invalidate_client
+from contextlib import aclosing
+import logging
 
-async def get_seller_by_passport(passport_serial: str):
+logger = logging.getLogger(__name__)
+
+# Every function accepts an optional ``session``: handlers pass the one opened by
+# DbSessionMiddleware so a whole update runs on one connection and transaction.
+
+def _cacheable(session: AsyncSession, instance):
+    """Detach an instance before caching it so a later rollback cannot expire it"""
+    if instance is not None and instance in session:
+        session.expunge(instance)
+    return instance
+
+@tag_queries
+async def get_seller_by_passport(passport_serial: str, session: AsyncSession = None):
+    cached = seller_cache.get(("passport", passport_serial))
+    if cached is not MISSING:
+        return cached
     try:
-        async with async_session() as session:
+        async with session_scope(session) as session:
             result = await session.execute(
                 select(Seller).where(Seller.passport_serial == passport_serial)
             )
-            return result.scalar_one_or_none()
+            seller = _cacheable(session, result.scalar_one_or_none())
     except SQLAlchemyError as e:
         return None
+    seller_cache.set(("passport", passport_serial), seller)
+    return seller
 
-async def add_seller_to_db(data: dict):
-    async with async_session() as session:
-        try:
-            seller = Seller(
-                full_name=data['full_name'],
-                phone=data['phone'],
-                passport_serial=data['passport_serial'],
-                salary_of_seller=data.get('salary_of_seller'),
-                started_job_at=data['started_job_at'],
-            )
-            session.add(seller)
-            await session.commit()
-            await session.refresh(seller)
-            return seller
-        except Exception as e:
-            await session.rollback()
-            raise e
+@tag_queries
+async def add_seller_to_db(data: dict, session: AsyncSession = None):
+    async with session_scope(session) as session:
+        seller = Seller(
+            full_name=data['full_name'],
+            phone=data['phone'],
+            passport_serial=data['passport_serial'],
+            salary_of_seller=data.get('salary_of_seller'),
+            started_job_at=data['started_job_at'],
+        )
+        session.add(seller)
+        await session.flush()
+        await session.refresh(seller)
+    invalidate_seller(passport_serial=seller.passport_serial)
+    invalidate_seller_listing()
+    return seller
 
-async def add_client_to_db(client_data: dict):
-    async with AsyncSessionLocal() as session:
-        try:
-            # Ensure required location fields are present
-            if 'latitude' not in client_data or 'longitude' not in client_data:
-                raise ValueError("Location coordinates are required")
-                
-            client = Client(**client_data)
-            session.add(client)
-            await session.commit()
-            await session.refresh(client)
-            return client
-        except Exception as e:
-            await session.rollback()
-            raise e
+@tag_queries
+async def add_client_to_db(client_data: dict, session: AsyncSession = None):
+    # Ensure required location fields are present
+    if 'latitude' not in client_data or 'longitude' not in client_data:
+        raise ValueError("Location coordinates are required")
 
-async def get_client_by_passport(passport: str):
+    async with session_scope(session) as session:
+        client = Client(**client_data)
+        session.add(client)
+        await session.flush()
+        await session.refresh(client)
+    invalidate_client(client.passport_serial)
+    return client
+
+@tag_queries
+async def get_client_by_passport(passport: str, session: AsyncSession = None):
+    cached = client_cache.get(passport)
+    if cached is not MISSING:
+        return cached
     try:
-        async with async_session() as session:
+        async with session_scope(session) as session:
             result = await session.execute(
                 select(Client).where(Client.passport_serial == passport)
             )
-            return result.scalars().first()
+            client = _cacheable(session, result.scalars().first())
     except SQLAlchemyError as e:
         return None
+    client_cache.set(passport, client)
+    return client
 
-async def create_order(order_data: dict):
-    async with AsyncSessionLocal() as session:
-        try:
-            # Set default status if not provided
-            order_data.setdefault('order_status', 'Ochiq')
-            order = Order(**order_data)
-            session.add(order)
-            await session.commit()
-            await session.refresh(order)
-            return order
-        except Exception as e:
-            await session.rollback()
-            raise e
+@tag_queries
+async def create_order(order_data: dict, session: AsyncSession = None):
+    """
+    Create an order, bump the seller's counter, add the order to its month's
+    rollup and fetch the receipt fields in a single statement
+    (data-modifying CTEs), i.e. one round trip.
+    Returns a row with order_id, client_* and seller_* fields.
+    """
+    values = dict(order_data)
+    # Set default status if not provided
+    values.setdefault('order_status', 'Ochiq')
+    values.update(Order.opening_balance(values.get('sum_of_item'), values.get('prepaid')))
+    values['next_notification_at'] = Order.next_notification(values['order_status'], values.get('created_at'))
 
-async def get_all_orders_with_details():
-    async with async_session() as session:
-        try:
-            query = (
-                select(
-                    Order.id.label("order_id"),
-                    Order.order_status,
-                    Order.created_at,
-                    Order.item_count,
-                    Order.sum_of_item,
-                    Order.every_month_should_pay,
-                    Order.prepaid,
-                    Order.total_paid,
-                    Order.remaining_amount,
-                    Client.full_name.label("client_name"),
-                    Client.phone.label("client_phone"),
-                    Client.passport_serial.label("client_passport"),
-                    Client.latitude.label("client_latitude"),  # Added
-                    Client.longitude.label("client_longitude"),  # Added
-                    Seller.full_name.label("seller_name")
-                )
-                .select_from(
-                    join(Order, Client, Order.client_id == Client.id)
-                    .join(Seller, Order.seller_id == Seller.id)
-                )
-                .order_by(Order.created_at.desc())
-            )
-            result = await session.execute(query)
-            return result.all()
-        except Exception as e:
-            return None
+    new_order = (
+        insert(Order)
+        .values(**values)
+        .returning(Order.id, Order.client_id, Order.seller_id, *(getattr(Order, name) for name in ROLLUP_COLUMNS))
+        .cte("new_order")
+    )
+    bumped_seller = (
+        update(Seller)
+        .where(Seller.id == new_order.c.seller_id)
+        .values(order_counter=Seller.order_counter + 1)
+        .returning(Seller.full_name, Seller.order_counter)
+        .cte("bumped_seller")
+    )
+    query = (
+        select(
+            new_order.c.id.label("order_id"),
+            new_order.c.created_at,
+            Client.full_name.label("client_name"),
+            Client.phone.label("client_phone"),
+            Client.latitude.label("client_latitude"),
+            Client.longitude.label("client_longitude"),
+            bumped_seller.c.full_name.label("seller_name"),
+            bumped_seller.c.order_counter.label("seller_order_counter")
+        )
+        .select_from(new_order)
+        .join(Client, Client.id == new_order.c.client_id)
+        .outerjoin(bumped_seller, true())
+        # Not referenced by the select, but Postgres runs every data-modifying CTE
+        .add_cte(added_orders_cte(new_order))
+    )
+    async with session_scope(session) as session:
+        result = await session.execute(query)
+        order = result.one()
+    invalidate_seller(seller_id=values.get('seller_id'))
+    return order
 
+def _orders_with_details_query():
+    return (
+        select(
+            Order.id.label("order_id"),
+            Order.order_status,
+            Order.created_at,
+            Order.item_count,
+            Order.sum_of_item,
+            Order.every_month_should_pay,
+            Order.prepaid,
+            Order.total_paid,
+            Order.remaining_amount,
+            Client.full_name.label("client_name"),
+            Client.phone.label("client_phone"),
+            Client.passport_serial.label("client_passport"),
+            Client.latitude.label("client_latitude"),  # Added
+            Client.longitude.label("client_longitude"),  # Added
+            Seller.full_name.label("seller_name")
+        )
+        .select_from(
+            join(Order, Client, Order.client_id == Client.id)
+            .join(Seller, Order.seller_id == Seller.id)
+        )
+        .order_by(Order.created_at.desc())
+    )
 
-async def generate_orders_excel():
-    orders = await get_all_orders_with_details()
-    if not orders:
+@tag_queries
+async def get_all_orders_with_details(session: AsyncSession = None):
+    try:
+        async with session_scope(session) as session:
+            result = await session.execute(_orders_with_details_query())
+            return result.all()
+    except Exception as e:
         return None
-    
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Orders"
-    
-    headers = [
-        "Buyurtma ID", "Status", "Sana", "Mijoz", "Telefon",
-        "Passport", "Joylashuv", "Sotuvchi", "Mahsulot Soni",
-        "Umumiy Summa", "Oylik To'lov", "Oldindan To'lov","Ja'mi to'langan summa","Qoldiq"
-    ]
-    ws.append(headers)
-    
-    for order in orders:
-        ws.append([
-            order.order_id,
-            order.order_status,
-            order.created_at.strftime("%Y-%m-%d %H:%M"),
-            order.client_name,
-            order.client_phone,
-            order.client_passport,
-            f"https://maps.google.com/?q={order.client_latitude},{order.client_longitude}",  # Location format
-            order.seller_name,
-            order.item_count,
-            order.sum_of_item,
-            order.every_month_should_pay,
-            order.prepaid,
-            order.total_paid,
-            order.remaining_amount
-        ])
-    
-    # Header styling
-    for cell in ws[1]:
-        cell.font = cell.font.copy(bold=True)
-    
-    # Auto-adjust columns
-    for column in ws.columns:
-        max_length = max(
-            len(str(cell.value)) for cell in column
-        )
-        adjusted_width = (max_length + 2) * 1.2
-        ws.column_dimensions[column[0].column_letter].width = adjusted_width
-    
-    excel_buffer = BytesIO()
-    wb.save(excel_buffer)
-    excel_buffer.seek(0)
-    
-    return excel_buffer
+
+async def stream_all_orders_with_details(batch_size: int = 1000, session: AsyncSession = None):
+    """Yield the orders list in batches through a server-side cursor"""
+    with query_tag("stream_all_orders_with_details"):
+        async with session_scope(session) as session:
+            result = await session.stream(
+                _orders_with_details_query().execution_options(yield_per=batch_size)
+            )
+            async for batch in result.partitions():
+                yield batch
 
 
-async def get_all_sellers_with_details():
-    async with async_session() as session:
+ORDERS_EXCEL_HEADERS = [
+    "Buyurtma ID", "Status", "Sana", "Mijoz", "Telefon",
+    "Passport", "Joylashuv", "Sotuvchi", "Mahsulot Soni",
+    "Umumiy Summa", "Oylik To'lov", "Oldindan To'lov","Ja'mi to'langan summa","Qoldiq"
+]
+
+def _order_excel_row(order) -> list:
+    return [
+        order.order_id,
+        order.order_status,
+        order.created_at.strftime("%Y-%m-%d %H:%M"),
+        order.client_name,
+        order.client_phone,
+        order.client_passport,
+        f"https://maps.google.com/?q={order.client_latitude},{order.client_longitude}",  # Location format
+        order.seller_name,
+        order.item_count,
+        order.sum_of_item,
+        order.every_month_should_pay,
+        order.prepaid,
+        order.total_paid,
+        order.remaining_amount
+    ]
+
+async def generate_orders_excel(session: AsyncSession = None):
+    """
+    Stream the orders list into a write-only workbook batch by batch.
+    Returns a spooled temp file (caller closes it), or None if there are no
+    orders or the export failed (the error is logged).
+    """
+    # openpyxl is heavy to import: it is only loaded by the first export
+    from utilities.excel import StreamingExcelWriter
+    # One worker for the whole export: concurrent exports queue instead of
+    # interleaving their batches
+    async with report_pool.slot("orders export") as execute:
+        writer = StreamingExcelWriter("Orders", ORDERS_EXCEL_HEADERS)
         try:
+            # aclosing: on an error the stream's cursor and session close now, not at GC
+            async with aclosing(stream_all_orders_with_details(session=session)) as batches:
+                async for batch in batches:
+                    await execute(writer.append_rows, map(_order_excel_row, batch))
+            if not writer.row_count:
+                return None
+            return await execute(writer.close)
+        except Exception as e:
+            logger.error(f"Orders export failed: {e}", exc_info=True)
+            return None
+        finally:
+            writer.discard()
+
+
+@tag_queries
+async def get_all_sellers_with_details(session: AsyncSession = None):
+    try:
+        async with session_scope(session) as session:
             result = await session.execute(
                 select(
                     Seller.id.label("seller_id"),
@@ -178,82 +250,98 @@ async def get_all_sellers_with_details():
                 .order_by(Seller.full_name)
             )
             return result.all()
-        except Exception as e:
-            return None
+    except Exception as e:
+        return None
 
-async def generate_sellers_excel():
-    sellers = await get_all_sellers_with_details()
+async def generate_sellers_excel(session: AsyncSession = None):
+    sellers = await get_all_sellers_with_details(session=session)
     if not sellers:
         return None
-    
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Sellers"
-    
-    headers = [
-        "ID", "To'liq Ism", "Telefon", "Passport Seriya", 
-        "Ish Boshlagan Sana", "Sotgan Mahsulotlar Soni", "Maosh"
-    ]
-    ws.append(headers)
-    
-    for seller in sellers:
-        ws.append([
-            seller.seller_id,
-            seller.full_name,
-            seller.phone,
-            seller.passport_serial,
-            seller.started_job_at.strftime("%Y-%m-%d") if seller.started_job_at else "",
-            seller.order_counter,
-            seller.salary_of_seller
-        ])
-    
-    # Header styling
-    for cell in ws[1]:
-        cell.font = cell.font.copy(bold=True)
-    
-    # Auto-adjust columns
-    for column in ws.columns:
-        max_length = max(
-            len(str(cell.value)) for cell in column
+    from utilities.excel import build_sellers_workbook
+    return await report_pool.run(build_sellers_workbook, sellers)
+
+# Tables whose changes invalidate each exported report
+EXPORT_SOURCES = {
+    "orders": (Order, Client, Seller),
+    "sellers": (Seller,),
+    "consumptions": (Consumptions,),
+}
+
+@tag_queries
+async def get_export_watermark(report: str, session: AsyncSession = None) -> tuple:
+    """
+    Row count, max id and max updated_at of every table a report reads, in one
+    query. The report only needs rebuilding when this tuple changes.
+    """
+    columns = []
+    for model in EXPORT_SOURCES[report]:
+        columns.append(select(func.count()).select_from(model).scalar_subquery())
+        columns.append(select(func.max(model.id)).scalar_subquery())
+        if hasattr(model, 'updated_at'):
+            columns.append(select(func.max(model.updated_at)).scalar_subquery())
+    async with session_scope(session) as session:
+        result = await session.execute(select(*columns))
+        return tuple(result.one())
+
+@tag_queries
+async def add_monthly_payment(order_id: int, amount: int, session: AsyncSession = None):
+    """
+    Добавление платежа к заказу одним UPDATE ... RETURNING.
+    Closes the order when the balance reaches zero and returns the updated
+    row (id, sum_of_item, total_paid, remaining_amount, order_status), or None.
+    """
+    new_total_paid = func.coalesce(Order.total_paid, 0) + amount
+    previous = locked_previous(order_id)
+    async with session_scope(session) as session:
+        result = await session.execute(
+            update(Order)
+            .where(Order.id == previous.c.id)
+            .values(
+                total_paid=new_total_paid,
+                remaining_amount=func.greatest(Order.sum_of_item - new_total_paid, 0),
+                order_status=case(
+                    (Order.sum_of_item - new_total_paid <= 0, 'Yopilgan'),
+                    else_=Order.order_status
+                ),
+                # A paid-off order needs no more reminders
+                next_notification_at=case(
+                    (Order.sum_of_item - new_total_paid <= 0, null()),
+                    else_=Order.next_notification_at
+                )
+            )
+            .returning(
+                Order.id, Order.sum_of_item, Order.total_paid,
+                Order.remaining_amount, Order.order_status,
+                Order.created_at, Order.item_count, *previous_columns(previous)
+            )
         )
-        adjusted_width = (max_length + 2) * 1.2
-        ws.column_dimensions[column[0].column_letter].width = adjusted_width
-    
-    # Format date columns (column E)
-    for cell in ws['E'][1:]:  # Skip header row
-        cell.number_format = 'YYYY-MM-DD'
-    
-    # Format salary column (column G) as currency
-    for cell in ws['G'][1:]:  # Skip header row
-        cell.number_format = '#,##0.00'
-    
-    excel_buffer = BytesIO()
-    wb.save(excel_buffer)
-    excel_buffer.seek(0)
-    
-    return excel_buffer
+        order = result.one_or_none()
+        if order:
+            await apply_order_change(session, old=snapshot(order, "old_"), new=snapshot(order))
+        return order
 
-async def add_monthly_payment(order_id: int, amount: int):
-    """Добавление ежемесячного платежа к заказу"""
-    async with AsyncSessionLocal() as session:
-        try:
-            order = await session.get(Order, order_id)
-            if not order:
-                return False
-                
-            order.total_paid += amount
-            order.remaining_amount = max(0, order.sum_of_item - order.total_paid)
-            
-            await session.commit()
-            return True
-        except Exception as e:
-            await session.rollback()
-            raise e
+@tag_queries
+async def change_seller_order_counter(seller_id: int, delta: int, session: AsyncSession = None):
+    """
+    Atomically shift a seller's order counter (never below zero).
+    Returns the updated row (id, full_name, order_counter), or None.
+    """
+    async with session_scope(session) as session:
+        result = await session.execute(
+            update(Seller)
+            .where(Seller.id == seller_id)
+            .values(order_counter=func.greatest(Seller.order_counter + delta, 0))
+            .returning(Seller.id, Seller.full_name, Seller.order_counter)
+        )
+        seller = result.one_or_none()
+    invalidate_seller(seller_id=seller_id)
+    return seller
 
-async def update_order(order_id: int, update_data: dict):
+@tag_queries
+async def update_order(order_id: int, update_data: dict, session: AsyncSession = None):
     """Обновление данных заказа с полной проверкой полей"""
-    async with AsyncSessionLocal() as session:
-        try:
+    try:
+        async with session_scope(session, savepoint=True) as session:
             # Allowed fields - removed item_returned since it's now part of order_status
             allowed_fields = {
                 'item_count', 'sum_of_item', 'every_month_should_pay',
@@ -276,133 +364,187 @@ async def update_order(order_id: int, update_data: dict):
                     new_sum = db_update_data.get('sum_of_item', order.sum_of_item)
                     new_prepaid = db_update_data.get('prepaid', order.prepaid)
                     db_update_data['remaining_amount'] = max(0, new_sum - new_prepaid)
+                    # As in add_monthly_payment: a paid-off open order is closed
+                    # (which also stops its reminders below)
+                    if (db_update_data['remaining_amount'] <= 0 and order.order_status == 'Ochiq'
+                            and 'order_status' not in db_update_data):
+                        db_update_data['order_status'] = 'Yopilgan'
+
+            # Reminders stop when an order is closed/returned and resume if reopened
+            if 'order_status' in db_update_data:
+                db_update_data['next_notification_at'] = (
+                    Order.reminder_anchor() + REMINDER_INTERVAL
+                    if db_update_data['order_status'] == 'Ochiq' else None
+                )
             
-            await session.execute(
+            previous = locked_previous(order_id)
+            result = await session.execute(
                 update(Order)
-                .where(Order.id == order_id)
+                .where(Order.id == previous.c.id)
                 .values(**db_update_data)
+                .returning(*(getattr(Order, name) for name in ROLLUP_COLUMNS), *previous_columns(previous))
             )
-            await session.commit()
+            order = result.one_or_none()
+            if order:
+                await apply_order_change(session, old=snapshot(order, "old_"), new=snapshot(order))
             return True
-        except Exception as e:
-            await session.rollback()
-            raise Exception(f"Xatolik yuz berdi: {str(e)}")
+    except Exception as e:
+        raise Exception(f"Xatolik yuz berdi: {str(e)}")
 
-async def get_order_by_id_with_details(order_id: int):
-    async with async_session() as session:
+@tag_queries
+async def get_order_by_id_with_details(order_id: int, session: AsyncSession = None):
+    async with session_scope(session) as session:
         result = await session.execute(
             select(Order)
             .options(joinedload(Order.client))  # Eager load client
             .where(Order.id == order_id)
+            .execution_options(populate_existing=True)
         )
         return result.scalars().first()
 
-async def delete_order(order_id: int):
-    """Удаление заказа"""
-    async with AsyncSessionLocal() as session:
-        try:
-            order = await session.get(Order, order_id)
-            if not order:
-                return False
-                
-            await session.delete(order)
-            await session.commit()
-            return True
-        except Exception as e:
-            await session.rollback()
-            return False
+@tag_queries
+async def delete_order(order_id: int, session: AsyncSession = None):
+    """Удаление заказа; returns the deleted row (id, seller_id) or None"""
+    async with session_scope(session) as session:
+        result = await session.execute(
+            delete(Order)
+            .where(Order.id == order_id)
+            .returning(Order.id, Order.seller_id, *(getattr(Order, name) for name in ROLLUP_COLUMNS))
+        )
+        order = result.one_or_none()
+        if order:
+            await apply_order_change(session, old=snapshot(order))
+        return order
 
 
-async def update_seller(seller_id: int, update_data: dict):
+@tag_queries
+async def update_seller(seller_id: int, update_data: dict, session: AsyncSession = None):
     """Обновление данных продавца с преобразованием типов данных"""
-    async with async_session() as session:
-        try:
-            # Полный маппинг между именами полей
-            field_mapping = {
-                'full_name': 'full_name',
-                'name': 'full_name',
-                'phone': 'phone',
-                'passport': 'passport_serial',
-                'passport_serial': 'passport_serial',
-                'salary': 'salary_of_seller',
-                'salary_of_seller': 'salary_of_seller',
-                'date': 'started_job_at',
-                'start_date': 'started_job_at',
-                'started_job_at': 'started_job_at'
-            }
-            
-            # Проверяем и преобразуем данные
-            db_update_data = {}
-            
-            for field, value in update_data.items():
-                if field in field_mapping:
-                    db_field = field_mapping[field]
-                    
-                    # Специальная обработка для полей даты
-                    if db_field == 'started_job_at' and isinstance(value, str):
-                        try:
-                            db_update_data[db_field] = datetime.strptime(value, '%Y-%m-%d').date()
-                        except ValueError:
-                            raise ValueError("Noto'g'ri sana formati. To'g'ri format: YYYY-MM-DD")
-                    else:
-                        db_update_data[db_field] = value
-            
-            if not db_update_data:
-                raise ValueError("Yangilanish uchun hech qanday maydon kiritilmadi")
-            
-            await session.execute(
+    # Полный маппинг между именами полей
+    field_mapping = {
+        'full_name': 'full_name',
+        'name': 'full_name',
+        'phone': 'phone',
+        'passport': 'passport_serial',
+        'passport_serial': 'passport_serial',
+        'salary': 'salary_of_seller',
+        'salary_of_seller': 'salary_of_seller',
+        'date': 'started_job_at',
+        'start_date': 'started_job_at',
+        'started_job_at': 'started_job_at'
+    }
+    
+    try:
+        # Проверяем и преобразуем данные
+        db_update_data = {}
+        
+        for field, value in update_data.items():
+            if field in field_mapping:
+                db_field = field_mapping[field]
+                
+                # Специальная обработка для полей даты
+                if db_field == 'started_job_at' and isinstance(value, str):
+                    try:
+                        db_update_data[db_field] = datetime.strptime(value, '%Y-%m-%d').date()
+                    except ValueError:
+                        raise ValueError("Noto'g'ri sana formati. To'g'ri format: YYYY-MM-DD")
+                else:
+                    db_update_data[db_field] = value
+        
+        if not db_update_data:
+            raise ValueError("Yangilanish uchun hech qanday maydon kiritilmadi")
+        
+        # The passport from before the update comes back in RETURNING
+        previous = (
+            select(Seller.id, Seller.passport_serial)
+            .where(Seller.id == seller_id)
+            .with_for_update()
+            .subquery("previous")
+        )
+        async with session_scope(session, savepoint=True) as session:
+            result = await session.execute(
                 update(Seller)
-                .where(Seller.id == seller_id)
+                .where(Seller.id == previous.c.id)
                 .values(**db_update_data)
+                .returning(previous.c.passport_serial.label("old_passport"), Seller.passport_serial)
             )
-            await session.commit()
-            return True
-            
-        except ValueError as e:
-            await session.rollback()
-            raise ValueError(f"Ma'lumotlar formati noto'g'ri: {str(e)}")
-        except Exception as e:
-            await session.rollback()
-            raise Exception(f"Xatolik yuz berdi: {str(e)}")
-
-async def get_seller_by_id_or_passport(seller_id: int = None, passport_serial: str = None):
-    async with async_session() as session:
-        query = select(Seller)
-        if seller_id:
-            query = query.where(Seller.id == seller_id)
-        elif passport_serial:
-            query = query.where(Seller.passport_serial == passport_serial)
-        else:
-            return None
-            
+            passports = result.one_or_none()
+        invalidate_seller(seller_id=seller_id)
+        # A lookup of the new passport may have cached "no such seller"
+        for passport in passports or ():
+            if passport is not None:
+                invalidate_seller(passport_serial=passport)
+        invalidate_seller_listing()
+        return True
+        
+    except ValueError as e:
+        raise ValueError(f"Ma'lumotlar formati noto'g'ri: {str(e)}")
+    except Exception as e:
+        raise Exception(f"Xatolik yuz berdi: {str(e)}")
+
+@tag_queries
+async def get_seller_by_id_or_passport(seller_id: int = None, passport_serial: str = None, session: AsyncSession = None):
+    query = select(Seller)
+    if seller_id:
+        cache_key = ("id", seller_id)
+        query = query.where(Seller.id == seller_id)
+    elif passport_serial:
+        cache_key = ("passport", passport_serial)
+        query = query.where(Seller.passport_serial == passport_serial)
+    else:
+        return None
+
+    cached = seller_cache.get(cache_key)
+    if cached is not MISSING:
+        return cached
+    async with session_scope(session) as session:
+        result = await session.execute(query.execution_options(populate_existing=True))
+        seller = _cacheable(session, result.scalars().first())
+    seller_cache.set(cache_key, seller)
+    return seller
+
+@tag_queries
+async def get_seller_choices(name_prefix: str = None, session: AsyncSession = None):
+    """Only the columns the seller picker needs: (id, full_name, passport_serial)"""
+    query = (
+        select(Seller.id, Seller.full_name, Seller.passport_serial)
+        .order_by(Seller.full_name, Seller.id)
+    )
+    if name_prefix:
+        query = query.where(Seller.full_name.istartswith(name_prefix, autoescape=True))
+    async with session_scope(session) as session:
         result = await session.execute(query)
-        return result.scalars().first()
+        return result.all()
 
-async def delete_seller(seller_id: int):
-    async with async_session() as session:
-        try:
+@tag_queries
+async def delete_seller(seller_id: int, session: AsyncSession = None):
+    try:
+        async with session_scope(session, savepoint=True) as session:
             seller = await session.get(Seller, seller_id)
-            if seller:
-                await session.delete(seller)
-                await session.commit()
-                return True
-            return False
-        except Exception as e:
-            await session.rollback()
-            return False
+            if not seller:
+                return False
+            await session.delete(seller)
+    except Exception as e:
+        return False
+    invalidate_seller(seller_id=seller_id)
+    invalidate_seller_listing()
+    return True
 
-async def get_consumption_by_id(consumption_id: int):
+@tag_queries
+async def get_consumption_by_id(consumption_id: int, session: AsyncSession = None):
     """Get a single consumption record by ID"""
-    async with async_session() as session:
+    async with session_scope(session) as session:
         result = await session.execute(
             select(Consumptions)
             .where(Consumptions.id == consumption_id)
+            .execution_options(populate_existing=True)
         )
         return result.scalars().first()
 
-async def get_consumptions_by_owner(owner: str):
+@tag_queries
+async def get_consumptions_by_owner(owner: str, session: AsyncSession = None):
     """Get all consumptions for a specific owner"""
-    async with async_session() as session:
+    async with session_scope(session) as session:
         result = await session.execute(
             select(Consumptions)
             .where(Consumptions.consumption_owner == owner)
@@ -410,72 +552,71 @@ async def get_consumptions_by_owner(owner: str):
         )
         return result.scalars().all()
 
-async def create_consumption(owner: str, amount: float, description: str):
+@tag_queries
+async def create_consumption(owner: str, amount: float, description: str, session: AsyncSession = None):
     """Create a new consumption record"""
-    async with async_session() as session:
-        try:
+    try:
+        async with session_scope(session, savepoint=True) as session:
             consumption = Consumptions(
                 consumption_owner=owner,
                 amount=amount,
                 description=description
             )
             session.add(consumption)
-            await session.commit()
+            await session.flush()
             await session.refresh(consumption)
             return consumption
-        except Exception as e:
-            await session.rollback()
-            raise Exception(f"Error creating consumption: {str(e)}")
+    except Exception as e:
+        raise Exception(f"Error creating consumption: {str(e)}")
 
-async def update_consumption(consumption_id: int, update_data: dict):
+@tag_queries
+async def update_consumption(consumption_id: int, update_data: dict, session: AsyncSession = None):
     """Update consumption record with data validation"""
-    async with async_session() as session:
-        try:
-            # Field mapping with validation
-            valid_fields = {
-                'amount': (float, "Raqam bo'lishi kerak"),
-                'description': (str, "Matn bo'lishi kerak"),
-                'owner': ('consumption_owner', str, "Egasi nomi bo'lishi kerak")
-            }
-            
-            db_update_data = {}
-            
-            for field, value in update_data.items():
-                if field in valid_fields:
-                    if field == 'owner':
-                        db_field, field_type, error_msg = valid_fields[field]
-                        if not isinstance(value, field_type):
-                            raise ValueError(f"{field}: {error_msg}")
-                        db_update_data[db_field] = value
-                    else:
-                        field_type, error_msg = valid_fields[field]
-                        try:
-                            db_update_data[field] = field_type(value)
-                        except (ValueError, TypeError):
-                            raise ValueError(f"{field}: {error_msg}")
-            
-            if not db_update_data:
-                raise ValueError("Yangilanish uchun hech qanday maydon kiritilmadi")
-            
+    # Field mapping with validation
+    valid_fields = {
+        'amount': (float, "Raqam bo'lishi kerak"),
+        'description': (str, "Matn bo'lishi kerak"),
+        'owner': ('consumption_owner', str, "Egasi nomi bo'lishi kerak")
+    }
+    
+    try:
+        db_update_data = {}
+        
+        for field, value in update_data.items():
+            if field in valid_fields:
+                if field == 'owner':
+                    db_field, field_type, error_msg = valid_fields[field]
+                    if not isinstance(value, field_type):
+                        raise ValueError(f"{field}: {error_msg}")
+                    db_update_data[db_field] = value
+                else:
+                    field_type, error_msg = valid_fields[field]
+                    try:
+                        db_update_data[field] = field_type(value)
+                    except (ValueError, TypeError):
+                        raise ValueError(f"{field}: {error_msg}")
+        
+        if not db_update_data:
+            raise ValueError("Yangilanish uchun hech qanday maydon kiritilmadi")
+        
+        async with session_scope(session, savepoint=True) as session:
             await session.execute(
                 update(Consumptions)
                 .where(Consumptions.id == consumption_id)
                 .values(**db_update_data)
             )
-            await session.commit()
-            return True
-            
-        except ValueError as e:
-            await session.rollback()
-            raise ValueError(f"Validation error: {str(e)}")
-        except Exception as e:
-            await session.rollback()
-            raise Exception(f"Database error: {str(e)}")
+        return True
+        
+    except ValueError as e:
+        raise ValueError(f"Validation error: {str(e)}")
+    except Exception as e:
+        raise Exception(f"Database error: {str(e)}")
 
-async def get_all_consumptions():
+@tag_queries
+async def get_all_consumptions(session: AsyncSession = None):
     """Get all consumption records with details"""
-    async with async_session() as session:
-        try:
+    try:
+        async with session_scope(session) as session:
             result = await session.execute(
                 select(
                     Consumptions.id.label("consumption_id"),
@@ -487,60 +628,26 @@ async def get_all_consumptions():
                 .order_by(Consumptions.created_at.desc())
             )
             return result.all()
-        except Exception as e:
-            return None
+    except Exception as e:
+        return None
 
-async def generate_consumptions_excel(owner: str = None):
+async def generate_consumptions_excel(owner: str = None, session: AsyncSession = None):
     """Generate Excel report for consumptions (optionally filtered by owner)"""
     if owner:
-        consumptions = await get_consumptions_by_owner(owner)
+        consumptions = await get_consumptions_by_owner(owner, session=session)
     else:
-        consumptions = await get_all_consumptions()
+        consumptions = await get_all_consumptions(session=session)
     
     if not consumptions:
         return None
-    
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Consumptions"
-    
-    headers = [
-        "ID", "Egasi", "Summa", 
-        "Tavsifi", "Sana"
-    ]
-    ws.append(headers)
-    
-    for cons in consumptions:
-        ws.append([
-            cons.consumption_id if hasattr(cons, 'consumption_id') else cons.id,
-            cons.owner if hasattr(cons, 'owner') else cons.consumption_owner,
-            cons.amount,
-            cons.description,
-            cons.created_at.strftime("%Y-%m-%d %H:%M") if cons.created_at else ""
-        ])
-    
-    # Header styling
-    for cell in ws[1]:
-        cell.font = cell.font.copy(bold=True)
-    
-    # Auto-adjust columns
-    for column in ws.columns:
-        max_length = max(
-            len(str(cell.value)) for cell in column
-        )
-        adjusted_width = (max_length + 2) * 1.2
-        ws.column_dimensions[column[0].column_letter].width = adjusted_width
-    
-    excel_buffer = BytesIO()
-    wb.save(excel_buffer)
-    excel_buffer.seek(0)
-    
-    return excel_buffer
+    from utilities.excel import build_consumptions_workbook
+    return await report_pool.run(build_consumptions_workbook, consumptions)
 
-async def get_total_consumptions_by_owner():
+@tag_queries
+async def get_total_consumptions_by_owner(session: AsyncSession = None):
     """Get total consumption amounts grouped by owner"""
-    async with async_session() as session:
-        try:
+    try:
+        async with session_scope(session) as session:
             result = await session.execute(
                 select(
                     Consumptions.consumption_owner,
@@ -550,21 +657,20 @@ async def get_total_consumptions_by_owner():
                 .order_by(Consumptions.consumption_owner)
             )
             return result.all()
-        except Exception as e:
-            return None
+    except Exception as e:
+        return None
 
-async def delete_consumption(consumption_id: int):
+@tag_queries
+async def delete_consumption(consumption_id: int, session: AsyncSession = None):
     """Delete a consumption record by ID"""
-    async with async_session() as session:
-        try:
+    try:
+        async with session_scope(session, savepoint=True) as session:
             consumption = await session.get(Consumptions, consumption_id)
             
             if consumption:
                 await session.delete(consumption)
-                await session.commit()
                 return True
             return False  # Если расход не найден
             
-        except Exception as e:
-            await session.rollback()
-            return False  # Возвращаем False при ошибке
+    except Exception as e:
+        return False  # Возвращаем False при ошибке
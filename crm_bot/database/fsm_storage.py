@@ -0,0 +1,216 @@
+from aiogram import Bot
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from datetime import date, datetime
+from decimal import Decimal
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert
+from typing import Any, Dict, Optional, Tuple
+from config import Config
+from .instrumentation import tag_queries
+from .models import FsmRecord
+from .utils import session_scope
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# JSON has no datetime/date/Decimal: they are stored as tagged objects
+_TAG = "__fsm_type__"
+
+
+def encode_fsm_data(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {_TAG: "datetime", "value": value.isoformat()}
+    if isinstance(value, date):
+        return {_TAG: "date", "value": value.isoformat()}
+    if isinstance(value, Decimal):
+        return {_TAG: "decimal", "value": str(value)}
+    if isinstance(value, dict):
+        return {str(k): encode_fsm_data(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple, set)):
+        return [encode_fsm_data(v) for v in value]
+    return value
+
+
+def decode_fsm_data(value: Any) -> Any:
+    if isinstance(value, dict):
+        kind = value.get(_TAG)
+        if kind == "datetime":
+            return datetime.fromisoformat(value["value"])
+        if kind == "date":
+            return date.fromisoformat(value["value"])
+        if kind == "decimal":
+            return Decimal(value["value"])
+        return {k: decode_fsm_data(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [decode_fsm_data(v) for v in value]
+    return value
+
+
+def _state_name(state: StateType) -> Optional[str]:
+    return state.state if isinstance(state, State) else state
+
+
+def _row_key(key: StorageKey) -> Tuple[int, int, int, str]:
+    return key.bot_id, key.chat_id, key.user_id, key.destiny
+
+
+class PostgresStorage(BaseStorage):
+    """
+    FSM storage in the fsm_storage table (jsonb data keyed by bot/chat/user).
+    By default every write is upserted before it returns, so the update is
+    not finished (and acknowledged) until its state is stored and any
+    instance sees it. With ``flush_delay`` > 0 writes are buffered for that
+    long and written as one multi-row upsert; reads see buffered writes
+    first. Only safe with a single instance: other instances read stale
+    state, and a crash loses the writes of the last ``flush_delay`` seconds.
+    """
+
+    def __init__(self, flush_delay: float = Config.FSM_FLUSH_DELAY, max_buffer: int = Config.FSM_MAX_BUFFER):
+        self.flush_delay = flush_delay
+        self.max_buffer = max_buffer
+        # row key -> {"state": ..., "data": ...} (only the fields written)
+        self._pending: Dict[Tuple, Dict[str, Any]] = {}
+        self._flushing: Dict[Tuple, Dict[str, Any]] = {}
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._flush_lock = asyncio.Lock()
+        self._flush_tasks: set = set()
+        self.writes = 0
+        self.flushes = 0
+
+    def _buffered(self, row_key: Tuple, field: str):
+        for buffer in (self._pending, self._flushing):
+            entry = buffer.get(row_key)
+            if entry is not None and field in entry:
+                return True, entry[field]
+        return False, None
+
+    async def _write(self, key: StorageKey, field: str, value: Any) -> None:
+        self.writes += 1
+        if self.flush_delay <= 0:
+            await self._write_through({_row_key(key): {field: value}})
+            return
+        self._pending.setdefault(_row_key(key), {})[field] = value
+        if len(self._pending) >= self.max_buffer:
+            self._schedule_flush(0)
+        elif self._flush_handle is None:
+            self._schedule_flush(self.flush_delay)
+
+    def _schedule_flush(self, delay: float) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+        loop = asyncio.get_running_loop()
+        self._flush_handle = loop.call_later(delay, self._start_flush)
+
+    def _start_flush(self) -> None:
+        self._flush_handle = None
+        task = asyncio.create_task(self.flush())
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+
+    @tag_queries
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            self._flushing, self._pending = self._pending, {}
+            try:
+                await self._upsert(self._flushing)
+                self.flushes += 1
+            except Exception as e:
+                logger.error(f"FSM storage flush failed, {len(self._flushing)} keys kept for retry: {e}")
+                # Newer writes win over the ones that failed
+                for row_key, entry in self._flushing.items():
+                    self._pending[row_key] = {**entry, **self._pending.get(row_key, {})}
+                self._schedule_flush(max(self.flush_delay, 1))
+            finally:
+                self._flushing = {}
+
+    @tag_queries
+    async def _write_through(self, entries: Dict[Tuple, Dict[str, Any]]) -> None:
+        await self._upsert(entries)
+        self.flushes += 1
+
+    async def _upsert(self, entries: Dict[Tuple, Dict[str, Any]]) -> None:
+        # Group by written fields so an upsert only overwrites what was set
+        groups: Dict[Tuple[str, ...], list] = {}
+        for (bot_id, chat_id, user_id, destiny), entry in entries.items():
+            row = {"bot_id": bot_id, "chat_id": chat_id, "user_id": user_id, "destiny": destiny}
+            if "state" in entry:
+                row["state"] = entry["state"]
+            if "data" in entry:
+                row["data"] = encode_fsm_data(entry["data"])
+            groups.setdefault(tuple(sorted(entry)), []).append(row)
+
+        async with session_scope() as session:
+            for fields, rows in groups.items():
+                stmt = insert(FsmRecord).values(rows)
+                await session.execute(
+                    stmt.on_conflict_do_update(
+                        index_elements=[FsmRecord.bot_id, FsmRecord.chat_id, FsmRecord.user_id, FsmRecord.destiny],
+                        set_={**{field: getattr(stmt.excluded, field) for field in fields}, "updated_at": func.now()}
+                    )
+                )
+
+    @tag_queries
+    async def _read(self, key: StorageKey, column):
+        bot_id, chat_id, user_id, destiny = _row_key(key)
+        async with session_scope() as session:
+            result = await session.execute(
+                select(column).where(
+                    FsmRecord.bot_id == bot_id,
+                    FsmRecord.chat_id == chat_id,
+                    FsmRecord.user_id == user_id,
+                    FsmRecord.destiny == destiny
+                )
+            )
+            return result.scalar_one_or_none()
+
+    async def set_state(self, bot: Bot, key: StorageKey, state: StateType = None) -> None:
+        await self._write(key, "state", _state_name(state))
+
+    async def get_state(self, bot: Bot, key: StorageKey) -> Optional[str]:
+        found, state = self._buffered(_row_key(key), "state")
+        if found:
+            return state
+        return await self._read(key, FsmRecord.state)
+
+    async def set_data(self, bot: Bot, key: StorageKey, data: Dict[str, Any]) -> None:
+        await self._write(key, "data", dict(data))
+
+    async def get_data(self, bot: Bot, key: StorageKey) -> Dict[str, Any]:
+        found, data = self._buffered(_row_key(key), "data")
+        if found:
+            return dict(data)
+        data = await self._read(key, FsmRecord.data)
+        return decode_fsm_data(data) if data else {}
+
+    async def close(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        await self.flush()
+
+
+def create_fsm_storage() -> BaseStorage:
+    """Storage chosen by FSM_STORAGE: postgres (default), redis or memory"""
+    backend = Config.FSM_STORAGE
+    if backend == "memory":
+        return MemoryStorage()
+    if backend == "redis":
+        # Optional dependency: only needed when this backend is selected
+        from aiogram.fsm.storage.redis import RedisStorage
+
+        class CodecRedisStorage(RedisStorage):
+            async def set_data(self, bot: Bot, key: StorageKey, data: Dict[str, Any]) -> None:
+                await super().set_data(bot, key, encode_fsm_data(data))
+
+            async def get_data(self, bot: Bot, key: StorageKey) -> Dict[str, Any]:
+                return decode_fsm_data(await super().get_data(bot, key))
+
+        return CodecRedisStorage.from_url(Config.FSM_REDIS_URL)
+    if backend != "postgres":
+        logger.warning(f"Unknown FSM_STORAGE {backend!r}, using postgres")
+    return PostgresStorage()
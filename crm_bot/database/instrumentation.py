@@ -0,0 +1,133 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from typing import Any, Dict, Optional
+import bisect
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+slow_query_logger = logging.getLogger("crm_bot.slow_sql")
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open-ended
+LATENCY_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+_query_tag: ContextVar[str] = ContextVar("query_tag", default="untagged")
+
+
+class QueryStats:
+    """Latency histogram of the statements issued under one tag"""
+
+    __slots__ = ("count", "total_ms", "max_ms", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def observe(self, elapsed_ms: float) -> None:
+        self.count += 1
+        self.total_ms += elapsed_ms
+        if elapsed_ms > self.max_ms:
+            self.max_ms = elapsed_ms
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS_MS, elapsed_ms)] += 1
+
+    def as_dict(self) -> Dict[str, Any]:
+        labels = [f"<={bound}ms" for bound in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}ms"]
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "max_ms": round(self.max_ms, 3),
+            "histogram": {label: n for label, n in zip(labels, self.buckets) if n},
+        }
+
+
+_stats: Dict[str, QueryStats] = {}
+_slow_threshold_ms: float = 0.0
+
+
+def tag_queries(func):
+    """Tag every statement issued inside the wrapped coroutine with its name"""
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        token = _query_tag.set(func.__name__)
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            _query_tag.reset(token)
+    return wrapper
+
+
+@contextmanager
+def query_tag(name: str):
+    """Tag statements issued inside the block (for code that is not a crud function)"""
+    token = _query_tag.set(name)
+    try:
+        yield
+    finally:
+        _query_tag.reset(token)
+
+
+def params_shape(parameters: Any, executemany: bool = False) -> Any:
+    """Describe bound parameters by type only, so values never reach the logs"""
+    if executemany and isinstance(parameters, (list, tuple)):
+        first = params_shape(parameters[0]) if parameters else None
+        return f"{len(parameters)} x {first}"
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [type(value).__name__ for value in parameters]
+    return type(parameters).__name__
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("query_start_time")
+    if not starts:
+        return
+    elapsed_ms = (time.perf_counter() - starts.pop()) * 1000
+    tag = _query_tag.get()
+    stats = _stats.get(tag)
+    if stats is None:
+        stats = _stats[tag] = QueryStats()
+    stats.observe(elapsed_ms)
+
+    if _slow_threshold_ms and elapsed_ms >= _slow_threshold_ms:
+        slow_query_logger.warning(
+            "Slow query %.1fms in %s: %s | params: %s",
+            elapsed_ms, tag, " ".join(statement.split())[:500],
+            params_shape(parameters, executemany)
+        )
+
+
+def _handle_error(exception_context):
+    starts = exception_context.connection.info.get("query_start_time") if exception_context.connection else None
+    if starts:
+        starts.pop()
+
+
+def install(sync_engine: Engine, slow_threshold_ms: float) -> None:
+    """Attach the timing hooks to the engine's cursor execution"""
+    global _slow_threshold_ms
+    _slow_threshold_ms = slow_threshold_ms
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _handle_error)
+
+
+def get_query_stats(tag: Optional[str] = None) -> Dict[str, Any]:
+    """Per-tag latency histograms, slowest average first"""
+    if tag is not None:
+        return _stats[tag].as_dict() if tag in _stats else {}
+    ordered = sorted(_stats.items(), key=lambda item: item[1].total_ms / item[1].count, reverse=True)
+    return {name: stats.as_dict() for name, stats in ordered}
+
+
+def reset_query_stats() -> None:
+    _stats.clear()
@@ -0,0 +1,125 @@
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+from typing import Callable, Coroutine, Dict, List, Optional
+from datetime import datetime
+from config import Config
+from .utils import get_engine
+import asyncio
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+LOCK_HELD_SQL = text(
+    "SELECT EXISTS (SELECT 1 FROM pg_locks WHERE locktype = 'advisory' AND granted "
+    "AND pid = pg_backend_pid() AND ((classid::bigint << 32) | objid::bigint) = :lock_id)"
+)
+
+
+def lock_id_for(name: str) -> int:
+    """Stable positive 63-bit advisory lock key for a name"""
+    return int.from_bytes(hashlib.sha1(name.encode()).digest()[:8], "big") & 0x7FFFFFFFFFFFFFFF
+
+
+class LeaderElector:
+    """
+    Only one bot instance runs the scheduled jobs: the one holding a session
+    level Postgres advisory lock on a dedicated connection. The leader
+    heartbeats on that connection and steps down (cancelling its tasks) as
+    soon as it cannot confirm the lock; standbys retry every ``retry``
+    seconds. If the leader dies, Postgres frees the lock with its session:
+    keepalives and idle_session_timeout on the connection bound how long a
+    dead or hung leader can keep it.
+    """
+
+    def __init__(
+        self,
+        name: str = Config.LEADER_LOCK_NAME,
+        heartbeat: float = Config.LEADER_HEARTBEAT,
+        retry: float = Config.LEADER_RETRY
+    ):
+        self.name = name
+        self.lock_id = lock_id_for(name)
+        self.heartbeat = heartbeat
+        self.retry = retry
+        self.is_leader = False
+        self.leader_since: Optional[datetime] = None
+        self.last_heartbeat: Optional[datetime] = None
+        self.terms = 0
+
+    async def _tune(self, conn: AsyncConnection) -> None:
+        dead_after = max(int(self.heartbeat * 3), 5)
+        settings = {
+            "tcp_keepalives_idle": str(dead_after),
+            "tcp_keepalives_interval": str(max(dead_after // 3, 1)),
+            "tcp_keepalives_count": "3",
+            # PostgreSQL 14+: a leader that stops heartbeating loses its session
+            "idle_session_timeout": f"{dead_after}s",
+        }
+        for setting, value in settings.items():
+            try:
+                await conn.execute(text("SELECT set_config(:name, :value, false)"), {"name": setting, "value": value})
+            except Exception as e:
+                logger.debug(f"Leader connection: {setting} not set ({e})")
+
+    async def _lead(self, conn: AsyncConnection, leader_tasks: Callable[[], List[Coroutine]]) -> None:
+        self.is_leader = True
+        self.terms += 1
+        self.leader_since = datetime.now()
+        logger.info(f"Became leader for {self.name!r}")
+        tasks = [asyncio.create_task(coro) for coro in leader_tasks()]
+        try:
+            while True:
+                await asyncio.sleep(self.heartbeat)
+                for task in tasks:
+                    if task.done():
+                        raise RuntimeError(f"leader task {task.get_name()} stopped: {task.exception() if not task.cancelled() else 'cancelled'}")
+                held = await asyncio.wait_for(
+                    conn.scalar(LOCK_HELD_SQL, {"lock_id": self.lock_id}),
+                    timeout=self.heartbeat
+                )
+                if not held:
+                    raise RuntimeError("advisory lock is no longer held")
+                self.last_heartbeat = datetime.now()
+        finally:
+            self.is_leader = False
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            logger.warning(f"Stepped down as leader for {self.name!r}")
+
+    async def run(self, leader_tasks: Callable[[], List[Coroutine]]) -> None:
+        """Contend for leadership forever; run ``leader_tasks()`` while leading"""
+        while True:
+            conn = None
+            try:
+                conn = await get_engine().connect()
+                conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+                await self._tune(conn)
+                while not await conn.scalar(text("SELECT pg_try_advisory_lock(:lock_id)"), {"lock_id": self.lock_id}):
+                    self.last_heartbeat = datetime.now()
+                    await asyncio.sleep(self.retry)
+                await self._lead(conn, leader_tasks)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Leader election for {self.name!r}: {str(e)}")
+            finally:
+                if conn is not None:
+                    # Closing the DB connection releases the lock and the session
+                    # settings, so it must not go back to the pool
+                    try:
+                        await conn.invalidate()
+                        await conn.close()
+                    except Exception:
+                        pass
+            await asyncio.sleep(self.retry)
+
+    def status(self) -> Dict:
+        return {
+            "name": self.name,
+            "is_leader": self.is_leader,
+            "leader_since": self.leader_since,
+            "last_heartbeat": self.last_heartbeat,
+            "terms": self.terms,
+        }
@@ -3,13 +3,17 @@ from sqlalchemy import (
                     Date ,DateTime, TIMESTAMP, 
                     ForeignKey, Identity, Boolean, 
                     CheckConstraint, Index, Float,
-                    Numeric
+                    Numeric, BigInteger
                     )
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import validates, relationship   
 from sqlalchemy.ext.declarative import declarative_base
-from datetime import datetime
+from datetime import datetime, timedelta
 from sqlalchemy.sql import func
 
+# Open orders get a channel reminder this long after creation / the last one
+REMINDER_INTERVAL = timedelta(days=30)
+
 Base = declarative_base()
 
 class Client(Base):
@@ -32,6 +36,10 @@ class Seller(Base):
     salary_of_seller = Column(Integer)
     started_job_at = Column(Date)
     order_counter = Column(Integer, default=0, nullable=False)
+    # clock_timestamp(), not now(): now() is the transaction start, so a long
+    # transaction committing late could leave max(updated_at) (the export
+    # watermark) unchanged
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.clock_timestamp())
     orders = relationship("Order", backref="seller")
 
     @validates('started_job_at')
@@ -56,13 +64,20 @@ class Order(Base):
     remaining_amount = Column(Integer)
     last_notification_sent = Column(DateTime, nullable=True)
     notification_count = Column(Integer, default=0)
+    # When the next reminder is due; NULL once the order is closed or returned
+    next_notification_at = Column(DateTime, nullable=True)
     created_at = Column(DateTime)
     order_status = Column(String(10), default='Ochiq')
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.clock_timestamp())
     client = relationship("Client", backref="orders")
     
     __table_args__ = (
         Index('ix_orders_created_at', 'created_at'),
         Index('ix_orders_notification_status', 'last_notification_sent'),
+        Index(
+            'ix_orders_next_notification_at', 'next_notification_at',
+            postgresql_where=(order_status == 'Ochiq')
+        ),
         CheckConstraint(
             "order_status IN ('Yopilgan', 'Ochiq', 'Qaytarilgan')",
             name='check_order_status'
@@ -73,11 +88,34 @@ class Order(Base):
         super().__init__(*args, **kwargs)
         self.update_remaining_amount()
 
+    @staticmethod
+    def opening_balance(sum_of_item, prepaid) -> dict:
+        """total_paid / remaining_amount (and closed status) for a new order"""
+        total_paid = prepaid or 0
+        remaining_amount = max(0, (sum_of_item or 0) - total_paid)
+        balance = {'total_paid': total_paid, 'remaining_amount': remaining_amount}
+        if remaining_amount <= 0:
+            balance['order_status'] = 'Yopilgan'
+        return balance
+
+    @staticmethod
+    def next_notification(order_status, anchor):
+        """Due time of the next reminder, counted from ``anchor``; open orders only"""
+        if order_status != 'Ochiq' or anchor is None:
+            return None
+        return anchor + REMINDER_INTERVAL
+
+    @classmethod
+    def reminder_anchor(cls):
+        """SQL: the later of creation and the last reminder"""
+        return func.greatest(cls.created_at, cls.last_notification_sent)
+
     def update_remaining_amount(self):
-        self.total_paid = (self.prepaid or 0)
-        self.remaining_amount = max(0, (self.sum_of_item or 0) - self.total_paid)
-        if self.remaining_amount <= 0:
-            self.order_status = 'Yopilgan'
+        for field, value in self.opening_balance(self.sum_of_item, self.prepaid).items():
+            setattr(self, field, value)
+        self.next_notification_at = self.next_notification(
+            self.order_status or 'Ochiq', self.created_at
+        )
 
 class Consumptions(Base):
     __tablename__ = 'consumptions'
@@ -87,10 +125,85 @@ class Consumptions(Base):
     amount = Column(Numeric(10, 2))  # Сумма расхода
     description = Column(String(255))  # Описание расхода
     created_at = Column(DateTime, default=func.now())
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.clock_timestamp())
 
     __table_args__ = (
         CheckConstraint(
             "consumption_owner IN ('Maxmudho'ja', 'Abdulbosit', 'Bekzod', 'Og'abek', 'Hodimlar')",
             name='check_consumption_owner'
         ),
-    )
\ No newline at end of file
+    )
+
+class MonthlyOrderRollup(Base):
+    """Totals of the orders created in a month, kept current as orders change"""
+    __tablename__ = 'monthly_order_rollup'
+
+    month = Column(Date, primary_key=True)  # first day of the month
+    order_count = Column(Integer, nullable=False, default=0)
+    item_count = Column(BigInteger, nullable=False, default=0)
+    sum_of_item = Column(BigInteger, nullable=False, default=0)
+    total_paid = Column(BigInteger, nullable=False, default=0)
+    remaining_amount = Column(BigInteger, nullable=False, default=0)
+    open_count = Column(Integer, nullable=False, default=0)
+    closed_count = Column(Integer, nullable=False, default=0)
+    returned_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.clock_timestamp())
+
+class ScheduledJob(Base):
+    """Last/next run of each scheduler job; lets missed runs be caught up"""
+    __tablename__ = 'scheduled_jobs'
+
+    name = Column(String(50), primary_key=True)
+    last_run_at = Column(DateTime(timezone=True))  # last successful run
+    last_attempt_at = Column(DateTime(timezone=True))  # last run, whatever its status
+    next_run_at = Column(DateTime(timezone=True))
+    last_status = Column(String(10))
+    last_duration = Column(Float)  # seconds
+
+class NotificationOutbox(Base):
+    """Channel posts waiting to be delivered; one row per order reminder or report"""
+    __tablename__ = 'notification_outbox'
+
+    id = Column(Integer, Identity(), primary_key=True)
+    kind = Column(String(20), nullable=False)  # 'reminder' / 'report'
+    # e.g. reminder:<order_id>:<due date>, report:<YYYY-MM>; enqueueing twice is a no-op
+    dedup_key = Column(String(100), nullable=False, unique=True)
+    chat_id = Column(String(50), nullable=False)
+    payload = Column(JSONB, nullable=False)
+    status = Column(String(10), nullable=False, default='pending')
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, server_default=func.now())
+    last_error = Column(String(500))
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+    delivered_at = Column(DateTime)
+
+    __table_args__ = (
+        Index(
+            'ix_notification_outbox_pending', 'next_attempt_at',
+            postgresql_where=(status == 'pending')
+        ),
+        CheckConstraint(
+            "status IN ('pending', 'delivered', 'failed')",
+            name='check_outbox_status'
+        ),
+    )
+
+class FsmRecord(Base):
+    """Conversation state and data of one chat/user (aiogram FSM storage)"""
+    __tablename__ = 'fsm_storage'
+
+    bot_id = Column(BigInteger, primary_key=True)
+    chat_id = Column(BigInteger, primary_key=True)
+    user_id = Column(BigInteger, primary_key=True)
+    destiny = Column(String(50), primary_key=True, default='default')
+    state = Column(String(100))
+    data = Column(JSONB, nullable=False, default=dict)
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+class SchemaVersion(Base):
+    """Fingerprint of the schema the database was last brought up to"""
+    __tablename__ = 'schema_version'
+
+    id = Column(Integer, primary_key=True, default=1)  # single row
+    version = Column(String(64), nullable=False)
+    applied_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
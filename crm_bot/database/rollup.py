@@ -0,0 +1,150 @@
+"""
+Per-month order totals (monthly_order_rollup), maintained incrementally:
+every statement that creates, pays, edits or deletes an order also returns
+the order's before/after values, and ``apply_order_change`` folds the
+difference into the month the order was created in, in the same transaction.
+
+Backfill or rebuild from the orders table with:  python -m database.rollup
+"""
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import date
+from typing import Dict, List, Optional
+from sqlalchemy import Date, cast, delete, func, select, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from database.instrumentation import tag_queries
+from database.models import MonthlyOrderRollup, Order
+from database.utils import session_scope
+
+# Order columns that feed the rollup
+ROLLUP_COLUMNS = ('created_at', 'item_count', 'sum_of_item', 'total_paid', 'remaining_amount', 'order_status')
+STATUS_COUNTERS = {'Ochiq': 'open_count', 'Yopilgan': 'closed_count', 'Qaytarilgan': 'returned_count'}
+COUNTERS = ('order_count', 'item_count', 'sum_of_item', 'total_paid', 'remaining_amount') + tuple(STATUS_COUNTERS.values())
+
+
+def locked_previous(order_id: int):
+    """Subquery with the order's current values, row-locked; join it into an
+    UPDATE ... FROM to get the values from before the update in RETURNING"""
+    return (
+        select(Order.id, *(getattr(Order, name) for name in ROLLUP_COLUMNS))
+        .where(Order.id == order_id)
+        .with_for_update()
+        .subquery("previous")
+    )
+
+def previous_columns(previous) -> list:
+    return [previous.c[name].label(f"old_{name}") for name in ROLLUP_COLUMNS]
+
+def snapshot(row, prefix: str = "") -> dict:
+    return {name: getattr(row, prefix + name) for name in ROLLUP_COLUMNS}
+
+def _contribution(order: dict):
+    if not order or order.get('created_at') is None:
+        return None, {}
+    counters = {
+        'order_count': 1,
+        'item_count': order.get('item_count') or 0,
+        'sum_of_item': order.get('sum_of_item') or 0,
+        'total_paid': order.get('total_paid') or 0,
+        'remaining_amount': order.get('remaining_amount') or 0,
+    }
+    status_counter = STATUS_COUNTERS.get(order.get('order_status'))
+    if status_counter:
+        counters[status_counter] = 1
+    return order['created_at'].date().replace(day=1), counters
+
+@tag_queries
+async def apply_order_change(session: AsyncSession, old: Optional[dict] = None, new: Optional[dict] = None) -> None:
+    """Move an order's contribution from ``old`` to ``new`` values (None = absent)"""
+    deltas: Dict[date, Dict[str, int]] = defaultdict(lambda: dict.fromkeys(COUNTERS, 0))
+    for sign, order in ((-1, old), (1, new)):
+        month, counters = _contribution(order)
+        for name, value in counters.items():
+            deltas[month][name] += sign * value
+
+    for month, counters in deltas.items():
+        if month is None or not any(counters.values()):
+            continue
+        await session.execute(_add_to_months(insert(MonthlyOrderRollup).values(month=month, **counters)))
+
+def _add_to_months(stmt):
+    """Upsert that adds the inserted counters to the month's existing row"""
+    return stmt.on_conflict_do_update(
+        index_elements=[MonthlyOrderRollup.month],
+        set_={
+            **{name: getattr(MonthlyOrderRollup, name) + getattr(stmt.excluded, name) for name in COUNTERS},
+            'updated_at': func.clock_timestamp(),
+        }
+    )
+
+def _month_totals(orders):
+    """month + COUNTERS of the rows of ``orders`` (a table or CTE with ROLLUP_COLUMNS)"""
+    month = cast(func.date_trunc('month', orders.c.created_at), Date)
+    return (
+        select(
+            month,
+            func.count(),
+            func.coalesce(func.sum(orders.c.item_count), 0),
+            func.coalesce(func.sum(orders.c.sum_of_item), 0),
+            func.coalesce(func.sum(orders.c.total_paid), 0),
+            func.coalesce(func.sum(orders.c.remaining_amount), 0),
+            *(func.count().filter(orders.c.order_status == status) for status in STATUS_COUNTERS)
+        )
+        .where(orders.c.created_at.isnot(None))
+        .group_by(month)
+    )
+
+def added_orders_cte(new_orders, name: str = "rollup_added"):
+    """
+    Data-modifying CTE adding the orders returned by ``new_orders`` (an
+    INSERT ... RETURNING CTE with ROLLUP_COLUMNS) to their months, so an
+    order and its rollup are written by one statement. Attach it to the
+    statement with ``add_cte``.
+    """
+    stmt = insert(MonthlyOrderRollup).from_select(['month', *COUNTERS], _month_totals(new_orders))
+    return _add_to_months(stmt).returning(MonthlyOrderRollup.month).cte(name)
+
+@tag_queries
+async def get_month_rollup(month: date, session: AsyncSession = None):
+    async with session_scope(session) as session:
+        return await session.get(MonthlyOrderRollup, month.replace(day=1))
+
+@tag_queries
+async def get_rollup_months(limit: int = 12, session: AsyncSession = None) -> List[date]:
+    """Most recent months that have orders, newest first"""
+    async with session_scope(session) as session:
+        result = await session.execute(
+            select(MonthlyOrderRollup.month)
+            .where(MonthlyOrderRollup.order_count > 0)
+            .order_by(MonthlyOrderRollup.month.desc())
+            .limit(limit)
+        )
+        return list(result.scalars().all())
+
+@tag_queries
+async def backfill_rollup(session: AsyncSession = None) -> int:
+    """Rebuild every month from the orders table; returns the number of months"""
+    async with session_scope(session) as session:
+        # Writers queue behind the lock and apply their deltas on the rebuilt rows
+        await session.execute(text("LOCK TABLE monthly_order_rollup IN EXCLUSIVE MODE"))
+        await session.execute(delete(MonthlyOrderRollup))
+        result = await session.execute(
+            insert(MonthlyOrderRollup).from_select(['month', *COUNTERS], _month_totals(Order.__table__))
+        )
+        return result.rowcount
+
+
+if __name__ == "__main__":
+    from database.database import init_db
+    from database.utils import dispose_engine
+
+    async def _main():
+        logging.basicConfig(level=logging.INFO)
+        await init_db()
+        months = await backfill_rollup()
+        logging.info(f"Monthly rollup rebuilt: {months} months")
+        await dispose_engine()
+
+    asyncio.run(_main())
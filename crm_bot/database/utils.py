@@ -1,24 +1,163 @@
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, AsyncEngine
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from typing import Optional
+from contextlib import asynccontextmanager
 from config import Config
+from . import instrumentation
+from .cache import get_cache_stats
+from utilities.workers import report_pool
 import asyncio
+import logging
+import time
 
-async def create_db_engine():
-    try:
-        engine = create_async_engine(
-            Config.DATABASE_URL,
-            echo=True,
-            pool_pre_ping=True,  # Проверяет соединения перед использованием
-            pool_recycle=3600     # Пересоздает соединения каждый час
+logger = logging.getLogger(__name__)
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Queue pool that records how long callers wait for a connection checkout"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkout_count = 0
+        self.checkout_wait_total = 0.0
+        self.checkout_wait_max = 0.0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - started
+            self.checkout_count += 1
+            self.checkout_wait_total += waited
+            if waited > self.checkout_wait_max:
+                self.checkout_wait_max = waited
+
+
+_engine: Optional[AsyncEngine] = None
+_session_factory: Optional[sessionmaker] = None
+
+
+def create_db_engine() -> AsyncEngine:
+    connect_args = {}
+    if Config.DB_STATEMENT_TIMEOUT_MS > 0:
+        connect_args["server_settings"] = {
+            "statement_timeout": str(Config.DB_STATEMENT_TIMEOUT_MS)
+        }
+    engine = create_async_engine(
+        Config.DATABASE_URL,
+        echo=Config.DB_ECHO,
+        poolclass=TimedQueuePool,
+        pool_size=Config.DB_POOL_SIZE,
+        max_overflow=Config.DB_MAX_OVERFLOW,
+        pool_timeout=Config.DB_POOL_TIMEOUT,
+        pool_pre_ping=True,  # Проверяет соединения перед использованием
+        pool_recycle=Config.DB_POOL_RECYCLE,  # Пересоздает соединения каждый час
+        connect_args=connect_args,
+    )
+    if Config.SQL_INSTRUMENTATION:
+        instrumentation.install(engine.sync_engine, Config.SLOW_QUERY_MS)
+    return engine
+
+
+def get_engine() -> AsyncEngine:
+    """Return the shared engine, creating it on first use inside the running loop"""
+    global _engine
+    if _engine is None:
+        _engine = create_db_engine()
+        logger.info(
+            "DB pool created: size=%s max_overflow=%s timeout=%ss statement_timeout=%sms",
+            Config.DB_POOL_SIZE, Config.DB_MAX_OVERFLOW,
+            Config.DB_POOL_TIMEOUT, Config.DB_STATEMENT_TIMEOUT_MS
+        )
+    return _engine
+
+
+def async_session() -> AsyncSession:
+    """Open a new session bound to the shared engine"""
+    global _session_factory
+    if _session_factory is None:
+        _session_factory = sessionmaker(
+            bind=get_engine(),
+            class_=AsyncSession,
+            expire_on_commit=False
         )
-        return engine
-    except SQLAlchemyError as e:
-        raise
-
-engine = asyncio.run(create_db_engine())
-async_session = sessionmaker(
-    bind=engine,
-    class_=AsyncSession,
-    expire_on_commit=False
-)
\ No newline at end of file
+    return _session_factory()
+
+
+def get_pool_stats() -> dict:
+    """Snapshot of pool usage: in-use/idle connections and checkout wait times"""
+    if _engine is None:
+        return {}
+    pool = _engine.sync_engine.pool
+    stats = {
+        "size": pool.size(),
+        "in_use": pool.checkedout(),
+        "idle": pool.checkedin(),
+        "overflow": pool.overflow(),
+    }
+    if isinstance(pool, TimedQueuePool):
+        count = pool.checkout_count
+        stats.update(
+            checkouts=count,
+            wait_avg_ms=round(pool.checkout_wait_total / count * 1000, 3) if count else 0.0,
+            wait_max_ms=round(pool.checkout_wait_max * 1000, 3),
+        )
+    return stats
+
+
+async def connect_db() -> None:
+    """Open the first pooled connection, so startup fails fast if the DB is unreachable"""
+    async with get_engine().connect() as conn:
+        await conn.execute(text("SELECT 1"))
+
+
+async def dispose_engine() -> None:
+    global _engine, _session_factory
+    if _engine is not None:
+        await _engine.dispose()
+    _engine = None
+    _session_factory = None
+
+
+async def log_db_stats(interval: float) -> None:
+    """Periodically log pool usage, per-function SQL latency, cache hit rates and report workers"""
+    while True:
+        await asyncio.sleep(interval)
+        stats = get_pool_stats()
+        if stats:
+            logger.info("DB pool stats: %s", stats)
+        query_stats = instrumentation.get_query_stats()
+        if query_stats:
+            logger.info("SQL latency by function: %s", query_stats)
+        logger.info("Lookup cache stats: %s", get_cache_stats())
+        logger.info("Report worker stats: %s", report_pool.stats())
+
+
+@asynccontextmanager
+async def session_scope(session: Optional[AsyncSession] = None, savepoint: bool = False):
+    """
+    Reuse the update's session when one is passed in, otherwise open a private one.
+    A private session is committed on exit; a shared one is only flushed and
+    committed once by DbSessionMiddleware at the end of the update, and errors
+    propagate. Callers that catch their own errors and let the update go on
+    pass ``savepoint=True``: a failure then only undoes their statements.
+    """
+    if session is not None:
+        if savepoint:
+            async with session.begin_nested():
+                yield session
+        else:
+            yield session
+            await session.flush()
+        return
+
+    async with async_session() as own_session:
+        try:
+            yield own_session
+            await own_session.commit()
+        except Exception:
+            await own_session.rollback()
+            raise
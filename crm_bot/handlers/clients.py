@@ -1,5 +1,6 @@
 from aiogram import Router, types, F
 from aiogram.fsm.context import FSMContext
+from sqlalchemy.ext.asyncio import AsyncSession
 from aiogram.filters import Command
 from states import OrderStates, ClientStates
 from database.crud import add_client_to_db, get_client_by_passport
@@ -7,6 +8,7 @@ from database.models import Client
 from config import Config
 from keyboards.builders import main_menu, back_to_main_menu
 from keyboards.types import BACK_TO_MAIN_MENU_BTN
+from handlers.common import handle_back_to_main_menu
 import re
 from aiogram.types import ContentType
 
@@ -16,17 +18,9 @@ router = Router()
 REGEX_PHONE = r'^\d{9}$'
 REGEX_PASSPORT = r'^[A-Z]{2}\d{7}$'
 
-@router.message(F.text == BACK_TO_MAIN_MENU_BTN)
-async def handle_back_to_main_menu(message: types.Message, state: FSMContext):
-    await state.clear()
-    await message.answer(
-        "Asosiy menyu:",
-        reply_markup=main_menu
-    )
-
 @router.message(F.from_user.id.in_(Config.ALLOWED_USERS), 
     OrderStates.CLIENT_PASSPORT)
-async def process_client_passport(message: types.Message, state: FSMContext):
+async def process_client_passport(message: types.Message, state: FSMContext, session: AsyncSession):
     if message.text == BACK_TO_MAIN_MENU_BTN:
         await handle_back_to_main_menu(message, state)
         return
@@ -41,7 +35,7 @@ async def process_client_passport(message: types.Message, state: FSMContext):
         )
         return
 
-    client = await get_client_by_passport(passport)
+    client = await get_client_by_passport(passport, session=session)
     
     if client:
         await state.update_data(client_id=client.id)
@@ -119,7 +113,7 @@ async def process_client_location(message: types.Message, state: FSMContext):
     F.from_user.id.in_(Config.ALLOWED_USERS), 
     ClientStates.NOTES
 )
-async def process_client_notes(message: types.Message, state: FSMContext):
+async def process_client_notes(message: types.Message, state: FSMContext, session: AsyncSession):
     if message.text == BACK_TO_MAIN_MENU_BTN:
         await handle_back_to_main_menu(message, state)
         return
@@ -134,7 +128,7 @@ async def process_client_notes(message: types.Message, state: FSMContext):
         'notes': message.text
     }
     
-    client = await add_client_to_db(client_data)
+    client = await add_client_to_db(client_data, session=session)
     
     await state.update_data(client_id=client.id)
     await message.answer(
@@ -0,0 +1,26 @@
+from aiogram import Router, types, F
+from aiogram.fsm.context import FSMContext
+from keyboards.builders import main_menu
+from keyboards.callbacks import CANCEL_DELETE
+from keyboards.types import BACK_TO_MAIN_MENU_BTN
+from handlers.routing import callback_routes
+
+# Handlers shared by every section; registered once, before the section routers
+router = Router(name="common")
+
+@router.message(F.text == BACK_TO_MAIN_MENU_BTN)
+async def handle_back_to_main_menu(message: types.Message, state: FSMContext):
+    await state.clear()
+    await message.answer(
+        "Asosiy menyu:",
+        reply_markup=main_menu
+    )
+
+# Cancel delete (orders, sellers and consumptions)
+@callback_routes.route(CANCEL_DELETE)
+async def cancel_delete_handler(callback: types.CallbackQuery, state: FSMContext):
+    await callback.message.edit_text("❌ O'chirish bekor qilindi.")
+    await state.clear()
+
+def register_handlers(dp):
+    dp.include_router(router)
@@ -1,6 +1,7 @@
 from aiogram import Router, types, F
-from aiogram.types import BufferedInputFile, InlineKeyboardButton, InlineKeyboardMarkup
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 from aiogram.fsm.context import FSMContext
+from sqlalchemy.ext.asyncio import AsyncSession
 from aiogram.filters import Command
 from states import ConsumptionStates, EditConsumptionStates
 from database.crud import (
@@ -14,7 +15,6 @@ from database.crud import (
     get_total_consumptions_by_owner
 )
 from database.models import Consumptions
-from database.utils import async_session
 from config import Config
 from datetime import datetime
 from keyboards.types import (
@@ -25,6 +25,14 @@ from keyboards.types import (
     FIELD_OWNER
 )
 from keyboards.builders import main_menu, back_to_main_menu, get_employees_keyboard
+from keyboards.callbacks import (
+    pack, CANCEL_EDIT, CANCEL_DELETE,
+    CONSUMPTION_EDIT, CONSUMPTION_FIELD,
+    CONSUMPTION_DELETE, CONSUMPTION_DELETE_CONFIRM
+)
+from handlers.common import handle_back_to_main_menu
+from handlers.routing import callback_routes
+from utilities.export_cache import answer_with_export
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 import re
 
@@ -47,17 +55,11 @@ def format_consumption_info(consumption: Consumptions) -> str:
 def create_consumption_edit_buttons(consumption_id: int):
     builder = InlineKeyboardBuilder()
     builder.row(
-        InlineKeyboardButton(text="✏️ Tahrirlash", callback_data=f"edit_consumption_{consumption_id}"),
-        InlineKeyboardButton(text="🗑️ O'chirish", callback_data=f"delete_consumption_{consumption_id}")
+        InlineKeyboardButton(text="✏️ Tahrirlash", callback_data=pack(CONSUMPTION_EDIT, consumption_id)),
+        InlineKeyboardButton(text="🗑️ O'chirish", callback_data=pack(CONSUMPTION_DELETE, consumption_id))
     )
     return builder.as_markup()
 
-# Common back to main menu handler
-@router.message(F.text == BACK_TO_MAIN_MENU_BTN)
-async def handle_back_to_main_menu(message: types.Message, state: FSMContext):
-    await state.clear()
-    await message.answer("Asosiy menyu:", reply_markup=main_menu)
-
 # Start adding new consumption
 @router.message(F.from_user.id.in_(Config.ALLOWED_USERS), F.text == "📝 Yangi xarajat")
 async def start_add_consumption(message: types.Message, state: FSMContext):
@@ -119,7 +121,7 @@ async def process_amount_input(message: types.Message, state: FSMContext):
 
 # Process description input
 @router.message(ConsumptionStates.ENTER_DESCRIPTION)
-async def process_description_input(message: types.Message, state: FSMContext):
+async def process_description_input(message: types.Message, state: FSMContext, session: AsyncSession):
     if message.text == BACK_TO_MAIN_MENU_BTN:
         await handle_back_to_main_menu(message, state)
         return
@@ -138,7 +140,8 @@ async def process_description_input(message: types.Message, state: FSMContext):
     consumption = await create_consumption(
         owner=data['owner'],
         amount=data['amount'],
-        description=description
+        description=description,
+        session=session
     )
     
     if consumption:
@@ -155,24 +158,14 @@ async def process_description_input(message: types.Message, state: FSMContext):
 
 # Send consumptions list as Excel
 @router.message(F.text == "📋 Xarajatlar ro'yxati")
-async def send_consumptions_excel(message: types.Message):
-    excel_buffer = await generate_consumptions_excel()
-    
-    if not excel_buffer:
-        await message.answer(
-            "❌ Xarajatlar topilmadi yoki xatolik yuz berdi",
-            reply_markup=back_to_main_menu()
-        )
-        return
-    
-    filename = f"consumptions_{datetime.now().strftime('%Y-%m-%d')}.xlsx"
-    
-    await message.answer_document(
-        document=BufferedInputFile(
-            file=excel_buffer.read(),
-            filename=filename
-        ),
-        caption="📋 Barcha xarajatlar hisoboti"
+async def send_consumptions_excel(message: types.Message, session: AsyncSession):
+    await answer_with_export(
+        message, session,
+        report="consumptions",
+        build_export=generate_consumptions_excel,
+        filename_prefix="consumptions",
+        caption="📋 Barcha xarajatlar hisoboti",
+        empty_text="❌ Xarajatlar topilmadi yoki xatolik yuz berdi"
     )
 
 # View consumption details
@@ -186,14 +179,14 @@ async def start_view_consumption(message: types.Message, state: FSMContext):
 
 # Process consumption ID input
 @router.message(ConsumptionStates.ENTER_ID)
-async def process_consumption_id(message: types.Message, state: FSMContext):
+async def process_consumption_id(message: types.Message, state: FSMContext, session: AsyncSession):
     if message.text == BACK_TO_MAIN_MENU_BTN:
         await handle_back_to_main_menu(message, state)
         return
         
     try:
         consumption_id = int(message.text)
-        consumption = await get_consumption_by_id(consumption_id)
+        consumption = await get_consumption_by_id(consumption_id, session=session)
         
         if not consumption:
             await message.answer(
@@ -217,16 +210,16 @@ async def process_consumption_id(message: types.Message, state: FSMContext):
         )
 
 # Edit consumption handler
-@router.callback_query(F.data.startswith("edit_consumption_"))
-async def edit_consumption_handler(callback: types.CallbackQuery, state: FSMContext):
-    consumption_id = int(callback.data.split("_")[-1])
+@callback_routes.route(CONSUMPTION_EDIT, value_type=int)
+async def edit_consumption_handler(callback: types.CallbackQuery, state: FSMContext, value: int):
+    consumption_id = value
     await state.update_data(consumption_id=consumption_id)
     
     keyboard = [
-        [InlineKeyboardButton(text=FIELD_OWNER, callback_data="edit_owner")],
-        [InlineKeyboardButton(text=FIELD_AMOUNT, callback_data="edit_amount")],
-        [InlineKeyboardButton(text=FIELD_DESCRIPTION, callback_data="edit_description")],
-        [InlineKeyboardButton(text=CANCEL_EDIT_BTN, callback_data="cancel_edit")]
+        [InlineKeyboardButton(text=FIELD_OWNER, callback_data=pack(CONSUMPTION_FIELD, "owner"))],
+        [InlineKeyboardButton(text=FIELD_AMOUNT, callback_data=pack(CONSUMPTION_FIELD, "amount"))],
+        [InlineKeyboardButton(text=FIELD_DESCRIPTION, callback_data=pack(CONSUMPTION_FIELD, "description"))],
+        [InlineKeyboardButton(text=CANCEL_EDIT_BTN, callback_data=pack(CANCEL_EDIT))]
     ]
     
     await callback.message.edit_text(
@@ -236,16 +229,16 @@ async def edit_consumption_handler(callback: types.CallbackQuery, state: FSMCont
     await state.set_state(EditConsumptionStates.SELECT_FIELD)
 
 # Select field to edit
-@router.callback_query(EditConsumptionStates.SELECT_FIELD, F.data.startswith("edit_"))
-async def select_field_to_edit(callback: types.CallbackQuery, state: FSMContext):
-    field = callback.data.replace("edit_", "")
+@callback_routes.route(CONSUMPTION_FIELD, EditConsumptionStates.SELECT_FIELD, value_type=str)
+async def select_field_to_edit(callback: types.CallbackQuery, state: FSMContext, session: AsyncSession, value: str):
+    field = value
     await state.update_data(edit_field=field)
     
     data = await state.get_data()
     consumption_id = data['consumption_id']
     
     # Get current consumption info
-    consumption = await get_consumption_by_id(consumption_id)
+    consumption = await get_consumption_by_id(consumption_id, session=session)
     if not consumption:
         await callback.answer("❌ Xarajat topilmadi!")
         return
@@ -261,7 +254,7 @@ async def select_field_to_edit(callback: types.CallbackQuery, state: FSMContext)
         await callback.message.edit_text(
             f"Yangi qiymatni kiriting:\nHozirgi qiymat: {current_value}",
             reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text=CANCEL_EDIT_BTN, callback_data="cancel_edit")]
+                [InlineKeyboardButton(text=CANCEL_EDIT_BTN, callback_data=pack(CANCEL_EDIT))]
             ])
         )
     
@@ -269,7 +262,7 @@ async def select_field_to_edit(callback: types.CallbackQuery, state: FSMContext)
 
 # Process new value for editing
 @router.message(EditConsumptionStates.ENTER_NEW_VALUE)
-async def process_new_value(message: types.Message, state: FSMContext):
+async def process_new_value(message: types.Message, state: FSMContext, session: AsyncSession):
     if message.text == BACK_TO_MAIN_MENU_BTN:
         await handle_back_to_main_menu(message, state)
         return
@@ -298,11 +291,11 @@ async def process_new_value(message: types.Message, state: FSMContext):
             db_field = "consumption_owner"
         
         # Update consumption in database
-        success = await update_consumption(consumption_id, {db_field: new_value})
+        success = await update_consumption(consumption_id, {db_field: new_value}, session=session)
         
         if success:
             # Show updated consumption info
-            consumption = await get_consumption_by_id(consumption_id)
+            consumption = await get_consumption_by_id(consumption_id, session=session)
             await message.answer(
                 "✅ Muvaffaqiyatli yangilandi!\n" + format_consumption_info(consumption),
                 reply_markup=create_consumption_edit_buttons(consumption.id)
@@ -327,15 +320,15 @@ async def process_new_value(message: types.Message, state: FSMContext):
         )
 
 # Delete consumption handler
-@router.callback_query(F.data.startswith("delete_consumption_"))
-async def delete_consumption_handler(callback: types.CallbackQuery, state: FSMContext):
-    consumption_id = int(callback.data.split("_")[-1])
+@callback_routes.route(CONSUMPTION_DELETE, value_type=int)
+async def delete_consumption_handler(callback: types.CallbackQuery, state: FSMContext, value: int):
+    consumption_id = value
     await state.update_data(consumption_id=consumption_id)
     
     builder = InlineKeyboardBuilder()
     builder.row(
-        InlineKeyboardButton(text="✅ Ha", callback_data=f"confirm__consumption_delete_{consumption_id}"),
-        InlineKeyboardButton(text="❌ Yo'q", callback_data="cancel_delete")
+        InlineKeyboardButton(text="✅ Ha", callback_data=pack(CONSUMPTION_DELETE_CONFIRM, consumption_id)),
+        InlineKeyboardButton(text="❌ Yo'q", callback_data=pack(CANCEL_DELETE))
     )
     
     await callback.message.edit_text(
@@ -343,12 +336,12 @@ async def delete_consumption_handler(callback: types.CallbackQuery, state: FSMCo
         reply_markup=builder.as_markup()
     )
 
-@router.callback_query(F.data.startswith("confirm__consumption_delete_"))
-async def confirm_delete_handler(callback: types.CallbackQuery, state: FSMContext):
-    consumption_id = int(callback.data.split("_")[-1])
+@callback_routes.route(CONSUMPTION_DELETE_CONFIRM, value_type=int)
+async def confirm_delete_handler(callback: types.CallbackQuery, state: FSMContext, session: AsyncSession, value: int):
+    consumption_id = value
     
     try:
-        success = await delete_consumption(consumption_id)
+        success = await delete_consumption(consumption_id, session=session)
         if success:
             await callback.message.edit_text(
                 f"✅ Xarajat #{consumption_id} o'chirib tashlandi!",
@@ -363,16 +356,10 @@ async def confirm_delete_handler(callback: types.CallbackQuery, state: FSMContex
         await state.clear()
         await callback.answer()
 
-# Cancel delete
-@router.callback_query(F.data == "cancel_delete")
-async def cancel_delete_handler(callback: types.CallbackQuery, state: FSMContext):
-    await callback.message.edit_text("❌ O'chirish bekor qilindi.")
-    await state.clear()
-
 # View totals by owner
 @router.message(F.text == "📊 Xarajatlar statistikasi")
-async def view_consumption_stats(message: types.Message):
-    totals = await get_total_consumptions_by_owner()
+async def view_consumption_stats(message: types.Message, session: AsyncSession):
+    totals = await get_total_consumptions_by_owner(session=session)
     
     if not totals:
         await message.answer(
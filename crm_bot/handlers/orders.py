@@ -1,13 +1,12 @@
 from aiogram import Router, types, F
 from aiogram.fsm.context import FSMContext
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Union
-from database.utils import async_session
-from aiogram.types import BufferedInputFile
+from utilities.export_cache import answer_with_export
 from states import OrderStates, ViewOrderStates, EditOrderStates
 from aiogram.filters import Command
 from datetime import datetime
 from sqlalchemy.orm import joinedload
-from sqlalchemy import select
 from aiogram.types import (
     InlineKeyboardButton, 
     InlineKeyboardMarkup,
@@ -17,20 +16,34 @@ from database.crud import (
     get_all_orders_with_details, 
     get_order_by_id_with_details,
     update_order,
-    delete_order)
+    delete_order,
+    add_monthly_payment,
+    change_seller_order_counter)
 from keyboards.types import (
     CANCEL_EDIT_BTN, FIELD_ITEM_COUNT, 
     FIELD_TOTAL_SUM, FIELD_MONTHLY_PAY, 
     FIELD_PREPAID, VIEW_ORDER_BTN,
     FIELD_RETURNED, BACK_TO_MAIN_MENU_BTN,
-    FIELD_STATUS_ORDER
+    FIELD_STATUS_ORDER, MONTHLY_REPORT_BTN
 )  
-from keyboards.builders import main_menu, back_to_main_menu
+from keyboards.builders import main_menu, back_to_main_menu, MAIN_MENU_BUTTONS
+from keyboards.callbacks import (
+    pack, CANCEL_EDIT, CANCEL_DELETE,
+    ORDER_EDIT, ORDER_FIELD, ORDER_STATUS_EDIT, ORDER_STATUS_SET,
+    ORDER_ADD_PAYMENT, ORDER_DELETE, ORDER_DELETE_CONFIRM,
+    SELLER_PAGE, SELLER_SELECT, MONTHLY_REPORT
+)
+from handlers.common import handle_back_to_main_menu
+from handlers.routing import callback_routes
+from keyboards.seller_picker import get_seller_picker_page
+from database.rollup import get_month_rollup, get_rollup_months
+from utilities.notifications import format_monthly_report, month_title
 from database.models import Order, Client, Seller
 from config import Config
 from database.crud import (
     get_seller_by_passport, 
     get_client_by_passport,
+    get_seller_by_id_or_passport,
     create_order,
     generate_orders_excel
 )
@@ -52,14 +65,6 @@ date_keyboard = ReplyKeyboardMarkup(
     resize_keyboard=True
 )
 
-@router.message(F.text == BACK_TO_MAIN_MENU_BTN)
-async def handle_back_to_main_menu(message: types.Message, state: FSMContext):
-    await state.clear()
-    await message.answer(
-        "Asosiy menyu:",
-        reply_markup=main_menu
-    )
-
 @router.message(F.from_user.id.in_(Config.ALLOWED_USERS), Command("start"))
 async def start_handler(message: types.Message):
     await message.answer(
@@ -77,7 +82,7 @@ async def start_add_order(message: types.Message, state: FSMContext):
         reply_markup=back_to_main_menu())
 
 @router.message(F.from_user.id.in_(Config.ALLOWED_USERS), OrderStates.CLIENT_PASSPORT)
-async def process_client_passport(message: types.Message, state: FSMContext):
+async def process_client_passport(message: types.Message, state: FSMContext, session: AsyncSession):
     if message.text == BACK_TO_MAIN_MENU_BTN:
         await handle_back_to_main_menu(message, state)
         return
@@ -92,7 +97,7 @@ async def process_client_passport(message: types.Message, state: FSMContext):
         )
         return
 
-    client = await get_client_by_passport(passport)
+    client = await get_client_by_passport(passport, session=session)
     
     if client:
         await state.update_data(
@@ -113,24 +118,24 @@ def format_location(latitude: float, longitude: float) -> str:
     return "📍 Joylashuv: Ko'rsatilmagan"
 
 
-@router.callback_query(ViewOrderStates.CHOOSE_STATUS, F.data.startswith("set_status_"))
-async def process_status_selection(callback: types.CallbackQuery, state: FSMContext):
+@callback_routes.route(ORDER_STATUS_SET, ViewOrderStates.CHOOSE_STATUS, value_type=str)
+async def process_status_selection(callback: types.CallbackQuery, state: FSMContext, session: AsyncSession, value: str):
     data = await state.get_data()
     if 'order_id' not in data:
         await callback.answer("❌ ID заказа не найден")
         return
     
-    status = callback.data.replace("set_status_", "").capitalize()
+    status = value
     
     if status not in ORDER_STATUS_OPTIONS:
         await callback.answer("❌ Noto'g'ri holat tanlandi")
         return
     
-    success = await update_order(data['order_id'], {'order_status': status})
+    success = await update_order(data['order_id'], {'order_status': status}, session=session)
     
     if success:
         await callback.message.edit_text(f"✅ Buyurtma holati '{status}' ga o'zgartirildi!")
-        await show_order_after_edit(data['order_id'], callback.message)
+        await show_order_after_edit(data['order_id'], callback.message, session=session)
     else:
         await callback.message.edit_text("❌ Xatolik yuz berdi! Holat yangilanmadi.")
     
@@ -188,7 +193,7 @@ async def process_monthly_payment(message: types.Message, state: FSMContext):
         await message.answer("Iltimos, raqam kiriting!")
 
 @router.message(F.from_user.id.in_(Config.ALLOWED_USERS), OrderStates.PREPAID_AMOUNT)
-async def process_prepaid_amount(message: types.Message, state: FSMContext):
+async def process_prepaid_amount(message: types.Message, state: FSMContext, session: AsyncSession):
     if message.text == BACK_TO_MAIN_MENU_BTN:
         await handle_back_to_main_menu(message, state)
         return
@@ -208,27 +213,19 @@ async def process_prepaid_amount(message: types.Message, state: FSMContext):
             await state.clear()
             return
 
-        async with async_session() as session:
-            result = await session.execute(select(Seller))
-            sellers = result.scalars().all()
-
-        if not sellers:
+        picker = await get_seller_picker_page(session=session)
+        if not picker:
             await message.answer("❌ Sotuvchilar topilmadi! Iltimos, avval sotuvchi qo'shing.", reply_markup=main_menu)
             await state.clear()
             return
 
-        builder = InlineKeyboardBuilder()
-        for seller in sellers:
-            builder.button(
-                text=f"{seller.full_name} - {seller.passport_serial}",
-                callback_data=f"seller_select:{seller.id}"
-            )
-        builder.adjust(1)
-        
+        keyboard, _, _ = picker
         await message.answer(
-            "Iltimos, sotuvchini tanlang:",
-            reply_markup=builder.as_markup()
+            "Iltimos, sotuvchini tanlang:\n"
+            "🔎 Qidirish uchun sotuvchi ismining boshini yozing.",
+            reply_markup=keyboard
         )
+        await state.update_data(seller_filter=None, seller_page=0)
         await state.set_state(OrderStates.SELLER_PASSPORT)
             
     except ValueError:
@@ -238,44 +235,72 @@ async def process_prepaid_amount(message: types.Message, state: FSMContext):
                            reply_markup=back_to_main_menu())
         await state.clear()
 
-@router.callback_query(F.data.startswith("seller_select:"))
-async def handle_seller_selection(callback: types.CallbackQuery, state: FSMContext):
-    async with async_session() as session:
-        try:
-            seller_id = int(callback.data.split(":")[1])
-            data = await state.get_data()
-            
-            seller = await session.get(Seller, seller_id)
-            if not seller:
-                await callback.answer("❌ Sotuvchi topilmadi!")
-                return
-                
-            await state.update_data(seller_id=seller.id)
-            
-            if data.get('client_id'):
-                # Если клиент существует, запрашиваем дату заказа
-                await callback.message.answer(
-                    "Buyurtma sanasini kiriting (DD.MM.YYYY) yoki 'Bugun' tugmasini bosing:",
-                    reply_markup=date_keyboard
-                )
-                await state.set_state(OrderStates.ORDER_DATE)
-            else:
-                # Если клиента нет, продолжаем сбор информации о клиенте
-                await callback.message.answer(
-                    f"Sotuvchi tanlandi: {seller.full_name}\n"
-                    f"📊 Jami buyurtmalar: {seller.order_counter}\n"
-                    "Yangi mijozning to'liq ismini kiriting:",
-                    reply_markup=back_to_main_menu()
-                )
-                await state.set_state(OrderStates.CLIENT_FULLNAME)
+@callback_routes.route(SELLER_PAGE, OrderStates.SELLER_PASSPORT, value_type=int)
+async def handle_seller_page(callback: types.CallbackQuery, state: FSMContext, session: AsyncSession, value: int):
+    page = value
+    data = await state.get_data()
+    if page != data.get('seller_page', 0):
+        picker = await get_seller_picker_page(page, data.get('seller_filter'), session=session)
+        if picker:
+            keyboard, current_page, _ = picker
+            await callback.message.edit_reply_markup(reply_markup=keyboard)
+            await state.update_data(seller_page=current_page)
+    await callback.answer()
+
+# Menu buttons fall through to their own handlers, as before the name filter existed
+@router.message(F.from_user.id.in_(Config.ALLOWED_USERS), OrderStates.SELLER_PASSPORT, ~F.text.in_(MAIN_MENU_BUTTONS))
+async def filter_sellers_by_name(message: types.Message, state: FSMContext, session: AsyncSession):
+    if message.text == BACK_TO_MAIN_MENU_BTN:
+        await handle_back_to_main_menu(message, state)
+        return
+
+    name_prefix = (message.text or "").strip()
+    picker = await get_seller_picker_page(0, name_prefix, session=session)
+    if not picker:
+        await message.answer(f"❌ '{name_prefix}' bilan boshlanadigan sotuvchi topilmadi. Qayta kiriting:")
+        return
+
+    keyboard, _, _ = picker
+    await state.update_data(seller_filter=name_prefix, seller_page=0)
+    await message.answer("Iltimos, sotuvchini tanlang:", reply_markup=keyboard)
+
+@callback_routes.route(SELLER_SELECT, value_type=int)
+async def handle_seller_selection(callback: types.CallbackQuery, state: FSMContext, session: AsyncSession, value: int):
+    try:
+        seller_id = value
+        data = await state.get_data()
+        
+        seller = await get_seller_by_id_or_passport(seller_id=seller_id, session=session)
+        if not seller:
+            await callback.answer("❌ Sotuvchi topilmadi!")
+            return
             
-            await callback.answer()
-        except Exception as e:
-            await callback.message.answer(f"❌ Xatolik yuz berdi: {str(e)}")
+        await state.update_data(seller_id=seller.id)
+        
+        if data.get('client_id'):
+            # Если клиент существует, запрашиваем дату заказа
+            await callback.message.answer(
+                "Buyurtma sanasini kiriting (DD.MM.YYYY) yoki 'Bugun' tugmasini bosing:",
+                reply_markup=date_keyboard
+            )
+            await state.set_state(OrderStates.ORDER_DATE)
+        else:
+            # Если клиента нет, продолжаем сбор информации о клиенте
+            await callback.message.answer(
+                f"Sotuvchi tanlandi: {seller.full_name}\n"
+                f"📊 Jami buyurtmalar: {seller.order_counter}\n"
+                "Yangi mijozning to'liq ismini kiriting:",
+                reply_markup=back_to_main_menu()
+            )
+            await state.set_state(OrderStates.CLIENT_FULLNAME)
+        
+        await callback.answer()
+    except Exception as e:
+        await callback.message.answer(f"❌ Xatolik yuz berdi: {str(e)}")
 
 # Добавьте новый обработчик для даты заказа
 @router.message(OrderStates.ORDER_DATE)
-async def process_order_date(message: types.Message, state: FSMContext):
+async def process_order_date(message: types.Message, state: FSMContext, session: AsyncSession):
     try:
         if message.text == "Bugun":
             order_date = datetime.now()
@@ -302,42 +327,31 @@ async def process_order_date(message: types.Message, state: FSMContext):
             'every_month_should_pay': data['every_month_should_pay'],
             'prepaid': data.get('prepaid', 0),
             'order_status': 'Ochiq',
-            'created_at': order_date,
-            'remaining_amount': data['sum_of_item'] - data.get('prepaid', 0)
+            'created_at': order_date
         }
         
-        async with async_session() as session:
-            order = Order(**order_data)
-            session.add(order)
-            
-            # Обновляем счетчик продавца
-            seller = await session.get(Seller, data['seller_id'])
-            seller.order_counter += 1
-            
-            await session.commit()
-            
-            # Получаем данные клиента для отображения
-            client = await session.get(Client, client_id)
-            
-            location_info = ""
-            if client.latitude and client.longitude:
-                location_info = format_location(client.latitude, client.longitude) + "\n\n"
-
-            await message.answer(
-                f"✅ #{order.id}-buyurtma muvaffaqiyatli yaratildi!\n"
-                f"📅 Sana: {order_date.strftime('%d.%m.%Y')}\n"
-                f"👤 Sotuvchi: {seller.full_name}\n"
-                f"📊 Sotuvchining jami buyurtmalari: {seller.order_counter}\n"
-                f"👤 Mijoz: {client.full_name}\n"
-                f"📞 Mijoz tel: {client.phone}\n"
-                f"{location_info}"
-                f"📦 Mahsulot soni: {data['item_count']} ta\n"
-                f"💰 Umumiy summa: {data['sum_of_item']:,} so'm\n"
-                f"📅 Oylik to'lov: {data['every_month_should_pay']:,} so'm\n"
-                f"💵 Oldindan to'lov: {data.get('prepaid', 0):,} so'm",
-                reply_markup=main_menu
-            )
-            
+        # Заказ, счетчик продавца и данные для чека — одним запросом
+        order = await create_order(order_data, session=session)
+        
+        location_info = ""
+        if order.client_latitude and order.client_longitude:
+            location_info = format_location(order.client_latitude, order.client_longitude) + "\n\n"
+
+        await message.answer(
+            f"✅ #{order.order_id}-buyurtma muvaffaqiyatli yaratildi!\n"
+            f"📅 Sana: {order_date.strftime('%d.%m.%Y')}\n"
+            f"👤 Sotuvchi: {order.seller_name}\n"
+            f"📊 Sotuvchining jami buyurtmalari: {order.seller_order_counter}\n"
+            f"👤 Mijoz: {order.client_name}\n"
+            f"📞 Mijoz tel: {order.client_phone}\n"
+            f"{location_info}"
+            f"📦 Mahsulot soni: {data['item_count']} ta\n"
+            f"💰 Umumiy summa: {data['sum_of_item']:,} so'm\n"
+            f"📅 Oylik to'lov: {data['every_month_should_pay']:,} so'm\n"
+            f"💵 Oldindan to'lov: {data.get('prepaid', 0):,} so'm",
+            reply_markup=main_menu
+        )
+        
         await state.clear()
         
     except ValueError:
@@ -346,6 +360,7 @@ async def process_order_date(message: types.Message, state: FSMContext):
             reply_markup=date_keyboard
         )
     except Exception as e:
+        await session.rollback()
         await message.answer(
             f"❌ Xatolik yuz berdi: {str(e)}",
             reply_markup=main_menu
@@ -353,26 +368,42 @@ async def process_order_date(message: types.Message, state: FSMContext):
         await state.clear()
 
 @router.message(F.from_user.id.in_(Config.ALLOWED_USERS), F.text == "📋 Buyurtmalar ro'yxati")
-async def send_orders_excel(message: types.Message):
-    excel_buffer = await generate_orders_excel()
-    
-    if not excel_buffer:
-        await message.answer("❌ Buyurtmalar topilmadi yoki xatolik yuz berdi", reply_markup=back_to_main_menu())
-        return
-    
-    # Create a filename with current date
-    filename = f"orders_{datetime.now().strftime('%Y-%m-%d')}.xlsx"
-    
+async def send_orders_excel(message: types.Message, session: AsyncSession):
     # Send the Excel file with location info in caption
-    await message.answer_document(
-        document=BufferedInputFile(
-            file=excel_buffer.read(),
-            filename=filename
-        ),
-        caption="📊 Barcha buyurtmalar ro'yxati\n📍 Joylashuvlar bilan"
+    await answer_with_export(
+        message, session,
+        report="orders",
+        build_export=generate_orders_excel,
+        filename_prefix="orders",
+        caption="📊 Barcha buyurtmalar ro'yxati\n📍 Joylashuvlar bilan",
+        empty_text="❌ Buyurtmalar topilmadi yoki xatolik yuz berdi"
     )
 
 
+@router.message(F.from_user.id.in_(Config.ALLOWED_USERS), F.text == MONTHLY_REPORT_BTN)
+async def choose_report_month(message: types.Message, session: AsyncSession):
+    months = await get_rollup_months(limit=12, session=session)
+    if not months:
+        await message.answer("📭 Hisobot uchun buyurtmalar yo'q", reply_markup=back_to_main_menu())
+        return
+
+    builder = InlineKeyboardBuilder()
+    for month in months:
+        builder.button(text=month_title(month), callback_data=pack(MONTHLY_REPORT, f"{month:%Y-%m}"))
+    builder.adjust(2)
+    await message.answer("📊 Qaysi oy uchun hisobot kerak?", reply_markup=builder.as_markup())
+
+@callback_routes.route(MONTHLY_REPORT, value_type=str)
+async def show_monthly_report(callback: types.CallbackQuery, session: AsyncSession, value: str):
+    try:
+        month = datetime.strptime(value, "%Y-%m").date()
+    except ValueError:
+        await callback.answer("❌ Noto'g'ri oy")
+        return
+    rollup = await get_month_rollup(month, session=session)
+    await callback.message.answer(format_monthly_report(month, rollup))
+    await callback.answer()
+
 # 2. Обработчик для начала просмотра заказа
 @router.message(F.from_user.id.in_(Config.ALLOWED_USERS), F.text == VIEW_ORDER_BTN)
 async def view_order_start(message: types.Message, state: FSMContext):
@@ -384,7 +415,7 @@ async def view_order_start(message: types.Message, state: FSMContext):
 
 # 3. Получение ID заказа и отображение информации
 @router.message(ViewOrderStates.ENTER_ORDER_ID)
-async def get_order_by_id(message: types.Message, state: FSMContext):
+async def get_order_by_id(message: types.Message, state: FSMContext, session: AsyncSession):
     if message.text == BACK_TO_MAIN_MENU_BTN:
         await handle_back_to_main_menu(message, state)
         return
@@ -392,7 +423,7 @@ async def get_order_by_id(message: types.Message, state: FSMContext):
     try:
         order_id = int(message.text)
         # Assuming get_order_by_id_with_details returns an Order object with joined client info
-        order = await get_order_by_id_with_details(order_id)
+        order = await get_order_by_id_with_details(order_id, session=session)
         
         if not order:
             await message.answer("❌ Buyurtma topilmadi", reply_markup=back_to_main_menu())
@@ -421,11 +452,11 @@ async def get_order_by_id(message: types.Message, state: FSMContext):
         # Create inline buttons
         builder = InlineKeyboardBuilder()
         builder.row(
-            InlineKeyboardButton(text="✏️ Tahrirlash", callback_data=f"order_edit_{order.id}"),
-            InlineKeyboardButton(text="🗑️ O'chirish", callback_data=f"delete_order_{order.id}")
+            InlineKeyboardButton(text="✏️ Tahrirlash", callback_data=pack(ORDER_EDIT, order.id)),
+            InlineKeyboardButton(text="🗑️ O'chirish", callback_data=pack(ORDER_DELETE, order.id))
         )
         builder.row(
-            InlineKeyboardButton(text="➕ To'langan summasiga qo'shish", callback_data=f"add_total_paid_{order.id}")
+            InlineKeyboardButton(text="➕ To'langan summasiga qo'shish", callback_data=pack(ORDER_ADD_PAYMENT, order.id))
         )
         
         await message.answer(
@@ -438,9 +469,9 @@ async def get_order_by_id(message: types.Message, state: FSMContext):
     except ValueError:
         await message.answer("❌ Noto'g'ri format! Faqat raqam kiriting.", reply_markup=back_to_main_menu())
 
-@router.callback_query(F.data.startswith("add_total_paid_"))
-async def add_total_paid_handler(callback: types.CallbackQuery, state: FSMContext):
-    order_id = int(callback.data.split("_")[-1])
+@callback_routes.route(ORDER_ADD_PAYMENT, value_type=int)
+async def add_total_paid_handler(callback: types.CallbackQuery, state: FSMContext, value: int):
+    order_id = value
     await state.update_data(order_id=order_id)
     await callback.message.answer(
         "💵 Qo'shimcha to'lov miqdorini kiriting:",
@@ -449,79 +480,56 @@ async def add_total_paid_handler(callback: types.CallbackQuery, state: FSMContex
     await state.set_state(ViewOrderStates.ADD_PAYMENT)
 
 @router.message(ViewOrderStates.ADD_PAYMENT)
-async def process_add_payment(message: types.Message, state: FSMContext):
-    async with async_session() as session: 
-        if message.text == BACK_TO_MAIN_MENU_BTN:
-            await handle_back_to_main_menu(message, state)
-            return
-
-        try:
-            payment_amount = int(message.text)
-            if payment_amount <= 0:
-                raise ValueError
-            
-            data = await state.get_data()
-            order_id = data.get('order_id')
-            
-            # Получаем заказ из БД
-            order = await session.get(Order, order_id)
-            if not order:
-                await message.answer("❌ Buyurtma topilmadi")
-                return
-
-            # Обновляем суммы
-            order.total_paid += payment_amount
-            order.remaining_amount = max(0, order.sum_of_item - order.total_paid)
-            
-            # Обновляем статус если полностью оплачено
-            if order.remaining_amount <= 0:
-                order.order_status = 'Yopilgan'
-
-            await session.commit()
-            
-            # Формируем обновленную информацию о заказе
-            order_info = (
-                f"✅ {payment_amount:,} so'm qo'shildi!\n\n"
-                f"📋 Buyurtma #{order.id}\n"
-                f"💰 Umumiy summa: {order.sum_of_item:,}\n"
-                f"💳 To'langan: {order.total_paid:,}\n"
-                f"🔄 Qoldiq: {order.remaining_amount:,}\n"
-                f"🔄 Holat: {order.order_status}"
-            )
-            
-            await message.answer(order_info, reply_markup=back_to_main_menu())
-            await state.clear()
+async def process_add_payment(message: types.Message, state: FSMContext, session: AsyncSession):
+    if message.text == BACK_TO_MAIN_MENU_BTN:
+        await handle_back_to_main_menu(message, state)
+        return
 
-        except ValueError:
-            await message.answer(
-                "❌ Noto'g'ri format! Faqat musbat butun son kiriting.",
-                reply_markup=back_to_main_menu()
-            )
-@router.callback_query(F.data.startswith("order_edit_"))
-async def edit_order_handler(callback: types.CallbackQuery, state: FSMContext):
-    if callback.data == "edit_order_status":
+    try:
+        payment_amount = int(message.text)
+        if payment_amount <= 0:
+            raise ValueError
+        
         data = await state.get_data()
-        if 'order_id' not in data:
-            await callback.answer("❌ Сначала выберите заказ")
-            return
-        order_id = data['order_id']
-    else:
-        try:
-            order_id = int(callback.data.split("_")[-1])
-        except (ValueError, IndexError):
-            await callback.answer("❌ Неверный ID заказа")
+        order_id = data.get('order_id')
+        
+        # Обновляем суммы и статус одним UPDATE ... RETURNING
+        order = await add_monthly_payment(order_id, payment_amount, session=session)
+        if not order:
+            await message.answer("❌ Buyurtma topilmadi")
             return
-    
+        
+        # Формируем обновленную информацию о заказе
+        order_info = (
+            f"✅ {payment_amount:,} so'm qo'shildi!\n\n"
+            f"📋 Buyurtma #{order.id}\n"
+            f"💰 Umumiy summa: {order.sum_of_item:,}\n"
+            f"💳 To'langan: {order.total_paid:,}\n"
+            f"🔄 Qoldiq: {order.remaining_amount:,}\n"
+            f"🔄 Holat: {order.order_status}"
+        )
+        
+        await message.answer(order_info, reply_markup=back_to_main_menu())
+        await state.clear()
+
+    except ValueError:
+        await message.answer(
+            "❌ Noto'g'ri format! Faqat musbat butun son kiriting.",
+            reply_markup=back_to_main_menu()
+        )
+@callback_routes.route(ORDER_EDIT, value_type=int)
+async def edit_order_handler(callback: types.CallbackQuery, state: FSMContext, value: int):
+    order_id = value
     await state.update_data(order_id=order_id)
     
     keyboard = [
-        [InlineKeyboardButton(text=FIELD_ITEM_COUNT, callback_data="edit_item_count")],
-        [InlineKeyboardButton(text=FIELD_TOTAL_SUM, callback_data="edit_sum_of_item")],
-        [InlineKeyboardButton(text=FIELD_MONTHLY_PAY, callback_data="edit_every_month_should_pay")],
-        [InlineKeyboardButton(text=FIELD_PREPAID, callback_data="edit_prepaid")],
+        [InlineKeyboardButton(text=FIELD_ITEM_COUNT, callback_data=pack(ORDER_FIELD, "item_count"))],
+        [InlineKeyboardButton(text=FIELD_TOTAL_SUM, callback_data=pack(ORDER_FIELD, "sum_of_item"))],
+        [InlineKeyboardButton(text=FIELD_MONTHLY_PAY, callback_data=pack(ORDER_FIELD, "every_month_should_pay"))],
+        [InlineKeyboardButton(text=FIELD_PREPAID, callback_data=pack(ORDER_FIELD, "prepaid"))],
         # Removed FIELD_RETURNED since it's now part of status
-        [InlineKeyboardButton(text=FIELD_STATUS_ORDER, callback_data="edit_order_status")],
-        [InlineKeyboardButton(text=CANCEL_EDIT_BTN, callback_data="cancel_edit")]
+        [InlineKeyboardButton(text=FIELD_STATUS_ORDER, callback_data=pack(ORDER_STATUS_EDIT))],
+        [InlineKeyboardButton(text=CANCEL_EDIT_BTN, callback_data=pack(CANCEL_EDIT))]
     ]
     
     await callback.message.edit_text(
@@ -530,20 +538,20 @@ async def edit_order_handler(callback: types.CallbackQuery, state: FSMContext):
     )
     await state.set_state(ViewOrderStates.SELECT_FIELD)
 
-@router.callback_query(ViewOrderStates.SELECT_FIELD, F.data == "edit_order_status")
-async def edit_order_status_handler(callback: types.CallbackQuery, state: FSMContext):
+@callback_routes.route(ORDER_STATUS_EDIT, ViewOrderStates.SELECT_FIELD)
+async def edit_order_status_handler(callback: types.CallbackQuery, state: FSMContext, session: AsyncSession):
     data = await state.get_data()
     if 'order_id' not in data:
         await callback.answer("❌ ID заказа не найден")
         return
     
-    order = await get_order_by_id_with_details(data['order_id'])
+    order = await get_order_by_id_with_details(data['order_id'], session=session)
     
     # Create keyboard with status options
     keyboard = InlineKeyboardBuilder()
     for status in ORDER_STATUS_OPTIONS:
-        keyboard.button(text=status, callback_data=f"set_status_{status.lower()}")
-    keyboard.button(text=CANCEL_EDIT_BTN, callback_data="cancel_edit")
+        keyboard.button(text=status, callback_data=pack(ORDER_STATUS_SET, status))
+    keyboard.button(text=CANCEL_EDIT_BTN, callback_data=pack(CANCEL_EDIT))
     keyboard.adjust(1)
     
     await callback.message.edit_text(
@@ -554,32 +562,32 @@ async def edit_order_status_handler(callback: types.CallbackQuery, state: FSMCon
     await state.set_state(ViewOrderStates.CHOOSE_STATUS)
 
 # 5. Обработчик выбора поля для редактирования (исправленная версия)
-@router.callback_query(ViewOrderStates.SELECT_FIELD, F.data.startswith("edit_"))
-async def select_field_to_edit(callback: types.CallbackQuery, state: FSMContext):
+@callback_routes.route(ORDER_FIELD, ViewOrderStates.SELECT_FIELD, value_type=str)
+async def select_field_to_edit(callback: types.CallbackQuery, state: FSMContext, session: AsyncSession, value: str):
     data = await state.get_data()
     if 'order_id' not in data:
         await callback.answer("❌ ID заказа не найден")
         return
     
-    field = callback.data.replace("edit_", "")
+    field = value
     await state.update_data(edit_field=field)
     
     # Получаем текущее значение поля
-    order = await get_order_by_id_with_details(data['order_id'])
+    order = await get_order_by_id_with_details(data['order_id'], session=session)
     current_value = getattr(order, field, "Noma'lum")
     
     await callback.message.edit_text(
         f"Yangi qiymatni kiriting:\n"
         f"Hozirgi qiymat: {current_value}",
         reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text=CANCEL_EDIT_BTN, callback_data="cancel_edit")]
+            [InlineKeyboardButton(text=CANCEL_EDIT_BTN, callback_data=pack(CANCEL_EDIT))]
         ])
     )
     await state.set_state(ViewOrderStates.ENTER_NEW_VALUE)
 
 # 6. Обработка ввода нового значения
 @router.message(ViewOrderStates.ENTER_NEW_VALUE)
-async def process_new_value(message: types.Message, state: FSMContext):
+async def process_new_value(message: types.Message, state: FSMContext, session: AsyncSession):
     if message.text == CANCEL_EDIT_BTN:
         await handle_cancel_edit(message, state)
         return
@@ -602,11 +610,11 @@ async def process_new_value(message: types.Message, state: FSMContext):
             new_value = message.text
         
         # Обновляем заказ в базе данных
-        success = await update_order(order_id, update_data={field: new_value})
+        success = await update_order(order_id, update_data={field: new_value}, session=session)
         
         if success:
             await message.answer("✅ Buyurtma muvaffaqiyatli yangilandi!")
-            await show_order_after_edit(order_id, message)
+            await show_order_after_edit(order_id, message, session=session)
         else:
             await message.answer("❌ Xatolik yuz berdi! Buyurtma yangilanmadi.")
         
@@ -616,19 +624,19 @@ async def process_new_value(message: types.Message, state: FSMContext):
         await message.answer(f"❌ Noto'g'ri format! {str(e)}")
 
 # 7. Отмена редактирования
-@router.callback_query(F.data == "cancel_edit")
-async def cancel_edit_handler(callback: types.CallbackQuery, state: FSMContext):
+@callback_routes.route(CANCEL_EDIT)
+async def cancel_edit_handler(callback: types.CallbackQuery, state: FSMContext, session: AsyncSession):
     data = await state.get_data()
     if 'order_id' in data:
-        await show_order_after_edit(data['order_id'], callback.message)
+        await show_order_after_edit(data['order_id'], callback.message, session=session)
     await state.clear()
     await callback.answer("❌ Tahrirlash bekor qilindi.")
 
-async def show_order_after_edit(order_id: int, message: Union[types.Message, types.CallbackQuery]):
+async def show_order_after_edit(order_id: int, message: Union[types.Message, types.CallbackQuery], session: AsyncSession):
     if isinstance(message, types.CallbackQuery):
         message = message.message
     
-    order = await get_order_by_id_with_details(order_id)
+    order = await get_order_by_id_with_details(order_id, session=session)
     
     # Get client location if available
     location_info = ""
@@ -651,8 +659,8 @@ async def show_order_after_edit(order_id: int, message: Union[types.Message, typ
     
     builder = InlineKeyboardBuilder()
     builder.row(
-        InlineKeyboardButton(text="✏️ Tahrirlash", callback_data=f"order_edit_{order.id}"),
-        InlineKeyboardButton(text="🗑️ O'chirish", callback_data=f"delete_order_{order.id}")
+        InlineKeyboardButton(text="✏️ Tahrirlash", callback_data=pack(ORDER_EDIT, order.id)),
+        InlineKeyboardButton(text="🗑️ O'chirish", callback_data=pack(ORDER_DELETE, order.id))
     )
     
     await message.answer(
@@ -661,15 +669,15 @@ async def show_order_after_edit(order_id: int, message: Union[types.Message, typ
     )
 
 # 6. Обработка кнопки удаления
-@router.callback_query(F.data.startswith("delete_order_"))
-async def delete_order_handler(callback: types.CallbackQuery, state: FSMContext):
-    order_id = int(callback.data.split("_")[-1])
+@callback_routes.route(ORDER_DELETE, value_type=int)
+async def delete_order_handler(callback: types.CallbackQuery, state: FSMContext, value: int):
+    order_id = value
     await state.update_data(order_id=order_id)
     
     builder = InlineKeyboardBuilder()
     builder.row(
-        InlineKeyboardButton(text="✅ Ha", callback_data=f"confirm_order_delete_{order_id}"),
-        InlineKeyboardButton(text="❌ Yo'q", callback_data="cancel_delete")
+        InlineKeyboardButton(text="✅ Ha", callback_data=pack(ORDER_DELETE_CONFIRM, order_id)),
+        InlineKeyboardButton(text="❌ Yo'q", callback_data=pack(CANCEL_DELETE))
     )
     
     await callback.message.edit_text(
@@ -677,50 +685,38 @@ async def delete_order_handler(callback: types.CallbackQuery, state: FSMContext)
         reply_markup=builder.as_markup()
     )
 
-@router.callback_query(F.data.startswith("confirm_order_delete_"))
-async def confirm_delete_handler(callback: types.CallbackQuery, state: FSMContext):
-    async with async_session() as session:
-        order_id = int(callback.data.split("_")[-1])
-        
-        try:
-            # Явно загружаем продавца вместе с заказом
-            order = await session.get(Order, order_id, options=[joinedload(Order.seller)])
-            if not order:
-                await callback.message.edit_text(
-                    "❌ Buyurtma topilmadi!",
-                    reply_markup=main_menu  # Добавляем reply_markup
-                )
-                return
-            
-            seller = order.seller
-            
-            # Удаляем заказ и обновляем счетчик
-            await session.delete(order)
-            seller.order_counter = max(0, seller.order_counter - 1)
-            
-            await session.commit()
-            
-            await callback.message.edit_text(
-                f"✅ Buyurtma #{order_id} o'chirib tashlandi!\n"
-                f"📊 Sotuvchi {seller.full_name}ning buyurtmalar soni: {seller.order_counter}",
-                reply_markup=main_menu
-            )
-            
-        except Exception as e:
-            await session.rollback()
-            # Добавляем reply_markup в сообщение об ошибке
+@callback_routes.route(ORDER_DELETE_CONFIRM, value_type=int)
+async def confirm_delete_handler(callback: types.CallbackQuery, state: FSMContext, session: AsyncSession, value: int):
+    order_id = value
+    
+    try:
+        order = await delete_order(order_id, session=session)
+        if not order:
             await callback.message.edit_text(
-                f"❌ Xatolik yuz berdi: {str(e)}",
-                reply_markup=main_menu
+                "❌ Buyurtma topilmadi!",
+                reply_markup=main_menu  # Добавляем reply_markup
             )
-            
-        finally:
-            await state.clear()
-
-@router.callback_query(F.data == "cancel_delete")
-async def cancel_delete_handler(callback: types.CallbackQuery, state: FSMContext):
-    await callback.message.edit_text("❌ O'chirish bekor qilindi.")
-    await state.clear()
+            return
+        
+        # Обновляем счетчик продавца атомарно
+        seller = await change_seller_order_counter(order.seller_id, -1, session=session)
+        
+        text = f"✅ Buyurtma #{order_id} o'chirib tashlandi!"
+        # The seller may already be gone (deleted together with their orders)
+        if seller:
+            text += f"\n📊 Sotuvchi {seller.full_name}ning buyurtmalar soni: {seller.order_counter}"
+        await callback.message.edit_text(text, reply_markup=main_menu)
+        
+    except Exception as e:
+        await session.rollback()
+        # Добавляем reply_markup в сообщение об ошибке
+        await callback.message.edit_text(
+            f"❌ Xatolik yuz berdi: {str(e)}",
+            reply_markup=main_menu
+        )
+        
+    finally:
+        await state.clear()
 
 def register_handlers(dp):
     dp.include_router(router)
\ No newline at end of file
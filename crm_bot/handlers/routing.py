@@ -0,0 +1,88 @@
+from aiogram import Router, types
+from aiogram.dispatcher.event.handler import HandlerObject
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State
+from typing import Any, Callable, Dict, NamedTuple, Optional, Tuple
+from keyboards.callbacks import SEPARATOR, unpack
+import logging
+
+logger = logging.getLogger(__name__)
+
+STALE_BUTTON_TEXT = "⌛ Bu tugma eskirgan, qaytadan urinib ko'ring."
+
+
+class CallbackRoute(NamedTuple):
+    handler: HandlerObject
+    # value converter (int, str, ...) or None when the data has no value
+    value_type: Optional[Callable[[str], Any]]
+    # FSM states the route is valid in; empty = any state
+    states: Tuple[str, ...]
+
+
+class CallbackTable:
+    """
+    Central prefix -> handler table for inline-button callbacks. A callback
+    is dispatched with one dict lookup on its prefix; the value after the
+    separator is converted with the route's ``value_type`` and passed to
+    the handler as ``value``. Handlers receive middleware data by name, as
+    with normal aiogram handlers.
+    """
+
+    def __init__(self):
+        self.routes: Dict[str, CallbackRoute] = {}
+
+    def route(self, prefix: str, *states: State, value_type: Optional[Callable[[str], Any]] = None):
+        def decorator(func):
+            if prefix in self.routes:
+                existing = self.routes[prefix].handler.callback
+                raise ValueError(f"Callback prefix {prefix!r} is handled by both {existing.__qualname__} and {func.__qualname__}")
+            self.routes[prefix] = CallbackRoute(HandlerObject(callback=func), value_type, tuple(state.state for state in states))
+            return func
+        return decorator
+
+    def check(self, root: Router) -> None:
+        """Fail at startup if routing could be ambiguous"""
+        for prefix in self.routes:
+            if not prefix or SEPARATOR in prefix:
+                raise ValueError(f"Callback prefix {prefix!r} must be non-empty and must not contain {SEPARATOR!r}")
+        # Any filter-based callback handler next to the table would compete with it
+        pending = [root]
+        while pending:
+            current = pending.pop()
+            pending.extend(current.sub_routers)
+            for handler in current.callback_query.handlers:
+                if handler.callback is not dispatch_callback:
+                    raise ValueError(
+                        f"Callback handler {handler.callback.__qualname__} in router {current.name!r} "
+                        "bypasses the callback routing table"
+                    )
+        logger.info(f"Callback routing table: {len(self.routes)} prefixes")
+
+
+callback_routes = CallbackTable()
+
+router = Router(name="callbacks")
+
+
+@router.callback_query()
+async def dispatch_callback(callback: types.CallbackQuery, state: Optional[FSMContext] = None, **data: Any) -> Any:
+    prefix, raw_value = unpack(callback.data or "")
+    route = callback_routes.routes.get(prefix)
+    if route is None:
+        # Buttons of old messages may use a retired format
+        await callback.answer(STALE_BUTTON_TEXT)
+        return
+
+    if route.states and (state is None or await state.get_state() not in route.states):
+        await callback.answer(STALE_BUTTON_TEXT)
+        return
+
+    value = None
+    if route.value_type is not None:
+        try:
+            value = route.value_type(raw_value)
+        except (TypeError, ValueError):
+            await callback.answer("❌ Noto'g'ri ma'lumot")
+            return
+
+    return await route.handler.call(callback, state=state, value=value, **data)
@@ -1,19 +1,19 @@
 from aiogram import Router, types, F
-from aiogram.types import BufferedInputFile, InlineKeyboardButton, InlineKeyboardMarkup
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 from aiogram.fsm.context import FSMContext
+from sqlalchemy.ext.asyncio import AsyncSession
 from aiogram.filters import Command
 from states import SellerStates, EditSellerStates, SearchSellerStates
-from sqlalchemy import select
 from database.crud import (
     generate_sellers_excel, 
     get_all_sellers_with_details, 
     update_seller,
     add_seller_to_db,
     get_seller_by_id_or_passport,
+    get_seller_by_passport,
     delete_seller
 )
 from database.models import Seller
-from database.utils import async_session
 from config import Config
 from datetime import datetime
 from keyboards.types import (
@@ -23,6 +23,14 @@ from keyboards.types import (
     BACK_TO_MAIN_MENU_BTN, SEARCH_BY_ID_BTN, SEARCH_BY_PASSPORT_BTN
 )
 from keyboards.builders import main_menu, back_to_main_menu
+from keyboards.callbacks import (
+    pack, CANCEL_EDIT, CANCEL_DELETE,
+    SELLER_SEARCH, SELLER_EDIT, SELLER_FIELD,
+    SELLER_DELETE, SELLER_DELETE_CONFIRM
+)
+from handlers.common import handle_back_to_main_menu
+from handlers.routing import callback_routes
+from utilities.export_cache import answer_with_export
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 import re
 
@@ -48,17 +56,11 @@ def format_seller_info(seller: Seller) -> str:
 def create_seller_edit_buttons(seller_id: int):
     builder = InlineKeyboardBuilder()
     builder.row(
-        InlineKeyboardButton(text="✏️ Tahrirlash", callback_data=f"edit_seller_{seller_id}"),
-        InlineKeyboardButton(text="🗑️ O'chirish", callback_data=f"delete_seller_{seller_id}")
+        InlineKeyboardButton(text="✏️ Tahrirlash", callback_data=pack(SELLER_EDIT, seller_id)),
+        InlineKeyboardButton(text="🗑️ O'chirish", callback_data=pack(SELLER_DELETE, seller_id))
     )
     return builder.as_markup()
 
-# Common back to main menu handler
-@router.message(F.text == BACK_TO_MAIN_MENU_BTN)
-async def handle_back_to_main_menu(message: types.Message, state: FSMContext):
-    await state.clear()
-    await message.answer("Asosiy menyu:", reply_markup=main_menu)
-
 # Start adding new seller
 @router.message(F.from_user.id.in_(Config.ALLOWED_USERS), F.text == "📝 Yangi sotuvchi")
 async def start_add_seller(message: types.Message, state: FSMContext):
@@ -105,7 +107,7 @@ async def process_seller_phone(message: types.Message, state: FSMContext):
 
 # Process seller passport
 @router.message(SellerStates.PASSPORT)
-async def process_seller_passport(message: types.Message, state: FSMContext):
+async def process_seller_passport(message: types.Message, state: FSMContext, session: AsyncSession):
     if message.text == BACK_TO_MAIN_MENU_BTN:
         await handle_back_to_main_menu(message, state)
         return
@@ -120,11 +122,7 @@ async def process_seller_passport(message: types.Message, state: FSMContext):
         return
     
     # Check if passport already exists
-    async with async_session() as session:
-        result = await session.execute(
-            select(Seller).where(Seller.passport_serial == passport)
-        )
-        existing_seller = result.scalar_one_or_none()
+    existing_seller = await get_seller_by_passport(passport, session=session)
     
     if existing_seller:
         await message.answer(
@@ -164,7 +162,7 @@ async def process_seller_salary(message: types.Message, state: FSMContext):
 
 # Process seller start date
 @router.message(SellerStates.START_DATE)
-async def process_seller_start_date(message: types.Message, state: FSMContext):
+async def process_seller_start_date(message: types.Message, state: FSMContext, session: AsyncSession):
     if message.text == BACK_TO_MAIN_MENU_BTN:
         await handle_back_to_main_menu(message, state)
         return
@@ -175,7 +173,7 @@ async def process_seller_start_date(message: types.Message, state: FSMContext):
         data = await state.get_data()
         
         # Add seller to database
-        success = await add_seller_to_db(data)
+        success = await add_seller_to_db(data, session=session)
         
         if success:
             await message.answer(
@@ -196,24 +194,14 @@ async def process_seller_start_date(message: types.Message, state: FSMContext):
 
 # Send sellers list as Excel
 @router.message(F.text == "📋 Sotuvchilar ro'yxati")
-async def send_sellers_excel(message: types.Message):
-    excel_buffer = await generate_sellers_excel()
-    
-    if not excel_buffer:
-        await message.answer(
-            "❌ Sotuvchilar topilmadi yoki xatolik yuz berdi",
-            reply_markup=back_to_main_menu()
-        )
-        return
-    
-    filename = f"sellers_{datetime.now().strftime('%Y-%m-%d')}.xlsx"
-    
-    await message.answer_document(
-        document=BufferedInputFile(
-            file=excel_buffer.read(),
-            filename=filename
-        ),
-        caption="📋 Barcha sotuvchilar ro'yxati"
+async def send_sellers_excel(message: types.Message, session: AsyncSession):
+    await answer_with_export(
+        message, session,
+        report="sellers",
+        build_export=generate_sellers_excel,
+        filename_prefix="sellers",
+        caption="📋 Barcha sotuvchilar ro'yxati",
+        empty_text="❌ Sotuvchilar topilmadi yoki xatolik yuz berdi"
     )
 
 # Start seller search
@@ -222,16 +210,16 @@ async def start_search_seller(message: types.Message, state: FSMContext):
     await message.answer(
         "Qanday usulda qidirmoqchisiz?",
         reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text=SEARCH_BY_ID_BTN, callback_data="search_by_id")],
-            [InlineKeyboardButton(text=SEARCH_BY_PASSPORT_BTN, callback_data="search_by_passport")]
+            [InlineKeyboardButton(text=SEARCH_BY_ID_BTN, callback_data=pack(SELLER_SEARCH, "id"))],
+            [InlineKeyboardButton(text=SEARCH_BY_PASSPORT_BTN, callback_data=pack(SELLER_SEARCH, "passport"))]
         ])
     )
     await state.set_state(SearchSellerStates.SELECT_SEARCH_METHOD)
 
 # Handle search method selection
-@router.callback_query(SearchSellerStates.SELECT_SEARCH_METHOD)
-async def handle_search_method(callback: types.CallbackQuery, state: FSMContext):
-    search_type = callback.data.split("_")[-1]
+@callback_routes.route(SELLER_SEARCH, SearchSellerStates.SELECT_SEARCH_METHOD, value_type=str)
+async def handle_search_method(callback: types.CallbackQuery, state: FSMContext, value: str):
+    search_type = value
     await state.update_data(search_type=search_type)
     
     if search_type == "id":
@@ -250,7 +238,7 @@ async def handle_search_method(callback: types.CallbackQuery, state: FSMContext)
 
 # Process search query
 @router.message(SearchSellerStates.ENTER_SEARCH_QUERY)
-async def process_search_query(message: types.Message, state: FSMContext):
+async def process_search_query(message: types.Message, state: FSMContext, session: AsyncSession):
     if message.text == BACK_TO_MAIN_MENU_BTN:
         await handle_back_to_main_menu(message, state)
         return
@@ -261,7 +249,7 @@ async def process_search_query(message: types.Message, state: FSMContext):
     try:
         if search_type == "id":
             seller_id = int(message.text)
-            seller = await get_seller_by_id_or_passport(seller_id=seller_id)
+            seller = await get_seller_by_id_or_passport(seller_id=seller_id, session=session)
         else:
             passport = message.text.upper()
             if not re.match(REGEX_PASSPORT, passport):
@@ -270,7 +258,7 @@ async def process_search_query(message: types.Message, state: FSMContext):
                     reply_markup=back_to_main_menu()
                 )
                 return
-            seller = await get_seller_by_id_or_passport(passport_serial=passport)
+            seller = await get_seller_by_id_or_passport(passport_serial=passport, session=session)
         
         if not seller:
             await message.answer(
@@ -294,17 +282,17 @@ async def process_search_query(message: types.Message, state: FSMContext):
         )
 
 # Edit seller handler
-@router.callback_query(F.data.startswith("edit_seller_"))
-async def edit_seller_handler(callback: types.CallbackQuery, state: FSMContext):
-    seller_id = int(callback.data.split("_")[-1])
+@callback_routes.route(SELLER_EDIT, value_type=int)
+async def edit_seller_handler(callback: types.CallbackQuery, state: FSMContext, value: int):
+    seller_id = value
     await state.update_data(seller_id=seller_id)
     
     keyboard = [
-        [InlineKeyboardButton(text=FIELD_FULL_NAME, callback_data="edit_full_name")],
-        [InlineKeyboardButton(text=FIELD_PHONE, callback_data="edit_phone")],
-        [InlineKeyboardButton(text=FIELD_SALARY, callback_data="edit_salary")],
-        [InlineKeyboardButton(text=FIELD_START_DATE, callback_data="edit_start_date")],
-        [InlineKeyboardButton(text=CANCEL_EDIT_BTN, callback_data="cancel_edit")]
+        [InlineKeyboardButton(text=FIELD_FULL_NAME, callback_data=pack(SELLER_FIELD, "full_name"))],
+        [InlineKeyboardButton(text=FIELD_PHONE, callback_data=pack(SELLER_FIELD, "phone"))],
+        [InlineKeyboardButton(text=FIELD_SALARY, callback_data=pack(SELLER_FIELD, "salary"))],
+        [InlineKeyboardButton(text=FIELD_START_DATE, callback_data=pack(SELLER_FIELD, "start_date"))],
+        [InlineKeyboardButton(text=CANCEL_EDIT_BTN, callback_data=pack(CANCEL_EDIT))]
     ]
     
     await callback.message.edit_text(
@@ -314,16 +302,16 @@ async def edit_seller_handler(callback: types.CallbackQuery, state: FSMContext):
     await state.set_state(EditSellerStates.SELECT_FIELD)
 
 # Select field to edit
-@router.callback_query(EditSellerStates.SELECT_FIELD, F.data.startswith("edit_"))
-async def select_field_to_edit(callback: types.CallbackQuery, state: FSMContext):
-    field = callback.data.replace("edit_", "")
+@callback_routes.route(SELLER_FIELD, EditSellerStates.SELECT_FIELD, value_type=str)
+async def select_field_to_edit(callback: types.CallbackQuery, state: FSMContext, session: AsyncSession, value: str):
+    field = value
     await state.update_data(edit_field=field)
     
     data = await state.get_data()
     seller_id = data['seller_id']
     
     # Get current seller info
-    seller = await get_seller_by_id_or_passport(seller_id=seller_id)
+    seller = await get_seller_by_id_or_passport(seller_id=seller_id, session=session)
     if not seller:
         await callback.answer("❌ Sotuvchi topilmadi!")
         return
@@ -333,14 +321,14 @@ async def select_field_to_edit(callback: types.CallbackQuery, state: FSMContext)
     await callback.message.edit_text(
         f"Yangi qiymatni kiriting:\nHozirgi qiymat: {current_value}",
         reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text=CANCEL_EDIT_BTN, callback_data="cancel_edit")]
+            [InlineKeyboardButton(text=CANCEL_EDIT_BTN, callback_data=pack(CANCEL_EDIT))]
         ])
     )
     await state.set_state(EditSellerStates.ENTER_NEW_VALUE)
 
 # Process new value for editing
 @router.message(EditSellerStates.ENTER_NEW_VALUE)
-async def process_new_value(message: types.Message, state: FSMContext):
+async def process_new_value(message: types.Message, state: FSMContext, session: AsyncSession):
     if message.text == BACK_TO_MAIN_MENU_BTN:
         await handle_back_to_main_menu(message, state)
         return
@@ -368,11 +356,11 @@ async def process_new_value(message: types.Message, state: FSMContext):
             db_field = 'full_name'
         
         # Update seller in database
-        success = await update_seller(seller_id, {db_field: new_value})
+        success = await update_seller(seller_id, {db_field: new_value}, session=session)
         
         if success:
             # Show updated seller info
-            seller = await get_seller_by_id_or_passport(seller_id=seller_id)
+            seller = await get_seller_by_id_or_passport(seller_id=seller_id, session=session)
             await message.answer(
                 "✅ Muvaffaqiyatli yangilandi!\n" + format_seller_info(seller),
                 reply_markup=create_seller_edit_buttons(seller.id)
@@ -397,15 +385,15 @@ async def process_new_value(message: types.Message, state: FSMContext):
         )
 
 # Delete seller handler
-@router.callback_query(F.data.startswith("delete_seller_"))
-async def delete_seller_handler(callback: types.CallbackQuery, state: FSMContext):
-    seller_id = int(callback.data.split("_")[-1])
+@callback_routes.route(SELLER_DELETE, value_type=int)
+async def delete_seller_handler(callback: types.CallbackQuery, state: FSMContext, value: int):
+    seller_id = value
     await state.update_data(seller_id=seller_id)
     
     builder = InlineKeyboardBuilder()
     builder.row(
-        InlineKeyboardButton(text="✅ Ha", callback_data=f"confirm_seller_delete_{seller_id}"),
-        InlineKeyboardButton(text="❌ Yo'q", callback_data="cancel_delete")
+        InlineKeyboardButton(text="✅ Ha", callback_data=pack(SELLER_DELETE_CONFIRM, seller_id)),
+        InlineKeyboardButton(text="❌ Yo'q", callback_data=pack(CANCEL_DELETE))
     )   
     
     await callback.message.edit_text(
@@ -414,11 +402,11 @@ async def delete_seller_handler(callback: types.CallbackQuery, state: FSMContext
     )
 
 # Confirm delete
-@router.callback_query(F.data.startswith("confirm_seller_delete_"))
-async def confirm_delete_handler(callback: types.CallbackQuery, state: FSMContext):
-    seller_id = int(callback.data.split("_")[-1])
+@callback_routes.route(SELLER_DELETE_CONFIRM, value_type=int)
+async def confirm_delete_handler(callback: types.CallbackQuery, state: FSMContext, session: AsyncSession, value: int):
+    seller_id = value
     
-    success = await delete_seller(seller_id)
+    success = await delete_seller(seller_id, session=session)
     
     if success:
         await callback.message.edit_text(f"✅ Sotuvchi #{seller_id} o'chirib tashlandi!", reply_markup=main_menu)
@@ -427,11 +415,5 @@ async def confirm_delete_handler(callback: types.CallbackQuery, state: FSMContex
     
     await state.clear()
 
-# Cancel delete
-@router.callback_query(F.data == "cancel_delete")
-async def cancel_delete_handler(callback: types.CallbackQuery, state: FSMContext):
-    await callback.message.edit_text("❌ O'chirish bekor qilindi.")
-    await state.clear()
-
 def register_handlers(dp):
     dp.include_router(router)
\ No newline at end of file
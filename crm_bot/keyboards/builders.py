@@ -10,7 +10,8 @@ from .types import (
     ADD_CONSUMPTION_BTN,
     ADD_LIST_OF_CONSUMPTION_BTN,
     VIEW_CONSUMPTION_BTN,
-    VIEW_STATISTICS_CONSUMPTION_BTN
+    VIEW_STATISTICS_CONSUMPTION_BTN,
+    MONTHLY_REPORT_BTN
 )
 
 main_menu = ReplyKeyboardMarkup(
@@ -19,9 +20,12 @@ main_menu = ReplyKeyboardMarkup(
         [KeyboardButton(text=ADD_SELLER_BTN), KeyboardButton(text=ADD_LIST_OF_SELLERS_BTN)],[KeyboardButton(text=VIEW_SELLER_BTN)],
         [KeyboardButton(text=ADD_CONSUMPTION_BTN), KeyboardButton(text=ADD_LIST_OF_CONSUMPTION_BTN)],
         [KeyboardButton(text=VIEW_CONSUMPTION_BTN), KeyboardButton(text=VIEW_STATISTICS_CONSUMPTION_BTN)],
+        [KeyboardButton(text=MONTHLY_REPORT_BTN)],
     ],
     resize_keyboard=True
 )
+# Texts of the main menu buttons (free-text state handlers must not swallow them)
+MAIN_MENU_BUTTONS = frozenset(button.text for row in main_menu.keyboard for button in row)
 
 def back_to_main_menu():
     return ReplyKeyboardMarkup(
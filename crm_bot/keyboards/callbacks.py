@@ -0,0 +1,48 @@
+from typing import Any, Optional, Tuple
+
+# Inline-button callback data is "<prefix>" or "<prefix>:<value>"; the prefix
+# alone picks the handler in handlers.routing.callback_routes
+SEPARATOR = ":"
+# Telegram rejects callback data longer than this (in bytes)
+MAX_CALLBACK_DATA = 64
+
+# Orders
+ORDER_EDIT = "order_edit"                      # order id
+ORDER_FIELD = "order_field"                    # field name
+ORDER_STATUS_EDIT = "order_status_edit"
+ORDER_STATUS_SET = "order_status_set"          # status
+ORDER_ADD_PAYMENT = "order_add_payment"        # order id
+ORDER_DELETE = "order_delete"                  # order id
+ORDER_DELETE_CONFIRM = "order_delete_confirm"  # order id
+SELLER_PAGE = "seller_page"                    # page number
+SELLER_SELECT = "seller_select"                # seller id
+MONTHLY_REPORT = "monthly_report"              # YYYY-MM
+
+# Sellers
+SELLER_SEARCH = "seller_search"                # "id" / "passport"
+SELLER_EDIT = "seller_edit"                    # seller id
+SELLER_FIELD = "seller_field"                  # field name
+SELLER_DELETE = "seller_delete"                # seller id
+SELLER_DELETE_CONFIRM = "seller_delete_confirm"  # seller id
+
+# Consumptions
+CONSUMPTION_EDIT = "consumption_edit"          # consumption id
+CONSUMPTION_FIELD = "consumption_field"        # field name
+CONSUMPTION_DELETE = "consumption_delete"      # consumption id
+CONSUMPTION_DELETE_CONFIRM = "consumption_delete_confirm"  # consumption id
+
+# Shared
+CANCEL_EDIT = "cancel_edit"
+CANCEL_DELETE = "cancel_delete"
+
+
+def pack(prefix: str, value: Any = None) -> str:
+    data = prefix if value is None else f"{prefix}{SEPARATOR}{value}"
+    if len(data.encode()) > MAX_CALLBACK_DATA:
+        raise ValueError(f"Callback data is longer than {MAX_CALLBACK_DATA} bytes: {data!r}")
+    return data
+
+
+def unpack(data: str) -> Tuple[str, Optional[str]]:
+    prefix, separator, value = data.partition(SEPARATOR)
+    return prefix, value if separator else None
@@ -0,0 +1,53 @@
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional, Tuple
+from database.cache import MISSING, seller_picker_cache
+from database.crud import get_seller_choices
+from keyboards.callbacks import pack, SELLER_PAGE, SELLER_SELECT
+
+SELLERS_PER_PAGE = 10
+
+def _render_pages(sellers) -> List[InlineKeyboardMarkup]:
+    page_count = (len(sellers) + SELLERS_PER_PAGE - 1) // SELLERS_PER_PAGE
+    pages = []
+    for page in range(page_count):
+        builder = InlineKeyboardBuilder()
+        chunk = sellers[page * SELLERS_PER_PAGE:(page + 1) * SELLERS_PER_PAGE]
+        for seller in chunk:
+            builder.row(InlineKeyboardButton(
+                text=f"{seller.full_name} - {seller.passport_serial}",
+                callback_data=pack(SELLER_SELECT, seller.id)
+            ))
+        if page_count > 1:
+            navigation = []
+            if page > 0:
+                navigation.append(InlineKeyboardButton(text="⬅️", callback_data=pack(SELLER_PAGE, page - 1)))
+            navigation.append(InlineKeyboardButton(text=f"{page + 1}/{page_count}", callback_data=pack(SELLER_PAGE, page)))
+            if page < page_count - 1:
+                navigation.append(InlineKeyboardButton(text="➡️", callback_data=pack(SELLER_PAGE, page + 1)))
+            builder.row(*navigation)
+        pages.append(builder.as_markup())
+    return pages
+
+async def get_seller_picker_page(
+    page: int = 0,
+    name_prefix: Optional[str] = None,
+    session: AsyncSession = None
+) -> Optional[Tuple[InlineKeyboardMarkup, int, int]]:
+    """
+    Return (keyboard, page, page_count) for the seller picker, or None if no
+    seller matches. Pages are rendered once per name prefix and served from
+    the cache until sellers change.
+    """
+    cache_key = (name_prefix or "").strip().lower()
+    pages = seller_picker_cache.get(cache_key)
+    if pages is MISSING:
+        sellers = await get_seller_choices(cache_key or None, session=session)
+        pages = _render_pages(sellers)
+        seller_picker_cache.set(cache_key, pages)
+
+    if not pages:
+        return None
+    page = min(max(page, 0), len(pages) - 1)
+    return pages[page], page, len(pages)
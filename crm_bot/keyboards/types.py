@@ -8,6 +8,7 @@ VIEW_ORDER_BTN = "👁 Buyurtmani ko'rish"
 VIEW_SELLER_BTN = "👁 Sotuvchini ko'rish"
 VIEW_CONSUMPTION_BTN = "👁 Xarajatni ko'rish"
 VIEW_STATISTICS_CONSUMPTION_BTN = '📊 Xarajatlar statistikasi'
+MONTHLY_REPORT_BTN = "📊 Oylik hisobot"
 CANCEL_EDIT_BTN = "❌ Bekor qilish"
 FIELD_ITEM_COUNT = "Mahsulot soni"
 FIELD_TOTAL_SUM = "Umumiy summa"
@@ -1,12 +1,27 @@
+import time
+# Startup timing starts before the (heavy) imports below
+STARTED = time.perf_counter()
 import logging
 import asyncio
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.exceptions import TelegramAPIError
 from config import Config
 from database.database import init_db
-from handlers import clients, sellers, orders, consumptions
-from utilities.scheduler import setup_scheduler  # Changed from on_startup
+from database.fsm_storage import create_fsm_storage
+from database.utils import connect_db, dispose_engine, log_db_stats
+from database.leader import LeaderElector
+from utilities.workers import report_pool
+from utilities.notifications import run_outbox_drainer
+from utilities.webhook import run_webhook
+from utilities.update_queue import OrderedDispatcher, log_update_stats
+from handlers import common, routing, clients, sellers, orders, consumptions
+from utilities.scheduler import build_scheduler
 from middleware.access import AccessMiddleware
+from middleware.db_session import DbSessionMiddleware
+from middleware.fsm_buffer import FsmBufferMiddleware
+from middleware.throttling import ThrottlingMiddleware
+from utilities.startup import FirstPollMiddleware, StartupTimer
+IMPORTED = time.perf_counter()
 
 async def main():
     # Настройка логирования
@@ -15,29 +30,76 @@ async def main():
         format="%(asctime)s - %(levelname)s - %(name)s - %(message)s"
     )
     
-    # Инициализация БД
+    timer = StartupTimer(STARTED)
+    timer.mark("imports", IMPORTED)
+    
+    # Инициализация БД: DDL only when the schema fingerprint changed
+    await connect_db()
+    timer.mark("db_connect")
     await init_db()
+    timer.mark("schema")
     
     # Создание экземпляра бота
     bot = Bot(token=Config.BOT_TOKEN)
-    dp = Dispatcher(storage=MemoryStorage())
+    # The breakdown is logged when the first getUpdates/setWebhook goes out
+    bot.session.middleware(FirstPollMiddleware(timer))
+    if Config.ORDERED_UPDATES:
+        # Each chat's updates run one after another, different chats in parallel
+        dp = OrderedDispatcher(storage=create_fsm_storage())
+    else:
+        dp = Dispatcher(storage=create_fsm_storage())
     
     # Регистрация хэндлеров
+    dp.include_router(common.router)
+    # All inline-button callbacks go through one prefix -> handler table
+    dp.include_router(routing.router)
     dp.include_router(clients.router)
     dp.include_router(sellers.router)
     dp.include_router(orders.router)
     dp.include_router(consumptions.router)
+    routing.callback_routes.check(dp)
     # Регистрация middleware
     dp.update.middleware(AccessMiddleware())
+    throttling = ThrottlingMiddleware()
+    dp.update.middleware(throttling)
+    # One FSM data read and at most one write per update
+    fsm_buffer = FsmBufferMiddleware()
+    dp.update.middleware(fsm_buffer)
+    dp.update.middleware(DbSessionMiddleware())
+    timer.mark("routers")
     
-    # Запуск бота и планировщика
-    await bot.delete_webhook(drop_pending_updates=True)
     logging.info("Бот успешно запущен")
     
-    # Start the scheduler as a background task
-    asyncio.create_task(setup_scheduler(bot))
+    # Background tasks are kept referenced and cancelled on shutdown
+    scheduler = build_scheduler()
+    leader_tasks = lambda: [scheduler.run(bot), run_outbox_drainer(bot)]
+    if Config.LEADER_ELECTION:
+        # Only the instance holding the advisory lock runs scheduled jobs
+        background_tasks = [asyncio.create_task(LeaderElector().run(leader_tasks))]
+    else:
+        background_tasks = [asyncio.create_task(coro) for coro in leader_tasks()]
+    if Config.DB_STATS_INTERVAL > 0:
+        background_tasks.append(asyncio.create_task(log_db_stats(Config.DB_STATS_INTERVAL)))
+        background_tasks.append(asyncio.create_task(log_update_stats(dp, Config.DB_STATS_INTERVAL, throttling, fsm_buffer)))
     
-    await dp.start_polling(bot)
+    # Запуск бота: webhook, если задан WEBHOOK_URL, иначе (или при ошибке) polling
+    try:
+        if Config.WEBHOOK_URL:
+            try:
+                await run_webhook(dp, bot)
+            except (OSError, TelegramAPIError) as e:
+                logging.error(f"Webhook mode failed ({e}), falling back to polling")
+        # Pending updates are kept: nothing sent while the bot was down is lost
+        await bot.delete_webhook(drop_pending_updates=False)
+        await dp.start_polling(bot)
+    finally:
+        for task in background_tasks:
+            task.cancel()
+        await asyncio.gather(*background_tasks, return_exceptions=True)
+        report_pool.shutdown()
+        # Buffered FSM writes go out before the engine is disposed
+        await dp.storage.close()
+        await dispose_engine()
 
 if __name__ == '__main__':
     try:
@@ -0,0 +1,27 @@
+from aiogram import BaseMiddleware, types
+from typing import Callable, Awaitable, Dict, Any
+from database.utils import async_session
+
+class DbSessionMiddleware(BaseMiddleware):
+    """
+    Opens one AsyncSession per update and passes it to handlers as ``session``.
+    The connection is only checked out on the first statement, and the whole
+    update is committed (or rolled back) once when the handler returns.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[types.TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: types.TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        async with async_session() as session:
+            data["session"] = session
+            try:
+                result = await handler(event, data)
+            except Exception:
+                await session.rollback()
+                raise
+            if session.in_transaction():
+                await session.commit()
+            return result
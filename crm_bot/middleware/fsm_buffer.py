@@ -0,0 +1,118 @@
+from aiogram import BaseMiddleware, types
+from aiogram.fsm.context import FSMContext
+from typing import Callable, Awaitable, Dict, Any, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class BufferedFSMContext(FSMContext):
+    """
+    FSMContext that loads the data at most once per update, serves every
+    read from memory and writes state/data back once in ``flush()``.
+    ``requested`` counts the storage operations the handler would have
+    made (update_data = get + set), ``performed`` the ones really made.
+    """
+
+    def __init__(self, context: FSMContext, raw_state: Optional[str]):
+        super().__init__(bot=context.bot, storage=context.storage, key=context.key)
+        # The FSM middleware has already read the state for this update
+        self._state = raw_state
+        self._state_dirty = False
+        self._data: Optional[Dict[str, Any]] = None
+        self._data_dirty = False
+        self.requested = 0
+        self.performed = 0
+
+    async def _load_data(self) -> Dict[str, Any]:
+        if self._data is None:
+            self._data = dict(await self.storage.get_data(bot=self.bot, key=self.key))
+            self.performed += 1
+        return self._data
+
+    async def set_state(self, state=None) -> None:
+        self.requested += 1
+        self._state = state.state if hasattr(state, "state") else state
+        self._state_dirty = True
+
+    async def get_state(self) -> Optional[str]:
+        self.requested += 1
+        return self._state
+
+    async def set_data(self, data: Dict[str, Any]) -> None:
+        self.requested += 1
+        self._data = dict(data)
+        self._data_dirty = True
+
+    async def get_data(self) -> Dict[str, Any]:
+        self.requested += 1
+        return dict(await self._load_data())
+
+    async def update_data(self, data: Optional[Dict[str, Any]] = None, **kwargs: Any) -> Dict[str, Any]:
+        self.requested += 2
+        if data:
+            kwargs.update(data)
+        current = await self._load_data()
+        current.update(kwargs)
+        self._data_dirty = True
+        return dict(current)
+
+    async def flush(self) -> None:
+        if self._state_dirty:
+            await self.storage.set_state(bot=self.bot, key=self.key, state=self._state)
+            self.performed += 1
+            self._state_dirty = False
+        if self._data_dirty:
+            await self.storage.set_data(bot=self.bot, key=self.key, data=self._data)
+            self.performed += 1
+            self._data_dirty = False
+
+    @property
+    def saved(self) -> int:
+        return self.requested - self.performed
+
+
+class FsmBufferMiddleware(BaseMiddleware):
+    """
+    Replaces the update's ``state`` with a BufferedFSMContext and flushes it
+    once when the handler returns (also on errors, as unbuffered writes
+    would already have been stored by then).
+    """
+
+    def __init__(self):
+        self.updates = 0
+        self.requested = 0
+        self.performed = 0
+
+    async def __call__(
+        self,
+        handler: Callable[[types.TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: types.TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        context = data.get("state")
+        if context is None:
+            return await handler(event, data)
+
+        buffered = BufferedFSMContext(context, data.get("raw_state"))
+        data["state"] = buffered
+        try:
+            return await handler(event, data)
+        finally:
+            await buffered.flush()
+            self.updates += 1
+            self.requested += buffered.requested
+            self.performed += buffered.performed
+            if buffered.requested:
+                logger.debug(
+                    f"FSM {buffered.key.chat_id}/{buffered.key.user_id}: {buffered.requested} operations "
+                    f"-> {buffered.performed} storage calls ({buffered.saved} saved)"
+                )
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "updates": self.updates,
+            "requested": self.requested,
+            "performed": self.performed,
+            "saved": self.requested - self.performed,
+        }
@@ -0,0 +1,154 @@
+from aiogram import BaseMiddleware, types
+from typing import Callable, Awaitable, Dict, Any, Optional, Tuple
+from config import Config
+from keyboards.types import (
+    ADD_LIST_OF_ORDERS_BTN,
+    ADD_LIST_OF_SELLERS_BTN,
+    ADD_LIST_OF_CONSUMPTION_BTN,
+    VIEW_STATISTICS_CONSUMPTION_BTN
+)
+from utilities.rate_limit import TokenBucket
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+BUSY_TEXT = "⏳ Bot hozir band, birozdan keyin qayta urinib ko'ring."
+SLOW_DOWN_TEXT = "⏳ Juda tez! Iltimos, biroz kuting."
+# How often buckets that refilled to capacity are dropped (seconds)
+SWEEP_INTERVAL = 60
+
+# Excel exports and statistics load Postgres and openpyxl: own, tighter budget
+EXPENSIVE_ACTIONS = {
+    ADD_LIST_OF_ORDERS_BTN: "orders_export",
+    ADD_LIST_OF_SELLERS_BTN: "sellers_export",
+    ADD_LIST_OF_CONSUMPTION_BTN: "consumptions_export",
+    VIEW_STATISTICS_CONSUMPTION_BTN: "consumption_stats",
+}
+
+
+def _event_action(update: types.Update) -> Tuple[Optional[types.TelegramObject], str]:
+    if update.message is not None:
+        return update.message, EXPENSIVE_ACTIONS.get(update.message.text, "default")
+    if update.callback_query is not None:
+        return update.callback_query, "default"
+    return None, "default"
+
+
+async def _reply(event: Optional[types.TelegramObject], text: str) -> None:
+    try:
+        if isinstance(event, (types.Message, types.CallbackQuery)):
+            await event.answer(text)
+    except Exception as e:
+        logger.debug(f"Could not send throttling reply: {e}")
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """
+    Per-user token buckets in front of the handlers: every update costs a
+    token from the user's general bucket, and expensive actions also from
+    a separate per-user, per-action bucket. Throttled updates get a short
+    reply (at most once per empty bucket) and never reach a handler. When
+    ``max_in_flight`` handlers are already running, or the dispatcher marked
+    the update ``overloaded``, the user gets a "busy" answer instead.
+    """
+
+    def __init__(
+        self,
+        rate: float = Config.THROTTLE_RATE,
+        burst: float = Config.THROTTLE_BURST,
+        expensive_rate: float = Config.THROTTLE_EXPENSIVE_RATE,
+        expensive_burst: float = Config.THROTTLE_EXPENSIVE_BURST,
+        max_in_flight: int = Config.THROTTLE_MAX_IN_FLIGHT
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.expensive_rate = expensive_rate
+        self.expensive_burst = expensive_burst
+        self.max_in_flight = max_in_flight
+        self._buckets: Dict[Tuple[int, str], TokenBucket] = {}
+        # users already told to slow down until their bucket refills
+        self._warned: set = set()
+        self._swept_at = time.monotonic()
+        self.in_flight = 0
+        self.shed = 0
+        self.counters: Dict[str, Dict[str, int]] = {}
+
+    def _bucket(self, user_id: int, action: str) -> TokenBucket:
+        bucket = self._buckets.get((user_id, action))
+        if bucket is None:
+            if action == "default":
+                bucket = TokenBucket(self.rate, self.burst)
+            else:
+                bucket = TokenBucket(self.expensive_rate, self.expensive_burst)
+            self._buckets[(user_id, action)] = bucket
+        return bucket
+
+    def _count(self, action: str, outcome: str) -> None:
+        counters = self.counters.setdefault(action, {"allowed": 0, "throttled": 0})
+        counters[outcome] += 1
+
+    def _sweep(self) -> None:
+        # A full bucket behaves exactly like a new one: forget it (and its warning)
+        now = time.monotonic()
+        if now - self._swept_at < SWEEP_INTERVAL:
+            return
+        self._swept_at = now
+        for key in [key for key, bucket in self._buckets.items() if bucket.full()]:
+            del self._buckets[key]
+            self._warned.discard(key)
+
+    def _allow(self, user_id: int, action: str) -> bool:
+        self._sweep()
+        buckets = [self._bucket(user_id, "default")]
+        if action != "default":
+            buckets.append(self._bucket(user_id, action))
+        # Take tokens only when every bucket has one, so a throttled
+        # export does not also eat the user's general budget
+        if not all(bucket.available() for bucket in buckets):
+            return False
+        for bucket in buckets:
+            bucket.try_acquire()
+        return True
+
+    async def __call__(
+        self,
+        handler: Callable[[types.TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: types.TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is None or not isinstance(event, types.Update):
+            return await handler(event, data)
+        target, action = _event_action(event)
+
+        if data.get("overloaded") or (self.max_in_flight > 0 and self.in_flight >= self.max_in_flight):
+            self.shed += 1
+            await _reply(target, BUSY_TEXT)
+            return
+
+        if not self._allow(user.id, action):
+            self._count(action, "throttled")
+            # A message is sent once per empty bucket; callback answers are
+            # only toasts and also stop the button's loading spinner
+            if (user.id, action) not in self._warned or isinstance(target, types.CallbackQuery):
+                self._warned.add((user.id, action))
+                logger.info(f"Throttled user {user.id} on {action}")
+                await _reply(target, SLOW_DOWN_TEXT)
+            return
+        self._warned.discard((user.id, action))
+        self._count(action, "allowed")
+
+        self.in_flight += 1
+        try:
+            return await handler(event, data)
+        finally:
+            self.in_flight -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self.in_flight,
+            "shed": self.shed,
+            "buckets": len(self._buckets),
+            "actions": self.counters,
+        }
@@ -0,0 +1,82 @@
+"""
+Unit tests run without a database or Telegram. Tests marked ``postgres``
+need a scratch database: set TEST_DATABASE_URL (postgresql+asyncpg://...)
+to run them, otherwise they are skipped.
+
+Run from crm_bot/:  python -m pytest -q
+"""
+from contextlib import asynccontextmanager
+from sqlalchemy.dialects import postgresql
+from config import Config
+import asyncio
+import os
+import pytest
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "postgres: needs TEST_DATABASE_URL (a scratch PostgreSQL database)")
+
+
+def pytest_collection_modifyitems(config, items):
+    if TEST_DATABASE_URL:
+        return
+    skip = pytest.mark.skip(reason="TEST_DATABASE_URL is not set")
+    for item in items:
+        if "postgres" in item.keywords:
+            item.add_marker(skip)
+
+
+def compile_pg(statement) -> str:
+    """SQL of a statement as PostgreSQL would get it (values inlined as parameters)"""
+    return str(statement.compile(dialect=postgresql.dialect()))
+
+
+class RecordingSession:
+    """
+    Stands in for the update's AsyncSession: records the statements passed
+    to execute() and answers each with the next queued result.
+    """
+
+    def __init__(self, *results):
+        self.statements = []
+        self.results = list(results)
+        self.flushed = 0
+        self.savepoints = 0
+
+    async def execute(self, statement, *args, **kwargs):
+        self.statements.append(statement)
+        return self.results.pop(0) if self.results else None
+
+    async def flush(self):
+        self.flushed += 1
+
+    @asynccontextmanager
+    async def begin_nested(self):
+        self.savepoints += 1
+        yield
+
+
+@pytest.fixture
+def run_db(monkeypatch):
+    """
+    Run a coroutine function against TEST_DATABASE_URL with the schema
+    created; the engine is disposed in the same event loop.
+    """
+    from database.database import init_db
+    from database.utils import dispose_engine
+
+    monkeypatch.setattr(Config, "DATABASE_URL", TEST_DATABASE_URL)
+    monkeypatch.setattr(Config, "SCHEMA_FORCE_SYNC", True)
+
+    def run(test):
+        async def main():
+            await dispose_engine()
+            try:
+                await init_db()
+                return await test()
+            finally:
+                await dispose_engine()
+        return asyncio.run(main())
+    return run
@@ -0,0 +1,88 @@
+from types import SimpleNamespace
+import asyncio
+import pytest
+from database import cache
+from database.cache import MISSING, TTLCache, invalidate_seller, seller_cache
+from database.crud import update_seller
+from tests.conftest import RecordingSession
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    return now
+
+
+@pytest.fixture(autouse=True)
+def empty_seller_cache():
+    seller_cache.clear()
+    yield
+    seller_cache.clear()
+
+
+def test_miss_returns_sentinel_not_none():
+    lookups = TTLCache("t", 10, 60)
+    assert lookups.get("a") is MISSING
+    lookups.set("a", None)
+    assert lookups.get("a") is None
+    assert lookups.stats()["hits"] == 1
+    assert lookups.stats()["misses"] == 1
+
+
+def test_entries_expire_after_ttl(clock):
+    lookups = TTLCache("t", 10, 60)
+    lookups.set("a", 1)
+    clock[0] += 59
+    assert lookups.get("a") == 1
+    clock[0] += 2
+    assert lookups.get("a") is MISSING
+    assert lookups.stats()["size"] == 0
+
+
+def test_least_recently_used_is_evicted():
+    lookups = TTLCache("t", 2, 60)
+    lookups.set("a", 1)
+    lookups.set("b", 2)
+    lookups.get("a")  # "b" is now the least recently used
+    lookups.set("c", 3)
+    assert lookups.get("b") is MISSING
+    assert lookups.get("a") == 1
+    assert lookups.get("c") == 3
+    assert lookups.stats()["evictions"] == 1
+
+
+def test_zero_size_disables_the_cache():
+    lookups = TTLCache("t", 0, 60)
+    lookups.set("a", 1)
+    assert lookups.get("a") is MISSING
+
+
+def test_invalidate_seller_drops_every_key_of_the_seller():
+    seller = SimpleNamespace(id=7, passport_serial="AA1")
+    seller_cache.set(("id", 7), seller)
+    seller_cache.set(("passport", "AA1"), seller)
+    seller_cache.set(("passport", "BB2"), None)
+    invalidate_seller(seller_id=7)
+    assert seller_cache.get(("id", 7)) is MISSING
+    assert seller_cache.get(("passport", "AA1")) is MISSING
+    assert seller_cache.get(("passport", "BB2")) is None
+
+
+class _Passports:
+    def __init__(self, old, new):
+        self.row = (old, new)
+
+    def one_or_none(self):
+        return self.row
+
+
+def test_update_seller_forgets_cached_miss_for_new_passport():
+    # "BB2" was looked up before it belonged to anyone
+    seller_cache.set(("passport", "BB2"), None)
+    seller_cache.set(("passport", "AA1"), SimpleNamespace(id=7, passport_serial="AA1"))
+    session = RecordingSession(_Passports("AA1", "BB2"))
+    assert asyncio.run(update_seller(7, {"passport": "BB2"}, session=session))
+    assert seller_cache.get(("passport", "BB2")) is MISSING
+    assert seller_cache.get(("passport", "AA1")) is MISSING
+    assert session.savepoints == 1
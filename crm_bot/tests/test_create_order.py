@@ -0,0 +1,112 @@
+from datetime import date, datetime
+from types import SimpleNamespace
+import asyncio
+import uuid
+import pytest
+from sqlalchemy.dialects import postgresql
+from database.crud import add_client_to_db, add_seller_to_db, create_order
+from database.rollup import get_month_rollup
+from tests.conftest import RecordingSession, compile_pg
+
+
+class _OneRow:
+    def __init__(self, row):
+        self.row = row
+
+    def one(self):
+        return self.row
+
+
+def _create(values, row=None):
+    session = RecordingSession(_OneRow(row or SimpleNamespace(order_id=1)))
+    order = asyncio.run(create_order(values, session=session))
+    return order, session
+
+
+ORDER = {
+    "client_id": 1,
+    "seller_id": 2,
+    "item_count": 3,
+    "sum_of_item": 900,
+    "prepaid": 300,
+    "every_month_should_pay": 100,
+    "created_at": datetime(2026, 3, 15, 12, 0),
+}
+
+
+def test_order_seller_and_rollup_are_one_statement():
+    order, session = _create(dict(ORDER))
+    assert order.order_id == 1
+    assert len(session.statements) == 1
+    sql = compile_pg(session.statements[0])
+    assert "INSERT INTO orders" in sql
+    assert "UPDATE sellers" in sql
+    assert "INSERT INTO monthly_order_rollup" in sql
+    assert "ON CONFLICT (month) DO UPDATE" in sql
+
+
+def test_rollup_is_fed_from_the_inserted_row():
+    _, session = _create(dict(ORDER))
+    sql = compile_pg(session.statements[0])
+    rollup_part = sql[sql.index("INSERT INTO monthly_order_rollup"):]
+    assert "FROM new_order" in rollup_part
+    assert "date_trunc" in rollup_part
+
+
+def _inserted_order(session) -> dict:
+    """Column -> literal of the orders INSERT in the recorded statement"""
+    sql = str(session.statements[0].compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+    insert = sql[sql.index("INSERT INTO orders (") + len("INSERT INTO orders ("):]
+    columns, rest = insert.split(") VALUES (", 1)
+    values = rest.split(") RETURNING", 1)[0]
+    return dict(zip(columns.split(", "), values.split(", ")))
+
+
+def test_opening_balance_is_inserted():
+    _, session = _create(dict(ORDER))
+    order = _inserted_order(session)
+    assert order["total_paid"] == "300"
+    assert order["remaining_amount"] == "600"
+    assert order["order_status"] == "'Ochiq'"
+    assert order["next_notification_at"].startswith("'2026-04-14")
+
+
+def test_fully_prepaid_order_is_created_closed():
+    _, session = _create({**ORDER, "prepaid": 900})
+    order = _inserted_order(session)
+    assert order["remaining_amount"] == "0"
+    assert order["order_status"] == "'Yopilgan'"
+    assert order["next_notification_at"] == "NULL"
+
+
+@pytest.mark.postgres
+def test_create_order_updates_seller_counter_and_rollup(run_db):
+    async def scenario():
+        suffix = uuid.uuid4().hex[:8]
+        seller = await add_seller_to_db({
+            "full_name": f"Test seller {suffix}",
+            "phone": "998900000000",
+            "passport_serial": f"S{suffix}",
+            "started_job_at": date(2026, 1, 1),
+        })
+        client = await add_client_to_db({
+            "full_name": f"Test client {suffix}",
+            "phone": "998900000001",
+            "passport_serial": f"C{suffix}",
+            "latitude": 41.3,
+            "longitude": 69.2,
+        })
+        month = date(2026, 3, 1)
+        before = await get_month_rollup(month)
+        before_count = before.order_count if before else 0
+        before_open = before.open_count if before else 0
+
+        order = await create_order({**ORDER, "client_id": client.id, "seller_id": seller.id})
+        after = await get_month_rollup(month)
+        return order, after, before_count, before_open
+
+    order, after, before_count, before_open = run_db(scenario)
+    assert order.seller_order_counter == 1
+    assert order.client_name.startswith("Test client")
+    assert after.order_count == before_count + 1
+    assert after.open_count == before_open + 1
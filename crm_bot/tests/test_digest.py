@@ -0,0 +1,51 @@
+from types import SimpleNamespace
+from utilities.notifications import MAX_MESSAGE_LENGTH, _text_length, build_digest_messages
+
+
+def _entry(outbox_id, order_id, seller="Vali", due="2026-04-01", name="Ali"):
+    return SimpleNamespace(id=outbox_id, payload={
+        "order_id": order_id, "client_name": name, "client_phone": "998901112233",
+        "seller_name": seller, "remaining_amount": 600000, "due_date": due,
+    })
+
+
+def test_text_length_counts_utf16_code_units():
+    assert _text_length("abc") == 3
+    assert _text_length("⚠️") == 2  # sign + variation selector
+    assert _text_length("😀") == 2  # outside the BMP: a surrogate pair
+
+
+def test_small_digest_is_one_message_grouped_by_seller():
+    entries = [_entry(1, 10, seller="B"), _entry(2, 11, seller="A"), _entry(3, 12, seller="B")]
+    messages = list(build_digest_messages(entries, "seller", chat_id=5))
+    assert len(messages) == 1
+    message = messages[0]
+    assert message.chat_id == 5
+    assert sorted(message.ids) == [1, 2, 3]
+    assert message.text.index("Sotuvchi: A") < message.text.index("Sotuvchi: B")
+
+
+def test_group_by_due_date():
+    entries = [_entry(1, 10, due="2026-04-02"), _entry(2, 11, due="2026-04-01")]
+    text = list(build_digest_messages(entries, "date", chat_id=5))[0].text
+    assert text.index("Muddat: 2026-04-01") < text.index("Muddat: 2026-04-02")
+
+
+def test_long_digest_is_split_within_the_utf16_limit():
+    # Emoji names: under the limit in Python characters, over it in UTF-16 units
+    entries = [_entry(i, i, name="😀" * 40) for i in range(1, 200)]
+    messages = list(build_digest_messages(entries, "seller", chat_id=5))
+    assert len(messages) > 1
+    assert all(_text_length(message.text) <= MAX_MESSAGE_LENGTH for message in messages)
+    # Split on UTF-16 length: counted in characters the first message had room left
+    assert len(messages[0].text) < MAX_MESSAGE_LENGTH - 1000 < _text_length(messages[0].text)
+    ids = [outbox_id for message in messages for outbox_id in message.ids]
+    assert sorted(ids) == list(range(1, 200))
+    assert all("Sotuvchi: Vali (davomi)" in message.text for message in messages[1:])
+
+
+def test_every_order_line_goes_with_its_outbox_id():
+    entries = [_entry(i, 100 + i, name="x" * 300) for i in range(1, 40)]
+    for message in build_digest_messages(entries, "seller", chat_id=5):
+        for outbox_id in message.ids:
+            assert f"#{100 + outbox_id} " in message.text
@@ -0,0 +1,88 @@
+from datetime import datetime
+from types import SimpleNamespace
+import asyncio
+import os
+from openpyxl import load_workbook
+from openpyxl.worksheet._writer import ALL_TEMP_FILES
+from database import crud
+from utilities.excel import StreamingExcelWriter
+
+
+def _order(order_id):
+    return SimpleNamespace(
+        order_id=order_id, order_status="Ochiq", created_at=datetime(2026, 3, 1, 9, 30),
+        client_name="Ali", client_phone="998901112233", client_passport="AB1234567",
+        client_latitude=41.3, client_longitude=69.2, seller_name="Vali",
+        item_count=1, sum_of_item=900, every_month_should_pay=100, prepaid=300,
+        total_paid=300, remaining_amount=600
+    )
+
+
+def test_writer_streams_batches_into_one_sheet():
+    writer = StreamingExcelWriter("Orders", ["ID", "Name"])
+    writer.append_rows([[1, "a"], [2, "b"]])
+    writer.append_rows([[3, "a much longer value"]])
+    output = writer.close()
+    sheet = load_workbook(output).active
+    assert [row for row in sheet.iter_rows(values_only=True)] == [
+        ("ID", "Name"), (1, "a"), (2, "b"), (3, "a much longer value")
+    ]
+    assert writer.row_count == 3
+    # Widths come from the header and the first batch only
+    assert sheet.column_dimensions["B"].width == (len("Name") + 2) * 1.2
+
+
+def test_discard_removes_the_temp_file():
+    writer = StreamingExcelWriter("Orders", ["ID"])
+    writer.append_rows([[1]])
+    temp_files = list(ALL_TEMP_FILES)
+    assert temp_files and all(os.path.exists(path) for path in temp_files)
+    writer.discard()
+    assert not any(os.path.exists(path) for path in temp_files)
+
+
+def test_discard_after_close_is_a_no_op():
+    writer = StreamingExcelWriter("Orders", ["ID"])
+    writer.append_rows([[1]])
+    output = writer.close()
+    writer.discard()
+    assert load_workbook(output).active.max_row == 2
+
+
+def _stream(batches, closed):
+    async def stream(session=None):
+        try:
+            for batch in batches:
+                yield batch
+        finally:
+            closed.append(True)
+    return stream
+
+
+def test_orders_export(monkeypatch):
+    closed = []
+    monkeypatch.setattr(crud, "stream_all_orders_with_details", _stream([[_order(1), _order(2)], [_order(3)]], closed))
+    output = asyncio.run(crud.generate_orders_excel())
+    rows = list(load_workbook(output).active.iter_rows(values_only=True))
+    assert rows[0] == tuple(crud.ORDERS_EXCEL_HEADERS)
+    assert [row[0] for row in rows[1:]] == [1, 2, 3]
+    assert closed == [True]
+
+
+def test_empty_orders_export_returns_none(monkeypatch):
+    monkeypatch.setattr(crud, "stream_all_orders_with_details", _stream([], []))
+    assert asyncio.run(crud.generate_orders_excel()) is None
+
+
+def test_failed_export_closes_the_stream_and_logs(monkeypatch, caplog):
+    closed = []
+    broken = SimpleNamespace(order_id=1)  # no other columns: building its row fails
+    monkeypatch.setattr(crud, "stream_all_orders_with_details", _stream([[broken], [_order(2)]], closed))
+
+    async def export():
+        result = await crud.generate_orders_excel()
+        # Closed on the way out, not later by the loop's async generator cleanup
+        return result, list(closed)
+
+    assert asyncio.run(export()) == (None, [True])
+    assert "Orders export failed" in caplog.text
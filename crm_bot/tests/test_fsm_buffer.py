@@ -0,0 +1,120 @@
+import asyncio
+import pytest
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from middleware.fsm_buffer import BufferedFSMContext, FsmBufferMiddleware
+
+KEY = StorageKey(bot_id=1, chat_id=2, user_id=3)
+
+
+class Form(StatesGroup):
+    name = State()
+    phone = State()
+
+
+class CountingStorage(MemoryStorage):
+    """MemoryStorage that counts the calls made to it"""
+
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+
+    async def set_state(self, bot, key, state=None):
+        self.calls.append("set_state")
+        await super().set_state(bot, key, state)
+
+    async def get_state(self, bot, key):
+        self.calls.append("get_state")
+        return await super().get_state(bot, key)
+
+    async def set_data(self, bot, key, data):
+        self.calls.append("set_data")
+        await super().set_data(bot, key, data)
+
+    async def get_data(self, bot, key):
+        self.calls.append("get_data")
+        return await super().get_data(bot, key)
+
+
+@pytest.fixture
+def storage():
+    return CountingStorage()
+
+
+def _context(storage):
+    return FSMContext(bot=None, storage=storage, key=KEY)
+
+
+def test_handler_operations_collapse_to_one_read_and_writes(storage):
+    async def main():
+        await storage.set_data(None, KEY, {"name": "Ali"})
+        storage.calls.clear()
+        buffered = BufferedFSMContext(_context(storage), "Form:name")
+        assert await buffered.get_state() == "Form:name"
+        await buffered.update_data(phone="998900000000")
+        await buffered.update_data({"step": 2})
+        await buffered.set_state(Form.phone)
+        data = await buffered.get_data()
+        before_flush = list(storage.calls)
+        await buffered.flush()
+        return buffered, data, before_flush
+
+    buffered, data, before_flush = asyncio.run(main())
+    assert data == {"name": "Ali", "phone": "998900000000", "step": 2}
+    assert before_flush == ["get_data"]
+    assert storage.calls == ["get_data", "set_state", "set_data"]
+    # get_state + 2 * update_data (get + set) + set_state + get_data
+    assert (buffered.requested, buffered.performed, buffered.saved) == (7, 3, 4)
+    assert asyncio.run(storage.get_state(None, KEY)) == "Form:phone"
+
+
+def test_set_data_needs_no_read(storage):
+    async def main():
+        buffered = BufferedFSMContext(_context(storage), None)
+        await buffered.set_data({"a": 1})
+        assert await buffered.get_data() == {"a": 1}
+        await buffered.flush()
+        await buffered.flush()
+        return buffered
+
+    buffered = asyncio.run(main())
+    assert storage.calls == ["set_data"]
+    assert (buffered.requested, buffered.performed) == (2, 1)
+
+
+def test_returned_data_is_a_copy(storage):
+    async def main():
+        buffered = BufferedFSMContext(_context(storage), None)
+        data = await buffered.get_data()
+        data["leak"] = True
+        return await buffered.get_data(), buffered
+
+    data, buffered = asyncio.run(main())
+    assert data == {}
+    asyncio.run(buffered.flush())
+    assert "set_data" not in storage.calls
+
+
+def test_middleware_flushes_on_error_and_counts(storage):
+    middleware = FsmBufferMiddleware()
+
+    async def handler(event, data):
+        await data["state"].set_state(Form.name)
+        raise RuntimeError("handler failed")
+
+    async def reader(event, data):
+        return await data["state"].get_state()
+
+    async def main():
+        with pytest.raises(RuntimeError):
+            await middleware(handler, object(), {"state": _context(storage), "raw_state": None})
+        state = await middleware(reader, object(), {"state": _context(storage), "raw_state": "Form:name"})
+        no_state = await middleware(lambda event, data: asyncio.sleep(0, "plain"), object(), {})
+        return state, no_state
+
+    state, no_state = asyncio.run(main())
+    assert (state, no_state) == ("Form:name", "plain")
+    assert storage.calls == ["set_state"]
+    assert middleware.stats() == {"updates": 2, "requested": 2, "performed": 1, "saved": 1}
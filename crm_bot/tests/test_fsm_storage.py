@@ -0,0 +1,105 @@
+from contextlib import asynccontextmanager
+from datetime import date, datetime
+from decimal import Decimal
+import asyncio
+import json
+import pytest
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.fsm.storage.base import StorageKey
+from database import fsm_storage
+from database.fsm_storage import PostgresStorage, decode_fsm_data, encode_fsm_data
+from tests.conftest import RecordingSession, compile_pg
+
+KEY = StorageKey(bot_id=1, chat_id=2, user_id=3)
+
+
+class Form(StatesGroup):
+    amount = State()
+
+
+def test_codec_round_trips_through_json():
+    data = {
+        "created_at": datetime(2026, 3, 1, 9, 30, 15),
+        "started": date(2026, 1, 2),
+        "amount": Decimal("12.50"),
+        "nested": {"items": [1, "a", date(2026, 2, 3)], "none": None},
+    }
+    assert decode_fsm_data(json.loads(json.dumps(encode_fsm_data(data)))) == data
+
+
+def test_codec_normalises_to_json_shapes():
+    # Tuples come back as lists and keys as strings, like plain JSON
+    encoded = encode_fsm_data({5: (1, 2)})
+    assert decode_fsm_data(json.loads(json.dumps(encoded))) == {"5": [1, 2]}
+
+
+def test_codec_keeps_types():
+    decoded = decode_fsm_data(json.loads(json.dumps(encode_fsm_data({
+        "when": datetime(2026, 3, 1, 9, 30), "day": date(2026, 3, 1), "sum": Decimal("1.10")
+    }))))
+    assert type(decoded["when"]) is datetime
+    assert type(decoded["day"]) is date
+    assert decoded["sum"] == Decimal("1.10") and isinstance(decoded["sum"], Decimal)
+
+
+@pytest.fixture
+def upserts(monkeypatch):
+    written = []
+
+    async def upsert(self, entries):
+        written.append({key: dict(entry) for key, entry in entries.items()})
+
+    monkeypatch.setattr(PostgresStorage, "_upsert", upsert)
+    return written
+
+
+def test_write_through_stores_before_returning(upserts):
+    async def main():
+        storage = PostgresStorage(flush_delay=0)
+        await storage.set_state(None, KEY, Form.amount)
+        stored_after_set = len(upserts)
+        await storage.set_data(None, KEY, {"a": 1})
+        return storage, stored_after_set
+
+    storage, stored_after_set = asyncio.run(main())
+    assert stored_after_set == 1
+    assert upserts == [{(1, 2, 3, "default"): {"state": "Form:amount"}}, {(1, 2, 3, "default"): {"data": {"a": 1}}}]
+    assert storage.flushes == 2
+
+
+def test_write_behind_buffers_and_serves_reads(upserts):
+    async def main():
+        storage = PostgresStorage(flush_delay=60)
+        await storage.set_state(None, KEY, Form.amount)
+        await storage.set_data(None, KEY, {"a": 1})
+        state, data = await storage.get_state(None, KEY), await storage.get_data(None, KEY)
+        buffered = len(upserts)
+        await storage.close()
+        return state, data, buffered
+
+    state, data, buffered = asyncio.run(main())
+    assert (state, data, buffered) == ("Form:amount", {"a": 1}, 0)
+    # One upsert with both fields on close()
+    assert upserts == [{(1, 2, 3, "default"): {"state": "Form:amount", "data": {"a": 1}}}]
+
+
+def test_upsert_only_overwrites_written_fields(monkeypatch):
+    session = RecordingSession()
+
+    @asynccontextmanager
+    async def scope(*args, **kwargs):
+        yield session
+
+    monkeypatch.setattr(fsm_storage, "session_scope", scope)
+    storage = PostgresStorage(flush_delay=0)
+    asyncio.run(storage._upsert({
+        (1, 2, 3, "default"): {"state": None},
+        (1, 4, 4, "default"): {"state": "Form:amount", "data": {"when": date(2026, 3, 1)}},
+    }))
+    sql = [compile_pg(statement) for statement in session.statements]
+    assert len(sql) == 2
+    state_only = next(s for s in sql if "data" not in s.split("DO UPDATE SET")[1])
+    assert "state = excluded.state" in state_only
+    params = [statement.compile().params for statement in session.statements]
+    encoded = {"when": {"__fsm_type__": "date", "value": "2026-03-01"}}
+    assert any(encoded in p.values() for p in params)
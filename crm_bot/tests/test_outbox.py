@@ -0,0 +1,95 @@
+from contextlib import asynccontextmanager
+from datetime import timedelta
+import asyncio
+import uuid
+import pytest
+from sqlalchemy import select
+from config import Config
+from database.models import NotificationOutbox
+from database.utils import session_scope
+from utilities import outbox
+from utilities.notifications import outbox_claim_size
+from tests.conftest import RecordingSession, compile_pg
+
+
+@pytest.mark.parametrize("rate, lease, batch, expected", [
+    (20, 300, 200, 50),     # 20/min for half of 5 min
+    (20, 300, 30, 30),      # OUTBOX_BATCH_SIZE is the upper bound
+    (600, 300, 200, 200),
+    (1, 60, 200, 1),        # never less than one row
+])
+def test_claim_size_fits_half_a_lease(monkeypatch, rate, lease, batch, expected):
+    monkeypatch.setattr(Config, "NOTIFY_CHAT_RATE_PER_MIN", rate)
+    monkeypatch.setattr(Config, "OUTBOX_LEASE", lease)
+    monkeypatch.setattr(Config, "OUTBOX_BATCH_SIZE", batch)
+    assert outbox_claim_size() == expected
+
+
+class _Rows:
+    def all(self):
+        return []
+
+
+@pytest.fixture
+def recorded(monkeypatch):
+    session = RecordingSession(_Rows())
+
+    @asynccontextmanager
+    async def scope(*args, **kwargs):
+        yield session
+
+    monkeypatch.setattr(outbox, "session_scope", scope)
+    return session
+
+
+def test_claim_leases_with_the_database_clock(recorded):
+    asyncio.run(outbox.claim_pending(10))
+    sql = compile_pg(recorded.statements[0])
+    assert "FOR UPDATE SKIP LOCKED" in sql
+    assert "next_attempt_at <= now()" in sql
+    assert "next_attempt_at=(now() +" in sql
+
+
+def test_failure_backs_off_exponentially_up_to_a_cap(recorded):
+    asyncio.run(outbox.mark_failed([1, 2], "boom"))
+    sql = compile_pg(recorded.statements[0])
+    assert "least(" in sql and "power(" in sql
+    assert "attempts=(notification_outbox.attempts +" in sql
+    params = recorded.statements[0].compile().params
+    assert timedelta(seconds=Config.OUTBOX_BACKOFF_BASE) in params.values()
+    assert timedelta(seconds=Config.OUTBOX_BACKOFF_MAX) in params.values()
+    assert Config.OUTBOX_MAX_ATTEMPTS in params.values()
+
+
+@pytest.mark.postgres
+def test_claim_fail_and_deliver(run_db):
+    async def scenario():
+        key = f"test:{uuid.uuid4().hex}"
+        async with session_scope() as session:
+            await outbox.enqueue(session, [{"kind": "report", "dedup_key": key, "chat_id": "1", "payload": {"text": "t"}}])
+            # Enqueueing the same key again is a no-op
+            assert await outbox.enqueue(session, [{"kind": "report", "dedup_key": key, "chat_id": "1", "payload": {}}]) == 0
+
+        claimed = [row for row in await outbox.claim_pending(1000) if row.payload == {"text": "t"}]
+        assert len(claimed) == 1
+        row_id = claimed[0].id
+        # Leased: not claimable again until the lease runs out
+        assert row_id not in [row.id for row in await outbox.claim_pending(1000)]
+
+        await outbox.mark_failed([row_id], "boom")
+        async with session_scope() as session:
+            row = await session.get(NotificationOutbox, row_id)
+            assert (row.status, row.attempts, row.last_error) == ("pending", 1, "boom")
+            delay = await session.scalar(
+                select(NotificationOutbox.next_attempt_at - NotificationOutbox.created_at)
+                .where(NotificationOutbox.id == row_id)
+            )
+            assert delay >= timedelta(seconds=Config.OUTBOX_BACKOFF_BASE)
+
+        async with session_scope() as session:
+            await outbox.mark_delivered(session, [row_id])
+        async with session_scope() as session:
+            row = await session.get(NotificationOutbox, row_id)
+            assert row.status == "delivered" and row.delivered_at is not None
+
+    run_db(scenario)
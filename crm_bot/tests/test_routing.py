@@ -0,0 +1,128 @@
+import asyncio
+import pytest
+from aiogram import Router
+from aiogram.fsm.state import State, StatesGroup
+from handlers import common, consumptions, orders, routing, sellers  # noqa: F401 (register their routes)
+from handlers.routing import STALE_BUTTON_TEXT, CallbackTable, dispatch_callback
+from keyboards.callbacks import MAX_CALLBACK_DATA, pack, unpack
+
+
+class Form(StatesGroup):
+    editing = State()
+
+
+class FakeCallback:
+    def __init__(self, data):
+        self.data = data
+        self.answers = []
+
+    async def answer(self, text=None, **kwargs):
+        self.answers.append(text)
+
+
+class FakeState:
+    def __init__(self, state):
+        self.state = state
+
+    async def get_state(self):
+        return self.state
+
+
+def test_pack_and_unpack():
+    assert pack("order_edit", 15) == "order_edit:15"
+    assert pack("cancel_edit") == "cancel_edit"
+    assert unpack("order_edit:15") == ("order_edit", "15")
+    assert unpack("cancel_edit") == ("cancel_edit", None)
+    assert unpack("monthly_report:2026-03:x") == ("monthly_report", "2026-03:x")
+    assert unpack("order_edit:") == ("order_edit", "")
+
+
+def test_pack_rejects_data_over_telegram_limit():
+    pack("p", "x" * (MAX_CALLBACK_DATA - 2))
+    with pytest.raises(ValueError):
+        pack("p", "x" * (MAX_CALLBACK_DATA - 1))
+    # The limit is in bytes, not characters
+    with pytest.raises(ValueError):
+        pack("p", "ш" * 32)
+
+
+def test_duplicate_prefix_is_rejected():
+    table = CallbackTable()
+
+    @table.route("edit")
+    async def first(callback):
+        pass
+
+    with pytest.raises(ValueError, match="first"):
+        @table.route("edit")
+        async def second(callback):
+            pass
+
+
+@pytest.mark.parametrize("prefix", ["", "order:edit"])
+def test_check_rejects_bad_prefixes(prefix):
+    table = CallbackTable()
+    table.route(prefix)(lambda callback: None)
+    with pytest.raises(ValueError, match="must be non-empty"):
+        table.check(Router())
+
+
+def test_check_rejects_callback_handlers_outside_the_table():
+    root, child = Router(name="root"), Router(name="child")
+    root.include_router(child)
+    root.callback_query.register(dispatch_callback)
+    CallbackTable().check(root)
+
+    @child.callback_query()
+    async def legacy(callback):
+        pass
+
+    with pytest.raises(ValueError, match="legacy"):
+        CallbackTable().check(root)
+
+
+def test_registered_prefixes_are_valid():
+    assert routing.callback_routes.routes
+    routing.callback_routes.check(Router())
+
+
+@pytest.fixture
+def table(monkeypatch):
+    table = CallbackTable()
+    monkeypatch.setattr(routing, "callback_routes", table)
+    return table
+
+
+def _dispatch(data, state=None, **kwargs):
+    callback = FakeCallback(data)
+    result = asyncio.run(dispatch_callback(callback, state=state, **kwargs))
+    return callback, result
+
+
+def test_unknown_prefix_gets_stale_answer(table):
+    callback, result = _dispatch("retired:1")
+    assert result is None
+    assert callback.answers == [STALE_BUTTON_TEXT]
+
+
+def test_route_limited_to_states(table):
+    @table.route("save", Form.editing)
+    async def save(callback, state):
+        return "saved"
+
+    assert _dispatch("save")[0].answers == [STALE_BUTTON_TEXT]
+    assert _dispatch("save", FakeState(None))[0].answers == [STALE_BUTTON_TEXT]
+    callback, result = _dispatch("save", FakeState("Form:editing"))
+    assert (callback.answers, result) == ([], "saved")
+
+
+def test_value_is_converted_and_passed(table):
+    @table.route("order_edit", value_type=int)
+    async def edit(callback, value, session):
+        return value, session
+
+    assert _dispatch("order_edit:15", session="db", unused="x")[1] == (15, "db")
+    for data in ("order_edit:abc", "order_edit"):
+        callback, result = _dispatch(data, session="db")
+        assert result is None
+        assert callback.answers == ["❌ Noto'g'ri ma'lumot"]
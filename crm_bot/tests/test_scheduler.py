@@ -0,0 +1,121 @@
+from datetime import datetime
+from zoneinfo import ZoneInfo
+import asyncio
+import pytest
+from utilities import scheduler
+from utilities.scheduler import CronSpec, Scheduler
+
+TZ = ZoneInfo("Asia/Tashkent")
+
+
+def at(*args):
+    return datetime(*args, tzinfo=TZ)
+
+
+@pytest.mark.parametrize("spec, now, expected", [
+    ("0 10 * * *", at(2026, 3, 1, 9, 0), at(2026, 3, 1, 10, 0)),
+    ("0 10 * * *", at(2026, 3, 1, 10, 0), at(2026, 3, 2, 10, 0)),    # strictly after
+    ("*/15 * * * *", at(2026, 3, 1, 9, 7, 30), at(2026, 3, 1, 9, 15)),
+    ("0 9 1 * *", at(2026, 1, 31, 12, 0), at(2026, 2, 1, 9, 0)),
+    ("0 9 31 * *", at(2026, 2, 1, 0, 0), at(2026, 3, 31, 9, 0)),     # skips short months
+    ("30 8 * * 1-5", at(2026, 3, 6, 9, 0), at(2026, 3, 9, 8, 30)),   # Friday -> Monday
+    ("0 0 * * 0", at(2026, 3, 2, 0, 0), at(2026, 3, 8, 0, 0)),       # 0 = Sunday
+    ("0 0 * * 7", at(2026, 3, 2, 0, 0), at(2026, 3, 8, 0, 0)),       # 7 = Sunday too
+    ("0 0 29 2 *", at(2026, 3, 1, 0, 0), at(2028, 2, 29, 0, 0)),
+])
+def test_next_after(spec, now, expected):
+    assert CronSpec(spec).next_after(now) == expected
+
+
+def test_restricted_day_fields_match_either():
+    # 13th of the month or any Friday
+    spec = CronSpec("0 12 13 * 5")
+    assert spec.next_after(at(2026, 3, 1, 0, 0)) == at(2026, 3, 6, 12, 0)
+    assert spec.next_after(at(2026, 3, 12, 13, 0)) == at(2026, 3, 13, 12, 0)
+
+
+def test_ranges_lists_and_steps():
+    spec = CronSpec("0,30 8-18/5 * * *")
+    assert spec.minutes == {0, 30}
+    assert spec.hours == {8, 13, 18}
+
+
+@pytest.mark.parametrize("spec", ["* * * *", "60 * * * *", "* 24 * * *", "5-1 * * * *", "0 0 31 2 *"])
+def test_invalid_specs_are_rejected(spec):
+    with pytest.raises(ValueError):
+        CronSpec(spec).next_after(at(2026, 1, 1, 0, 0))
+
+
+class Recorder:
+    def __init__(self, recorded=None):
+        self.recorded = recorded or {}
+        self.runs = []
+
+    async def load(self, names):
+        return {name: run for name, run in self.recorded.items() if name in names}
+
+    async def record(self, name, last_run, next_run, status=None, duration=None, attempted=None):
+        self.runs.append((name, last_run, next_run, status, attempted))
+
+
+@pytest.fixture
+def recorder(monkeypatch):
+    recorder = Recorder()
+    monkeypatch.setattr(scheduler, "load_job_runs", recorder.load)
+    monkeypatch.setattr(scheduler, "record_job_run", recorder.record)
+    return recorder
+
+
+def _scheduler(now, job_result=None):
+    calls = []
+
+    async def job(bot):
+        calls.append(bot)
+        if isinstance(job_result, Exception):
+            raise job_result
+        return job_result
+
+    sched = Scheduler("Asia/Tashkent")
+    sched.now = lambda: now
+    sched.add_job("daily", "0 10 * * *", job)
+    return sched, calls
+
+
+def test_missed_run_is_caught_up_once(recorder):
+    recorder.recorded["daily"] = at(2026, 3, 1, 10, 0)
+    now = at(2026, 3, 4, 8, 0)  # runs of the 2nd and 3rd were missed
+    sched, _ = _scheduler(now)
+    asyncio.run(sched._load_state())
+    assert sched.jobs["daily"].next_run == now
+
+
+def test_no_catch_up_when_nothing_was_missed(recorder):
+    recorder.recorded["daily"] = at(2026, 3, 3, 10, 0)
+    sched, _ = _scheduler(at(2026, 3, 4, 8, 0))
+    asyncio.run(sched._load_state())
+    assert sched.jobs["daily"].next_run == at(2026, 3, 4, 10, 0)
+
+
+def test_first_start_waits_for_the_schedule(recorder):
+    sched, _ = _scheduler(at(2026, 3, 4, 8, 0))
+    asyncio.run(sched._load_state())
+    assert sched.jobs["daily"].next_run == at(2026, 3, 4, 10, 0)
+
+
+@pytest.mark.parametrize("result, status", [
+    (None, "ok"),
+    (True, "ok"),
+    (False, "error"),               # job logged its own failure
+    (RuntimeError("boom"), "error"),
+])
+def test_only_successful_runs_advance_last_run(recorder, result, status):
+    now = at(2026, 3, 4, 10, 0)
+    sched, calls = _scheduler(now, result)
+    job = sched.jobs["daily"]
+    job.next_run = at(2026, 3, 5, 10, 0)
+    asyncio.run(sched._run_job(job, bot="bot"))
+    assert calls == ["bot"]
+    name, last_run, _, recorded_status, attempted = recorder.runs[-1]
+    assert recorded_status == status
+    assert attempted == now
+    assert last_run == (now if status == "ok" else None)
@@ -0,0 +1,113 @@
+import asyncio
+import pytest
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.methods import SendMessage
+from config import Config
+from utilities import rate_limit
+from utilities.rate_limit import TokenBucket
+from utilities.sender import NotificationSender, OutgoingMessage
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(rate_limit.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_bucket_starts_full_and_refills_at_rate(clock):
+    bucket = TokenBucket(rate=2, capacity=3)
+    assert [bucket.try_acquire() for _ in range(4)] == [True, True, True, False]
+    clock[0] += 0.5
+    assert bucket.try_acquire()
+    assert not bucket.try_acquire()
+    clock[0] += 100
+    assert bucket.tokens <= bucket.capacity
+    assert bucket.try_acquire(3)
+
+
+def test_pause_hands_out_nothing_until_it_ends(clock):
+    bucket = TokenBucket(rate=10, capacity=10)
+    bucket.pause(5)
+    clock[0] += 4.9
+    assert not bucket.try_acquire()
+    clock[0] += 0.2
+    assert bucket.try_acquire()
+
+
+def test_acquire_waits_for_a_token():
+    async def main():
+        bucket = TokenBucket(rate=50, capacity=1)
+        await bucket.acquire()
+        started = asyncio.get_running_loop().time()
+        await bucket.acquire()
+        return asyncio.get_running_loop().time() - started
+
+    assert asyncio.run(main()) >= 0.015
+
+
+class FakeBot:
+    """Records send_message calls; ``errors`` are raised by the first calls"""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.sent = []
+
+    async def send_message(self, chat_id, text):
+        if self.errors:
+            raise self.errors.pop(0)
+        self.sent.append((chat_id, text))
+
+
+@pytest.fixture(autouse=True)
+def fast_limits(monkeypatch):
+    monkeypatch.setattr(Config, "NOTIFY_GLOBAL_RATE", 1000.0)
+    monkeypatch.setattr(Config, "NOTIFY_CHAT_RATE_PER_MIN", 60000.0)
+
+
+def _send(bot, messages, **kwargs):
+    delivered, failed = [], []
+
+    async def on_delivered(ids):
+        delivered.append(list(ids))
+
+    async def on_failed(ids, error):
+        failed.append((list(ids), error))
+
+    sender = NotificationSender(bot, on_delivered=on_delivered, on_failed=on_failed, **kwargs)
+    result = asyncio.run(sender.send_all(messages))
+    return sender, result, delivered, failed
+
+
+def test_delivered_ids_are_reported_in_batches():
+    bot = FakeBot()
+    messages = [OutgoingMessage(1, f"m{i}", (i,)) for i in range(5)]
+    sender, result, delivered, failed = _send(bot, messages, concurrency=1, batch_size=2)
+    assert result == (5, 0)
+    assert delivered == [[0, 1], [2, 3], [4]]
+    assert [text for _, text in bot.sent] == ["m0", "m1", "m2", "m3", "m4"]
+    assert failed == []
+
+
+def test_batch_size_one_reports_every_send():
+    bot = FakeBot()
+    messages = [OutgoingMessage(1, "m", (i,)) for i in range(3)]
+    _, _, delivered, _ = _send(bot, messages, concurrency=1, batch_size=1)
+    assert delivered == [[0], [1], [2]]
+
+
+def test_retry_after_is_retried():
+    bot = FakeBot(TelegramRetryAfter(SendMessage(chat_id=1, text="m"), "flood", 0))
+    sender, result, delivered, failed = _send(bot, [OutgoingMessage(1, "m", (7,))])
+    assert result == (1, 0)
+    assert sender.retried == 1
+    assert delivered == [[7]]
+
+
+def test_other_errors_are_reported_as_failed():
+    bot = FakeBot(TelegramBadRequest(SendMessage(chat_id=1, text="m"), "chat not found"))
+    sender, result, delivered, failed = _send(bot, [OutgoingMessage(1, "m", (7, 8))])
+    assert result == (0, 1)
+    assert delivered == []
+    assert failed[0][0] == [7, 8]
+    assert "chat not found" in failed[0][1]
@@ -0,0 +1,111 @@
+from datetime import datetime
+import asyncio
+import time
+import pytest
+from aiogram.types import Chat, Message, Update, User
+from keyboards.types import ADD_LIST_OF_ORDERS_BTN
+from middleware import throttling
+from middleware.throttling import BUSY_TEXT, SLOW_DOWN_TEXT, ThrottlingMiddleware
+from utilities.rate_limit import TokenBucket
+
+USER = User(id=7, is_bot=False, first_name="Ali")
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def replies(monkeypatch):
+    sent = []
+
+    async def reply(event, text):
+        sent.append(text)
+
+    monkeypatch.setattr(throttling, "_reply", reply)
+    return sent
+
+
+def _update(text):
+    message = Message(message_id=1, date=datetime(2026, 3, 1), chat=Chat(id=7, type="private"), from_user=USER, text=text)
+    return Update(update_id=1, message=message)
+
+
+def _feed(middleware, *texts, **data):
+    handled = []
+
+    async def handler(event, data):
+        handled.append(event.message.text)
+
+    async def main():
+        for text in texts:
+            await middleware(handler, _update(text), {"event_from_user": USER, **data})
+
+    asyncio.run(main())
+    return handled
+
+
+def test_available_and_full_take_nothing(clock):
+    bucket = TokenBucket(rate=1, capacity=2)
+    assert bucket.full() and bucket.available(2)
+    assert bucket.tokens == 2
+    bucket.try_acquire()
+    assert not bucket.full() and bucket.available() and not bucket.available(2)
+    clock[0] += 1
+    assert bucket.full()
+
+
+def test_throttled_export_does_not_drain_the_default_bucket(clock):
+    middleware = ThrottlingMiddleware(rate=1, burst=5, expensive_rate=0.01, expensive_burst=1)
+    assert middleware._allow(USER.id, "orders_export")
+    for _ in range(10):
+        assert not middleware._allow(USER.id, "orders_export")
+    # Only the allowed export took a default token
+    assert middleware._bucket(USER.id, "default").tokens == 4
+
+
+def test_empty_default_bucket_blocks_exports_without_using_their_token(clock):
+    middleware = ThrottlingMiddleware(rate=0.01, burst=1, expensive_rate=0.01, expensive_burst=1)
+    assert middleware._allow(USER.id, "default")
+    assert not middleware._allow(USER.id, "orders_export")
+    assert middleware._bucket(USER.id, "orders_export").full()
+
+
+def test_sweep_drops_full_buckets_and_their_warnings(clock, monkeypatch):
+    monkeypatch.setattr(throttling, "SWEEP_INTERVAL", 10)
+    middleware = ThrottlingMiddleware(rate=1, burst=1, expensive_rate=0.01, expensive_burst=1)
+    middleware._allow(1, "orders_export")
+    middleware._allow(2, "default")
+    middleware._warned.update({(1, "orders_export"), (2, "default")})
+    clock[0] += 10
+    middleware._sweep()
+    # The default buckets refilled; user 1's export bucket is still empty
+    assert set(middleware._buckets) == {(1, "orders_export")}
+    assert middleware._warned == {(1, "orders_export")}
+
+
+def test_throttled_user_is_warned_once(clock, replies):
+    middleware = ThrottlingMiddleware(rate=0.01, burst=2, expensive_rate=0.01, expensive_burst=1)
+    handled = _feed(middleware, "a", "b", "c", "d")
+    assert handled == ["a", "b"]
+    assert replies == [SLOW_DOWN_TEXT]
+    assert middleware.counters["default"] == {"allowed": 2, "throttled": 2}
+
+
+def test_expensive_actions_have_their_own_budget(clock, replies):
+    middleware = ThrottlingMiddleware(rate=1, burst=10, expensive_rate=0.01, expensive_burst=1)
+    handled = _feed(middleware, ADD_LIST_OF_ORDERS_BTN, ADD_LIST_OF_ORDERS_BTN, "a")
+    assert handled == [ADD_LIST_OF_ORDERS_BTN, "a"]
+    assert middleware.counters["orders_export"] == {"allowed": 1, "throttled": 1}
+    assert middleware.stats()["buckets"] == 2
+
+
+def test_overloaded_updates_get_busy_reply(clock, replies):
+    middleware = ThrottlingMiddleware()
+    assert _feed(middleware, "a", overloaded=True) == []
+    assert replies == [BUSY_TEXT]
+    assert middleware.stats()["shed"] == 1
+    assert middleware.stats()["buckets"] == 0
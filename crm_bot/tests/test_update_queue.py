@@ -0,0 +1,104 @@
+from datetime import datetime
+import asyncio
+from aiogram.types import CallbackQuery, Chat, Message, Update, User
+from utilities import update_queue
+from utilities.update_queue import ChatQueues, update_chat_id
+
+USER = User(id=7, is_bot=False, first_name="Ali")
+CHAT = Chat(id=-100, type="supergroup")
+
+
+def test_jobs_of_a_chat_run_in_order_and_one_at_a_time():
+    queues = ChatQueues(concurrency=4)
+    log = []
+
+    def job(chat_id, n):
+        async def run():
+            log.append(("start", chat_id, n))
+            await asyncio.sleep(0.01 if n == 0 else 0)
+            log.append(("end", chat_id, n))
+            return n
+        return run
+
+    async def main():
+        return await asyncio.gather(*(queues.run(chat_id, job(chat_id, n)) for n in range(3) for chat_id in (1, 2)))
+
+    assert asyncio.run(main()) == [0, 0, 1, 1, 2, 2]
+    for chat_id in (1, 2):
+        events = [(kind, n) for kind, chat, n in log if chat == chat_id]
+        assert events == [("start", 0), ("end", 0), ("start", 1), ("end", 1), ("start", 2), ("end", 2)]
+    # Both chats started before either finished its first job
+    assert log[:2] == [("start", 1, 0), ("start", 2, 0)]
+    assert queues.stats()["chats"][1]["processed"] == 3
+    assert (queues.running, queues.waiting, queues.depth(1)) == (0, 0, 0)
+    assert queues._locks == {}
+
+
+def test_concurrency_cap_across_chats():
+    queues = ChatQueues(concurrency=2)
+    running = peak = 0
+
+    async def job():
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+
+    async def main():
+        await asyncio.gather(*(queues.run(chat_id, job) for chat_id in range(6)), queues.run(None, job))
+
+    asyncio.run(main())
+    assert peak == 2
+
+
+def test_overloaded_once_backlog_reaches_max_waiting():
+    queues = ChatQueues(concurrency=1, max_waiting=2)
+    release = None
+
+    async def blocker():
+        await release.wait()
+
+    async def main():
+        nonlocal release
+        release = asyncio.Event()
+        tasks = [asyncio.create_task(queues.run(1, blocker))]
+        await asyncio.sleep(0)
+        states = [queues.overloaded()]
+        tasks += [asyncio.create_task(queues.run(chat_id, blocker)) for chat_id in (1, 2)]
+        await asyncio.sleep(0)
+        states.append((queues.waiting, queues.depth(1), queues.overloaded()))
+        release.set()
+        await asyncio.gather(*tasks)
+        states.append(queues.overloaded())
+        return states
+
+    assert asyncio.run(main()) == [False, (2, 2, True), False]
+    assert not ChatQueues(concurrency=1).overloaded()
+
+
+def test_idle_chat_stats_are_pruned(monkeypatch):
+    monkeypatch.setattr(update_queue, "PRUNE_INTERVAL", 0)
+    monkeypatch.setattr(update_queue, "CHAT_STATS_TTL", 0.01)
+    queues = ChatQueues(concurrency=1)
+
+    async def job():
+        return None
+
+    async def main():
+        await queues.run(1, job)
+        await asyncio.sleep(0.02)
+        await queues.run(2, job)
+
+    asyncio.run(main())
+    assert list(queues.stats()["chats"]) == [2]
+
+
+def test_update_chat_id():
+    message = Message(message_id=1, date=datetime(2026, 3, 1), chat=CHAT, from_user=USER, text="hi")
+    callback = CallbackQuery(id="1", from_user=USER, chat_instance="x", message=message, data="a")
+    inline_callback = CallbackQuery(id="2", from_user=USER, chat_instance="x", inline_message_id="m", data="a")
+    assert update_chat_id(Update(update_id=1, message=message)) == -100
+    assert update_chat_id(Update(update_id=2, callback_query=callback)) == -100
+    assert update_chat_id(Update(update_id=3, callback_query=inline_callback)) == 7
+    assert update_chat_id(Update(update_id=4)) is None
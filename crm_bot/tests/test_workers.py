@@ -0,0 +1,65 @@
+import asyncio
+import threading
+import time
+import pytest
+from utilities.workers import ReportWorkerPool
+
+
+@pytest.fixture
+def pool():
+    pool = ReportWorkerPool(2)
+    yield pool
+    pool.shutdown()
+
+
+def test_run_executes_off_the_event_loop(pool):
+    async def main():
+        return await pool.run(threading.get_ident), threading.get_ident()
+
+    worker_thread, loop_thread = asyncio.run(main())
+    assert worker_thread != loop_thread
+    assert pool.stats()["completed"] == 1
+
+
+def test_at_most_max_workers_run_at_once(pool):
+    running = []
+    peak = []
+
+    def job():
+        running.append(1)
+        peak.append(len(running))
+        time.sleep(0.05)
+        running.pop()
+
+    async def main():
+        await asyncio.gather(*(pool.run(job) for _ in range(5)))
+
+    asyncio.run(main())
+    assert max(peak) <= 2
+    stats = pool.stats()
+    assert stats["completed"] == 5
+    assert stats["max_queued"] >= 3
+    assert stats["running"] == stats["queued"] == 0
+
+
+def test_slot_holds_one_worker_for_every_step(pool):
+    async def main():
+        async with pool.slot("export") as execute:
+            first = await execute(sum, [1, 2])
+            second = await execute(max, [3, 4])
+            during = pool.stats()["running"]
+        return first, second, during
+
+    assert asyncio.run(main()) == (3, 4, 1)
+    assert pool.stats()["completed"] == 1
+
+
+def test_slot_is_released_on_error(pool):
+    async def main():
+        with pytest.raises(ZeroDivisionError):
+            async with pool.slot("export") as execute:
+                await execute(lambda: 1 / 0)
+        return await pool.run(sum, [1])
+
+    assert asyncio.run(main()) == 1
+    assert pool.stats()["running"] == 0
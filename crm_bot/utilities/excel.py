@@ -0,0 +1,185 @@
+from aiogram.types import InputFile
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+from openpyxl.utils import get_column_letter
+from tempfile import SpooledTemporaryFile
+from contextlib import suppress
+from io import BytesIO
+from typing import AsyncGenerator, Iterable, List, Sequence
+
+# Exports up to this size stay in memory, bigger ones spill to a temp file
+SPOOL_MAX_BYTES = 8 * 1024 * 1024
+MAX_COLUMN_WIDTH = 60
+
+
+class StreamingExcelWriter:
+    """
+    Write-only openpyxl sheet fed in batches, so memory stays bounded no matter
+    how many rows are exported. openpyxl needs column widths before the first
+    row is written, so they are sized from the header and the first batch.
+    """
+
+    def __init__(self, title: str, headers: Sequence[str]):
+        self.workbook = Workbook(write_only=True)
+        self.sheet = self.workbook.create_sheet(title)
+        self.headers = list(headers)
+        self.row_count = 0
+        self._started = False
+        self._closed = False
+
+    def _start(self, first_batch: List[Sequence]) -> None:
+        widths = [len(str(header)) for header in self.headers]
+        for row in first_batch:
+            for index, value in enumerate(row):
+                if value is not None and len(str(value)) > widths[index]:
+                    widths[index] = len(str(value))
+        for index, width in enumerate(widths, 1):
+            self.sheet.column_dimensions[get_column_letter(index)].width = min((width + 2) * 1.2, MAX_COLUMN_WIDTH)
+
+        header_row = []
+        for header in self.headers:
+            cell = WriteOnlyCell(self.sheet, value=header)
+            cell.font = Font(bold=True)
+            header_row.append(cell)
+        self.sheet.append(header_row)
+        self._started = True
+
+    def append_rows(self, rows: Iterable[Sequence]) -> None:
+        rows = list(rows)
+        if not self._started:
+            self._start(rows)
+        for row in rows:
+            self.sheet.append(row)
+        self.row_count += len(rows)
+
+    def close(self) -> SpooledTemporaryFile:
+        """Finish the workbook and return it as a file positioned at the start"""
+        if not self._started:
+            self._start([])
+        output = SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+        try:
+            self.workbook.save(output)
+        except BaseException:
+            output.close()
+            raise
+        self._closed = True
+        output.seek(0)
+        return output
+
+    def discard(self) -> None:
+        """Drop an unfinished workbook: removes the sheet's temp file. No-op after close()"""
+        if self._closed:
+            return
+        self._closed = True
+        # openpyxl streams write-only rows to a temp file only removed by save()
+        writer = self.sheet._writer
+        if writer is not None:
+            with suppress(OSError, ValueError):
+                if self.sheet._rows is not None:
+                    self.sheet._rows.close()
+                writer.close()
+                writer.cleanup()
+
+
+class SpooledInputFile(InputFile):
+    """Upload a (spooled) file object to Telegram chunk by chunk"""
+
+    def __init__(self, file, filename: str, **kwargs):
+        super().__init__(filename=filename, **kwargs)
+        self.file = file
+
+    async def read(self, chunk_size: int) -> AsyncGenerator[bytes, None]:
+        self.file.seek(0)
+        while chunk := self.file.read(chunk_size):
+            yield chunk
+
+
+def build_sellers_workbook(sellers) -> BytesIO:
+    """Runs in the report worker pool; ``sellers`` are already-fetched rows"""
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Sellers"
+    
+    headers = [
+        "ID", "To'liq Ism", "Telefon", "Passport Seriya", 
+        "Ish Boshlagan Sana", "Sotgan Mahsulotlar Soni", "Maosh"
+    ]
+    ws.append(headers)
+    
+    for seller in sellers:
+        ws.append([
+            seller.seller_id,
+            seller.full_name,
+            seller.phone,
+            seller.passport_serial,
+            seller.started_job_at.strftime("%Y-%m-%d") if seller.started_job_at else "",
+            seller.order_counter,
+            seller.salary_of_seller
+        ])
+    
+    # Header styling
+    for cell in ws[1]:
+        cell.font = cell.font.copy(bold=True)
+    
+    # Auto-adjust columns
+    for column in ws.columns:
+        max_length = max(
+            len(str(cell.value)) for cell in column
+        )
+        adjusted_width = (max_length + 2) * 1.2
+        ws.column_dimensions[column[0].column_letter].width = adjusted_width
+    
+    # Format date columns (column E)
+    for cell in ws['E'][1:]:  # Skip header row
+        cell.number_format = 'YYYY-MM-DD'
+    
+    # Format salary column (column G) as currency
+    for cell in ws['G'][1:]:  # Skip header row
+        cell.number_format = '#,##0.00'
+    
+    excel_buffer = BytesIO()
+    wb.save(excel_buffer)
+    excel_buffer.seek(0)
+    
+    return excel_buffer
+
+
+def build_consumptions_workbook(consumptions) -> BytesIO:
+    """Runs in the report worker pool; ``consumptions`` are already-fetched rows"""
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Consumptions"
+    
+    headers = [
+        "ID", "Egasi", "Summa", 
+        "Tavsifi", "Sana"
+    ]
+    ws.append(headers)
+    
+    for cons in consumptions:
+        ws.append([
+            cons.consumption_id if hasattr(cons, 'consumption_id') else cons.id,
+            cons.owner if hasattr(cons, 'owner') else cons.consumption_owner,
+            cons.amount,
+            cons.description,
+            cons.created_at.strftime("%Y-%m-%d %H:%M") if cons.created_at else ""
+        ])
+    
+    # Header styling
+    for cell in ws[1]:
+        cell.font = cell.font.copy(bold=True)
+    
+    # Auto-adjust columns
+    for column in ws.columns:
+        max_length = max(
+            len(str(cell.value)) for cell in column
+        )
+        adjusted_width = (max_length + 2) * 1.2
+        ws.column_dimensions[column[0].column_letter].width = adjusted_width
+    
+    excel_buffer = BytesIO()
+    wb.save(excel_buffer)
+    excel_buffer.seek(0)
+    
+    return excel_buffer
@@ -0,0 +1,80 @@
+from aiogram import types
+from aiogram.exceptions import TelegramBadRequest
+from datetime import date
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Awaitable, Callable, Dict, Hashable, Optional, Tuple
+from database.crud import get_export_watermark
+from keyboards.builders import back_to_main_menu
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ExportFileCache:
+    """Remembers the Telegram file_id of each uploaded report per data watermark"""
+
+    def __init__(self):
+        self._files: Dict[str, Tuple[Hashable, str]] = {}
+        self.reused = 0
+        self.rebuilt = 0
+
+    def get(self, report: str, watermark: Hashable) -> Optional[str]:
+        entry = self._files.get(report)
+        if entry and entry[0] == watermark:
+            return entry[1]
+        return None
+
+    def remember(self, report: str, watermark: Hashable, file_id: str) -> None:
+        self._files[report] = (watermark, file_id)
+
+    def forget(self, report: str) -> None:
+        self._files.pop(report, None)
+
+
+export_files = ExportFileCache()
+
+
+async def answer_with_export(
+    message: types.Message,
+    session: AsyncSession,
+    report: str,
+    build_export: Callable[..., Awaitable],
+    filename_prefix: str,
+    caption: str,
+    empty_text: str
+) -> None:
+    """
+    Send a report, resending the previous upload by file_id while the data
+    watermark is unchanged; rebuild and upload only when data changed.
+    """
+    # The date is part of the key so the file name is never a day old
+    watermark = (date.today(), await get_export_watermark(report, session=session))
+
+    file_id = export_files.get(report, watermark)
+    if file_id:
+        try:
+            await message.answer_document(document=file_id, caption=caption)
+            export_files.reused += 1
+            return
+        except TelegramBadRequest as e:
+            logger.warning(f"Cached {report} export could not be resent: {e}")
+            export_files.forget(report)
+
+    excel_file = await build_export(session=session)
+    if not excel_file:
+        await message.answer(empty_text, reply_markup=back_to_main_menu())
+        return
+
+    from utilities.excel import SpooledInputFile  # loaded with openpyxl on first export
+    filename = f"{filename_prefix}_{date.today().strftime('%Y-%m-%d')}.xlsx"
+    try:
+        sent = await message.answer_document(
+            document=SpooledInputFile(excel_file, filename=filename),
+            caption=caption
+        )
+    finally:
+        excel_file.close()
+
+    export_files.rebuilt += 1
+    if sent.document:
+        export_files.remember(report, watermark, sent.document.file_id)
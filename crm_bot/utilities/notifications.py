@@ -1,159 +1,343 @@
-import logging
-from datetime import datetime, timedelta
-from typing import List
 import asyncio
+import logging
+from datetime import date, datetime, timedelta
+from typing import AsyncIterator, Dict, Iterator, List, Tuple
 from aiogram import Bot
-from sqlalchemy import select, or_, func
-from sqlalchemy.orm import joinedload
-from database.utils import async_session
-from database.models import Order, Client
+from sqlalchemy import Integer, any_, bindparam, case, null, select, func, update
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+from database.utils import async_session, session_scope
+from database.instrumentation import query_tag, tag_queries
+from database.models import Order, Client, Seller, REMINDER_INTERVAL
+from database.rollup import get_month_rollup
 from config import Config
+from utilities.outbox import (
+    claim_pending, enqueue, get_outbox_backlog, mark_delivered, mark_failed,
+    outbox_wakeup, purge_delivered
+)
+from utilities.sender import NotificationSender, OutgoingMessage
+
+MAX_MESSAGE_LENGTH = 4096
+
+def _due_orders_page(after_id: int, now: datetime, limit: int):
+    """Only the columns the reminder texts need, next page after ``after_id``"""
+    return (
+        select(
+            Order.id,
+            Order.sum_of_item,
+            Order.total_paid,
+            Order.remaining_amount,
+            Order.created_at,
+            Order.next_notification_at,
+            Client.full_name.label("client_name"),
+            Client.phone.label("client_phone"),
+            Seller.full_name.label("seller_name")
+        )
+        .join(Client, Client.id == Order.client_id)
+        .outerjoin(Seller, Seller.id == Order.seller_id)
+        .where(
+            Order.order_status == 'Ochiq',
+            Order.next_notification_at <= now,
+            Order.id > after_id
+        )
+        .order_by(Order.id)
+        .limit(limit)
+    )
 
-async def get_orders_reaching_one_month(session):  # Added session parameter
+async def iter_due_order_pages(batch_size: int = Config.NOTIFY_FETCH_BATCH) -> AsyncIterator[list]:
     """
-    Fetch orders that have reached 1 month since creation
-    and haven't been notified yet or need reminder
+    Stream open orders whose next reminder is due, keyset-paginated by id.
+    Each page is a short query of its own, and rows updated between pages
+    never shift a page.
     """
-    one_month_ago = datetime.now() - timedelta(days=30)  # Changed from seconds to days
-        
-    result = await session.execute(
-        select(Order)
-        .where(
-            Order.created_at <= one_month_ago,
-            or_(
-                Order.last_notification_sent == None,
-                Order.last_notification_sent < one_month_ago
-            )
+    now = datetime.now()
+    after_id = 0
+    while True:
+        with query_tag("iter_due_order_pages"):
+            async with async_session() as session:
+                rows = (await session.execute(_due_orders_page(after_id, now, batch_size))).all()
+        if rows:
+            yield rows
+        if len(rows) < batch_size:
+            return
+        after_id = rows[-1].id
+
+def _reminder_payload(order) -> dict:
+    """What the reminder texts need, frozen at enqueue time"""
+    return {
+        "order_id": order.id,
+        "client_name": order.client_name,
+        "client_phone": order.client_phone,
+        "seller_name": order.seller_name,
+        "sum_of_item": order.sum_of_item,
+        "total_paid": order.total_paid,
+        "remaining_amount": order.remaining_amount,
+        "created_at": order.created_at.strftime('%Y-%m-%d'),
+        "due_date": order.next_notification_at.strftime('%Y-%m-%d'),
+    }
+
+def format_order_notification(order: dict) -> str:
+    return (
+        "⚠️ 1 oy bo'ldi! Buyurtma haqida eslatma:\n\n"
+        f"📋 Buyurtma ID: #{order['order_id']}\n"
+        f"👤 Mijoz: {order['client_name']}\n"
+        f"📞 Tel: {order['client_phone']}\n"
+        f"💰 Umumiy summa: {order['sum_of_item']:,} so'm\n"
+        f"💳 To'langan: {order['total_paid']:,} so'm\n"
+        f"🔄 Qoldiq: {order['remaining_amount']:,} so'm\n"
+        f"📅 Buyurtma sanasi: {order['created_at']}\n\n"
+        f"@diamond_water_crm_bot"
+    )
+
+def _text_length(text: str) -> int:
+    # Telegram counts the limit in UTF-16 code units (emoji count as two)
+    return len(text.encode("utf-16-le")) // 2
+
+def _digest_group(order: dict, group_by: str) -> str:
+    if group_by == "seller":
+        return f"🧑‍💼 Sotuvchi: {order['seller_name'] or 'Nomaʼlum'}"
+    return f"📅 Muddat: {order['due_date']}"
+
+def _digest_line(order: dict) -> str:
+    return (
+        f"#{order['order_id']} {order['client_name']} ({order['client_phone']}) — "
+        f"qoldiq {order['remaining_amount']:,} so'm"
+    )
+
+def build_digest_messages(entries: list, group_by: str, chat_id) -> Iterator[OutgoingMessage]:
+    """
+    Pack reminder outbox entries into as few messages as fit Telegram's
+    length limit, grouped by seller or due date. A group that does not fit
+    one message continues in the next. Message ids are outbox ids.
+    """
+    footer = "\n\n@diamond_water_crm_bot"
+    groups: Dict[str, list] = {}
+    for entry in sorted(entries, key=lambda e: e.payload['order_id']):
+        groups.setdefault(_digest_group(entry.payload, group_by), []).append(entry)
+
+    title = "⚠️ 1 oy bo'ldi! Buyurtmalar haqida eslatma:"
+    lines, entry_ids = [title], []
+    length = _text_length(title) + _text_length(footer)
+
+    for group, group_entries in sorted(groups.items()):
+        pending = ["", group] + [_digest_line(entry.payload) for entry in group_entries]
+        pending_ids = [None, None] + [entry.id for entry in group_entries]
+        for line, entry_id in zip(pending, pending_ids):
+            if length + _text_length(line) + 1 > MAX_MESSAGE_LENGTH and entry_ids:
+                yield OutgoingMessage(chat_id, "\n".join(lines) + footer, tuple(entry_ids))
+                lines, entry_ids = [title, "", f"{group} (davomi)"], []
+                length = sum(_text_length(l) + 1 for l in lines) + _text_length(footer)
+                if entry_id is None:
+                    continue
+            lines.append(line)
+            length += _text_length(line) + 1
+            if entry_id is not None:
+                entry_ids.append(entry_id)
+
+    if entry_ids:
+        yield OutgoingMessage(chat_id, "\n".join(lines) + footer, tuple(entry_ids))
+
+@tag_queries
+async def mark_orders_notified(session: AsyncSession, order_ids: List[int]) -> None:
+    """
+    Record delivered reminders for a whole batch in one UPDATE
+    """
+    if not order_ids:
+        return
+    await session.execute(
+        update(Order)
+        .where(Order.id == any_(bindparam("order_ids", order_ids, type_=ARRAY(Integer))))
+        .values(
+            last_notification_sent=datetime.now(),
+            notification_count=func.coalesce(Order.notification_count, 0) + 1
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+@tag_queries
+async def enqueue_reminders(orders: list) -> int:
+    """
+    Put one outbox row per due order and move the orders' next reminder a
+    period ahead, in one transaction: a re-run neither selects them again
+    nor, thanks to the dedup key, enqueues a second copy.
+    """
+    now = datetime.now()
+    entries = [
+        {
+            "kind": "reminder",
+            "dedup_key": f"reminder:{order.id}:{order.next_notification_at:%Y-%m-%d}",
+            "chat_id": str(Config.TELEGRAM_CHANNEL_ID),
+            "payload": _reminder_payload(order),
+        }
+        for order in orders
+    ]
+    async with session_scope() as session:
+        added = await enqueue(session, entries)
+        await session.execute(
+            update(Order)
+            .where(Order.id == any_(bindparam("order_ids", [order.id for order in orders], type_=ARRAY(Integer))))
+            .values(next_notification_at=case(
+                (Order.order_status == 'Ochiq', now + REMINDER_INTERVAL),
+                else_=null()
+            ))
+            .execution_options(synchronize_session=False)
         )
-        .options(joinedload(Order.client)))
-    return result.scalars().all()
+    return added
 
-async def send_order_notification(bot: Bot, order: Order) -> bool:
+@tag_queries
+async def check_and_notify_orders(bot: Bot) -> bool:
     """
-    Send notification about a specific order to the channel
+    Main function to check for due orders and queue their notifications;
+    the outbox drainer delivers them
     Returns True if successful, False otherwise
     """
     try:
-        message = (
-            "⚠️ 1 oy bo'ldi! Buyurtma haqida eslatma:\n\n"
-            f"📋 Buyurtma ID: #{order.id}\n"
-            f"👤 Mijoz: {order.client.full_name}\n"
-            f"📞 Tel: {order.client.phone}\n"
-            f"💰 Umumiy summa: {order.sum_of_item:,} so'm\n"
-            f"💳 To'langan: {order.total_paid:,} so'm\n"
-            f"🔄 Qoldiq: {order.remaining_amount:,} so'm\n"
-            f"📅 Buyurtma sanasi: {order.created_at.strftime('%Y-%m-%d')}\n\n"
-            f"@diamond_water_crm_bot"
-        )
-        
-        await bot.send_message(
-            chat_id=Config.TELEGRAM_CHANNEL_ID,
-            text=message
-        )
+        queued = 0
+        async for orders in iter_due_order_pages():
+            queued += await enqueue_reminders(orders)
+        if not queued:
+            logging.info("No orders requiring notification found")
+            return True
+        logging.info(f"Queued {queued} order notifications")
+        outbox_wakeup.set()
         return True
+
     except Exception as e:
-        logging.error(f"Failed to send notification for order {order.id}: {str(e)}")
+        logging.error(f"Error in notification system: {str(e)}")
         return False
 
-async def update_notification_status(session, order_id: int) -> None:
+def _outbox_messages(entries: list) -> List[OutgoingMessage]:
+    messages = []
+    reminders = []
+    for entry in entries:
+        if entry.kind == 'reminder':
+            reminders.append(entry)
+        else:
+            messages.append(OutgoingMessage(entry.chat_id, entry.payload['text'], (entry.id,)))
+
+    if Config.NOTIFY_DIGEST in ("seller", "date"):
+        by_chat: Dict[str, list] = {}
+        for entry in reminders:
+            by_chat.setdefault(entry.chat_id, []).append(entry)
+        for chat_id, chat_entries in by_chat.items():
+            messages.extend(build_digest_messages(chat_entries, Config.NOTIFY_DIGEST, chat_id))
+    else:
+        messages.extend(
+            OutgoingMessage(entry.chat_id, format_order_notification(entry.payload), (entry.id,))
+            for entry in reminders
+        )
+    return messages
+
+def outbox_claim_size() -> int:
     """
-    Update the notification tracking fields in database
+    Rows claimed at once: at most what one chat's rate limit lets through in
+    half a lease (most rows go to the channel), so a claimed batch is sent
+    before its lease expires and another drainer re-sends it.
     """
-    try:
-        order = await session.get(Order, order_id)
-        if order:
-            order.last_notification_sent = datetime.now()
-            order.notification_count += 1
-            await session.commit()
-    except Exception as e:
-        logging.error(f"Failed to update notification status for order {order_id}: {str(e)}")
-        await session.rollback()
-        raise
+    sendable = int(Config.NOTIFY_CHAT_RATE_PER_MIN * Config.OUTBOX_LEASE / 60 / 2)
+    return max(1, min(Config.OUTBOX_BATCH_SIZE, sendable))
 
-async def check_and_notify_orders(bot: Bot) -> None:
+async def drain_outbox(bot: Bot) -> Tuple[int, int]:
     """
-    Main function to check for due orders and send notifications
+    Deliver due outbox rows batch by batch. A delivered row and its order
+    bookkeeping are committed together, right after each send; failures are
+    retried with backoff. Delivery is at least once: Telegram has no
+    idempotency key, so a crash between a send and its commit re-sends
+    that message (at most NOTIFY_CONCURRENCY in flight) once the lease expires.
+    Returns (sent, failed) message counts.
     """
-    async with async_session() as session:
-        try:
-            orders = await get_orders_reaching_one_month(session)  # Now passing session
-            if not orders:
-                logging.info("No orders requiring notification found")
-                return
-
-            logging.info(f"Found {len(orders)} orders requiring notification")
-            
-            for order in orders:
-                success = await send_order_notification(bot, order)
-                if success:
-                    await update_notification_status(session, order.id)
-                    logging.info(f"Notification sent for order #{order.id}")
-                else:
-                    logging.warning(f"Failed to send notification for order #{order.id}")
-                await asyncio.sleep(1)  # Rate limitin  g
+    sent = failed = 0
+    claim_size = outbox_claim_size()
+    while entries := await claim_pending(claim_size):
+        order_of = {entry.id: entry.payload['order_id'] for entry in entries if entry.kind == 'reminder'}
+
+        async def on_delivered(outbox_ids: List[int]) -> None:
+            async with session_scope() as session:
+                await mark_delivered(session, outbox_ids)
+                await mark_orders_notified(session, [order_of[i] for i in outbox_ids if i in order_of])
 
+        # batch_size=1: a sent message is marked delivered before the next
+        # one goes out, so a restart re-sends as little as possible
+        sender = NotificationSender(bot, on_delivered=on_delivered, on_failed=mark_failed, batch_size=1)
+        batch_sent, batch_failed = await sender.send_all(_outbox_messages(entries))
+        sent += batch_sent
+        failed += batch_failed
+        if batch_failed and not batch_sent:
+            # Everything failed (Telegram down?): leave the rest to the backoff
+            break
+    return sent, failed
+
+async def run_outbox_drainer(bot: Bot) -> None:
+    """Background task: drain on every wake-up from a job, or every poll interval"""
+    last_purge = None
+    while True:
+        outbox_wakeup.clear()
+        try:
+            sent, failed = await drain_outbox(bot)
+            if sent or failed:
+                backlog = await get_outbox_backlog()
+                logging.info(
+                    f"Outbox: sent {sent}, failed {failed}; backlog {backlog['pending']} pending "
+                    f"(oldest {backlog['oldest_age'] or 0:.0f}s), {backlog['failed']} given up"
+                )
+            if last_purge != datetime.now().date():
+                await purge_delivered(Config.OUTBOX_RETENTION_DAYS)
+                last_purge = datetime.now().date()
         except Exception as e:
-            logging.error(f"Error in notification system: {str(e)}")
-            await session.rollback()
-        finally:
-            await session.close()
+            logging.error(f"Error draining notification outbox: {str(e)}")
 
-async def get_monthly_order_statistics(session):
-    """
-    Calculate monthly statistics for all orders
-    Returns: dict with sums of item_count, total_paid, remaining_amount, sum_of_item
-    """
-    result = await session.execute(
-        select(
-            func.sum(Order.item_count).label("total_items"),
-            func.sum(Order.total_paid).label("total_paid"),
-            func.sum(Order.remaining_amount).label("total_remaining"),
-            func.sum(Order.sum_of_item).label("total_sum")
-        )
+        try:
+            await asyncio.wait_for(outbox_wakeup.wait(), Config.OUTBOX_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+UZBEK_MONTHS = [
+    "Yanvar", "Fevral", "Mart", "Aprel", "May", "Iyun",
+    "Iyul", "Avgust", "Sentyabr", "Oktyabr", "Noyabr", "Dekabr"
+]
+
+def month_title(month: date) -> str:
+    return f"{UZBEK_MONTHS[month.month - 1]} {month.year}"
+
+def format_monthly_report(month: date, rollup) -> str:
+    """Report text for the orders created in ``month`` (rollup may be None)"""
+    order_count = rollup.order_count if rollup else 0
+    return (
+        f"📊 {month_title(month)} uchun hisobot:\n\n"
+        f"📦 Jami buyurtmalar soni: {order_count}\n"
+        f"🧴 Mahsulotlar soni: {rollup.item_count if rollup else 0}\n"
+        f"💰 Jami summa: {rollup.sum_of_item if rollup else 0:,} so'm\n"
+        f"💳 Jami to'langan: {rollup.total_paid if rollup else 0:,} so'm\n"
+        f"🔄 Jami qoldiq: {rollup.remaining_amount if rollup else 0:,} so'm\n"
+        f"🟢 Ochiq: {rollup.open_count if rollup else 0} | "
+        f"✅ Yopilgan: {rollup.closed_count if rollup else 0} | "
+        f"↩️ Qaytarilgan: {rollup.returned_count if rollup else 0}\n\n"
+        f"@diamond_water_crm_bot"
     )
-    return result.one()
 
+@tag_queries
 async def send_monthly_report(bot: Bot) -> bool:
     """
-    Send monthly statistics report to the channel
+    Queue last month's report for the channel (once per month); it reads a
+    single row of the monthly rollup
     Returns True if successful, False otherwise
     """
     async with async_session() as session:
         try:
-            stats = await get_monthly_order_statistics(session)
-            total_items, total_paid, total_remaining, total_sum = stats
-            
-            uzbek_months = [
-                "Yanvar", "Fevral", "Mart", "Aprel", "May", "Iyun",
-                "Iyul", "Avgust", "Sentyabr", "Oktyabr", "Noyabr", "Dekabr"
-            ]
-
-            # Get the first day of the current month
-            first_day_of_this_month = datetime.now().replace(day=1)
-
-            # Subtract one day to get a date from the previous month
-            last_month_date = first_day_of_this_month - timedelta(days=1)
-
-            # Use Uzbek month name
-            month_name = uzbek_months[last_month_date.month - 1]
-            year = last_month_date.year
-            
-            current_month = f"{month_name} {year}"
-
-            message = (
-                f"📊 {current_month} uchun hisobot:\n\n"
-                f"📦 Jami buyurtmalar soni: {total_items or 0}\n"
-                f"💰 Jami summa: {total_sum or 0:,} so'm\n"
-                f"💳 Jami to'langan: {total_paid or 0:,} so'm\n"
-                f"🔄 Jami qoldiq: {total_remaining or 0:,} so'm\n\n"
-                f"@diamond_water_crm_bot"
-            )
-            
-            await bot.send_message(
-                chat_id=Config.TELEGRAM_CHANNEL_ID,
-                text=message
-            )
+            # Any date in the previous month -> its first day
+            last_month = (datetime.now().replace(day=1) - timedelta(days=1)).date().replace(day=1)
+            rollup = await get_month_rollup(last_month, session=session)
+
+            # The dedup key makes a re-run in the same month a no-op
+            await enqueue(session, [{
+                "kind": "report",
+                "dedup_key": f"report:{last_month:%Y-%m}",
+                "chat_id": str(Config.TELEGRAM_CHANNEL_ID),
+                "payload": {"text": format_monthly_report(last_month, rollup)},
+            }])
+            await session.commit()
+            outbox_wakeup.set()
             return True
         except Exception as e:
             logging.error(f"Failed to send monthly report: {str(e)}")
-            return False
\ No newline at end of file
+            return False
@@ -0,0 +1,136 @@
+import asyncio
+import logging
+from datetime import timedelta
+from typing import Dict, List, Optional
+from sqlalchemy import Integer, any_, bindparam, case, delete, func, select, update
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from database.instrumentation import tag_queries
+from database.models import NotificationOutbox
+from database.utils import session_scope
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Every outbox timestamp (defaults, leases, backoff, delivery, age) comes
+# from the database's now(), never the bot host's clock: the columns are
+# naive and the two may be in different timezones
+
+# Set by the jobs after enqueueing so the drainer does not wait for its next poll
+outbox_wakeup = asyncio.Event()
+
+
+def _ids_param(ids: List[int]):
+    return bindparam("outbox_ids", ids, type_=ARRAY(Integer))
+
+@tag_queries
+async def enqueue(session: AsyncSession, entries: List[dict]) -> int:
+    """
+    Add rows (kind, dedup_key, chat_id, payload) inside the caller's
+    transaction. Rows whose dedup_key already exists are skipped.
+    Returns the number of rows actually added.
+    """
+    if not entries:
+        return 0
+    result = await session.execute(
+        insert(NotificationOutbox)
+        .values(entries)
+        .on_conflict_do_nothing(index_elements=[NotificationOutbox.dedup_key])
+        .returning(NotificationOutbox.id)
+    )
+    return len(result.all())
+
+@tag_queries
+async def claim_pending(limit: int) -> list:
+    """
+    Lease up to ``limit`` due rows: their next attempt moves a lease period
+    ahead, so rows left behind by a crash are picked up again afterwards.
+    """
+    due = (
+        select(NotificationOutbox.id)
+        .where(
+            NotificationOutbox.status == 'pending',
+            NotificationOutbox.next_attempt_at <= func.now()
+        )
+        .order_by(NotificationOutbox.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    async with session_scope() as session:
+        result = await session.execute(
+            update(NotificationOutbox)
+            .where(NotificationOutbox.id.in_(due))
+            .values(next_attempt_at=func.now() + timedelta(seconds=Config.OUTBOX_LEASE))
+            .returning(
+                NotificationOutbox.id, NotificationOutbox.kind,
+                NotificationOutbox.chat_id, NotificationOutbox.payload
+            )
+        )
+        return sorted(result.all(), key=lambda row: row.id)
+
+@tag_queries
+async def mark_delivered(session: AsyncSession, outbox_ids: List[int]) -> None:
+    await session.execute(
+        update(NotificationOutbox)
+        .where(NotificationOutbox.id == any_(_ids_param(outbox_ids)))
+        .values(status='delivered', delivered_at=func.now(), last_error=None)
+        .execution_options(synchronize_session=False)
+    )
+
+@tag_queries
+async def mark_failed(outbox_ids: List[int], error: str) -> None:
+    """Schedule a retry with exponential backoff, or give up after OUTBOX_MAX_ATTEMPTS"""
+    backoff = func.least(
+        timedelta(seconds=Config.OUTBOX_BACKOFF_BASE) * func.power(2, NotificationOutbox.attempts),
+        timedelta(seconds=Config.OUTBOX_BACKOFF_MAX)
+    )
+    async with session_scope() as session:
+        await session.execute(
+            update(NotificationOutbox)
+            .where(NotificationOutbox.id == any_(_ids_param(outbox_ids)))
+            .values(
+                attempts=NotificationOutbox.attempts + 1,
+                next_attempt_at=func.now() + backoff,
+                last_error=error[:500],
+                status=case(
+                    (NotificationOutbox.attempts + 1 >= Config.OUTBOX_MAX_ATTEMPTS, 'failed'),
+                    else_='pending'
+                )
+            )
+            .execution_options(synchronize_session=False)
+        )
+
+@tag_queries
+async def get_outbox_backlog() -> Dict[str, Optional[float]]:
+    """Pending rows, age of the oldest one in seconds, and rows given up on"""
+    async with session_scope() as session:
+        result = await session.execute(
+            select(
+                func.count().filter(NotificationOutbox.status == 'pending').label("pending"),
+                func.extract(
+                    'epoch', func.now() - func.min(NotificationOutbox.created_at).filter(NotificationOutbox.status == 'pending')
+                ).label("oldest_age"),
+                func.count().filter(NotificationOutbox.status == 'failed').label("failed")
+            )
+            .where(NotificationOutbox.status.in_(('pending', 'failed')))
+        )
+        pending, oldest_age, failed = result.one()
+    return {
+        "pending": pending,
+        "oldest_age": float(oldest_age) if oldest_age is not None else None,
+        "failed": failed,
+    }
+
+@tag_queries
+async def purge_delivered(older_than_days: int) -> int:
+    """Drop delivered rows past retention; their dedup periods are long over"""
+    async with session_scope() as session:
+        result = await session.execute(
+            delete(NotificationOutbox)
+            .where(
+                NotificationOutbox.status == 'delivered',
+                NotificationOutbox.delivered_at < func.now() - timedelta(days=older_than_days)
+            )
+        )
+        return result.rowcount
@@ -0,0 +1,58 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    """
+    Token bucket: ``rate`` tokens per second refill up to ``capacity``.
+    ``acquire`` waits for a token, ``try_acquire`` never waits.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def available(self, tokens: float = 1) -> bool:
+        """Whether ``try_acquire(tokens)`` would succeed now (takes nothing)"""
+        now = time.monotonic()
+        if now < self.paused_until:
+            return False
+        self._refill(now)
+        return self.tokens >= tokens
+
+    def full(self) -> bool:
+        """Refilled to capacity: indistinguishable from a new bucket"""
+        return self.available(self.capacity)
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        if self.available(tokens):
+            self.tokens -= tokens
+            return True
+        return False
+
+    async def acquire(self, tokens: float = 1) -> None:
+        # The lock keeps waiters first-come, first-served
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self.tokens) / self.rate)
+
+    def pause(self, seconds: float) -> None:
+        """Hand out nothing for ``seconds`` (e.g. after Telegram's RetryAfter)"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
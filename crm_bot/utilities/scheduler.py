@@ -1,30 +1,217 @@
-import aioschedule
 import asyncio
-from aiogram import Bot
-from utilities.notifications import check_and_notify_orders, send_monthly_report
 import logging
+import time
 from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional
+from zoneinfo import ZoneInfo
+from aiogram import Bot
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from config import Config
+from database.instrumentation import tag_queries
+from database.models import ScheduledJob
+from database.utils import session_scope
+from utilities.notifications import check_and_notify_orders, send_monthly_report
+
+logger = logging.getLogger(__name__)
+
+# Long sleeps are cut into pieces so a wall-clock change is noticed
+MAX_SLEEP = 3600
+
+
+class CronSpec:
+    """
+    Five-field cron expression: minute hour day-of-month month day-of-week.
+    Fields take ``*``, numbers, ranges ``a-b``, lists ``a,b`` and steps
+    ``*/n`` / ``a-b/n``; day-of-week 0 or 7 is Sunday. As in cron, when both
+    day fields are restricted a day matching either of them matches.
+    """
+
+    RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron spec needs 5 fields: {expression!r}")
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, weekdays = (
+            self._parse(field, low, high) for field, (low, high) in zip(fields, self.RANGES)
+        )
+        # cron: 0 = Sunday; Python: 0 = Monday
+        self.weekdays = {(day - 1) % 7 for day in weekdays}
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+
+    @staticmethod
+    def _parse(field: str, low: int, high: int) -> set:
+        values = set()
+        for part in field.split(","):
+            part, _, step = part.partition("/")
+            if part == "*":
+                start, end = low, high
+            elif "-" in part:
+                start, end = (int(value) for value in part.split("-", 1))
+            else:
+                start = end = int(part)
+            if not (low <= start <= end <= high):
+                raise ValueError(f"Cron field {field!r} is out of range {low}-{high}")
+            values.update(range(start, end + 1, int(step) if step else 1))
+        return values
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day_ok = moment.day in self.days
+        weekday_ok = moment.weekday() in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day_ok and weekday_ok
+        return day_ok or weekday_ok
+
+    def next_after(self, moment: datetime) -> datetime:
+        """First matching minute strictly after ``moment`` (in its timezone)"""
+        tz = moment.tzinfo
+        current = moment.replace(tzinfo=None, second=0, microsecond=0) + timedelta(minutes=1)
+        limit = current + timedelta(days=366 * 5)
+        while current < limit:
+            if current.month not in self.months:
+                current = (current.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(current):
+                current = current.replace(hour=0, minute=0) + timedelta(days=1)
+            elif current.hour not in self.hours:
+                current = current.replace(minute=0) + timedelta(hours=1)
+            elif current.minute not in self.minutes:
+                current += timedelta(minutes=1)
+            else:
+                return current.replace(tzinfo=tz)
+        raise ValueError(f"Cron spec {self.expression!r} never matches")
+
+
+class Job:
+    def __init__(self, name: str, spec: str, func: Callable[[Bot], Awaitable]):
+        self.name = name
+        self.spec = CronSpec(spec)
+        self.func = func
+        # Start of the last successful run; missed runs are counted from it
+        self.last_run: Optional[datetime] = None
+        self.last_attempt: Optional[datetime] = None
+        self.next_run: Optional[datetime] = None
+        self.task: Optional[asyncio.Task] = None
+
+
+class Scheduler:
+    """
+    In-process cron: sleeps until the earliest next run, never runs two
+    instances of a job at once, and keeps last/next run times in the
+    scheduled_jobs table. After downtime a job whose run was missed (or
+    failed) runs once right away (several missed runs collapse into one).
+    """
+
+    def __init__(self, timezone: str = Config.TIMEZONE):
+        self.tz = ZoneInfo(timezone)
+        self.jobs: Dict[str, Job] = {}
+
+    def add_job(self, name: str, spec: str, func: Callable[[Bot], Awaitable]) -> Job:
+        job = self.jobs[name] = Job(name, spec, func)
+        return job
+
+    def now(self) -> datetime:
+        return datetime.now(self.tz)
+
+    async def _load_state(self) -> None:
+        now = self.now()
+        recorded = await load_job_runs(list(self.jobs))
+        for job in self.jobs.values():
+            job.last_run = recorded.get(job.name)
+            if job.last_run is None:
+                job.next_run = job.spec.next_after(now)
+            else:
+                missed = job.spec.next_after(job.last_run.astimezone(self.tz))
+                if missed <= now:
+                    logger.info(f"Job {job.name} missed its run at {missed:%Y-%m-%d %H:%M}, catching up")
+                    job.next_run = now
+                else:
+                    job.next_run = missed
+            await record_job_run(job.name, job.last_run, job.next_run)
+
+    async def _run_job(self, job: Job, bot: Bot) -> None:
+        started = self.now()
+        started_clock = time.perf_counter()
+        status = "cancelled"
+        try:
+            # Jobs that log their own errors report them by returning False
+            status = "error" if await job.func(bot) is False else "ok"
+        except Exception as e:
+            status = "error"
+            logger.error(f"Job {job.name} failed: {str(e)}")
+        finally:
+            duration = time.perf_counter() - started_clock
+            job.last_attempt = started
+            if status == "ok":
+                job.last_run = started
+            logger.info(f"Job {job.name} finished ({status}) in {duration:.1f}s, next run {job.next_run:%Y-%m-%d %H:%M}")
+            try:
+                await record_job_run(job.name, job.last_run, job.next_run, status, duration, job.last_attempt)
+            except Exception as e:
+                logger.error(f"Could not record run of job {job.name}: {str(e)}")
+
+    def _start_due(self, bot: Bot) -> None:
+        now = self.now()
+        for job in self.jobs.values():
+            if job.next_run > now:
+                continue
+            job.next_run = job.spec.next_after(now)
+            if job.task and not job.task.done():
+                logger.warning(f"Job {job.name} is still running, skipping this run")
+                continue
+            job.task = asyncio.create_task(self._run_job(job, bot), name=f"job:{job.name}")
+
+    async def run(self, bot: Bot) -> None:
+        await self._load_state()
+        for job in self.jobs.values():
+            logger.info(f"Job {job.name} ({job.spec.expression} {self.tz.key}) next run {job.next_run:%Y-%m-%d %H:%M}")
+        try:
+            while True:
+                self._start_due(bot)
+                next_run = min(job.next_run for job in self.jobs.values())
+                delay = (next_run - self.now()).total_seconds()
+                await asyncio.sleep(min(max(delay, 0), MAX_SLEEP))
+        finally:
+            running = [job.task for job in self.jobs.values() if job.task and not job.task.done()]
+            for task in running:
+                task.cancel()
+
+
+@tag_queries
+async def load_job_runs(names: List[str]) -> Dict[str, datetime]:
+    async with session_scope() as session:
+        result = await session.execute(
+            select(ScheduledJob.name, ScheduledJob.last_run_at)
+            .where(ScheduledJob.name.in_(names))
+        )
+        return {name: last_run for name, last_run in result.all() if last_run}
+
+@tag_queries
+async def record_job_run(
+    name: str,
+    last_run: Optional[datetime],
+    next_run: Optional[datetime],
+    status: Optional[str] = None,
+    duration: Optional[float] = None,
+    attempted: Optional[datetime] = None
+) -> None:
+    values = {"name": name, "last_run_at": last_run, "next_run_at": next_run}
+    if status is not None:
+        values.update(last_status=status, last_duration=duration, last_attempt_at=attempted)
+    stmt = insert(ScheduledJob).values(**values)
+    async with session_scope() as session:
+        await session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[ScheduledJob.name],
+                set_={key: getattr(stmt.excluded, key) for key in values if key != "name"}
+            )
+        )
+
 
-async def setup_scheduler(bot: Bot):
-    while True:
-        now = datetime.now()
-        
-        # Production - run at 10:00 AM daily
-        if now.hour == 10 and now.minute == 0:
-            await check_and_notify_orders(bot)
-            
-            # Monthly report on 1st day of month
-            if now.day == 1:
-                await send_monthly_report(bot)
-            
-            await asyncio.sleep(60)  # Prevent multiple runs
-        
-        ##Testing - run every 5 minutes
-        elif now.minute % 2 == 0:
-            await check_and_notify_orders(bot)
-            await send_monthly_report(bot)
-
-            await asyncio.sleep(60)
-                
-        else:
-            await asyncio.sleep(10)  # Check every 10 seconds
\ No newline at end of file
+def build_scheduler() -> Scheduler:
+    scheduler = Scheduler(Config.TIMEZONE)
+    scheduler.add_job("order_reminders", Config.REMINDER_CRON, check_and_notify_orders)
+    scheduler.add_job("monthly_report", Config.MONTHLY_REPORT_CRON, send_monthly_report)
+    return scheduler
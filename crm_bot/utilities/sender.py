@@ -0,0 +1,128 @@
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+from typing import AsyncIterable, Awaitable, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple, Union
+from config import Config
+from utilities.rate_limit import TokenBucket
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class OutgoingMessage(NamedTuple):
+    chat_id: Union[int, str]
+    text: str
+    ids: Tuple[int, ...]  # handed back through on_delivered / on_failed
+
+
+class NotificationSender:
+    """
+    Sends messages with several requests in flight while staying under
+    Telegram's limits: one global bucket plus one bucket per chat. A
+    RetryAfter pauses the chat's bucket and the message is retried.
+    Ids of delivered messages are handed to ``on_delivered`` in batches,
+    those of messages that still failed to ``on_failed`` with the error.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        on_delivered: Callable[[List[int]], Awaitable],
+        on_failed: Optional[Callable[[List[int], str], Awaitable]] = None,
+        concurrency: int = Config.NOTIFY_CONCURRENCY,
+        batch_size: int = Config.NOTIFY_BATCH_SIZE,
+        max_retries: int = 3
+    ):
+        self.bot = bot
+        self.on_delivered = on_delivered
+        self.on_failed = on_failed
+        self.concurrency = max(1, concurrency)
+        self.batch_size = max(1, batch_size)
+        self.max_retries = max_retries
+        self.global_bucket = TokenBucket(Config.NOTIFY_GLOBAL_RATE, Config.NOTIFY_GLOBAL_RATE)
+        self.chat_buckets: Dict[Union[int, str], TokenBucket] = {}
+        self._delivered: List[int] = []
+        self._flush_lock = asyncio.Lock()
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            per_minute = Config.NOTIFY_CHAT_RATE_PER_MIN
+            bucket = self.chat_buckets[chat_id] = TokenBucket(per_minute / 60, per_minute)
+        return bucket
+
+    async def _send(self, message: OutgoingMessage) -> None:
+        chat_bucket = self._chat_bucket(message.chat_id)
+        for attempt in range(self.max_retries + 1):
+            await chat_bucket.acquire()
+            await self.global_bucket.acquire()
+            try:
+                await self.bot.send_message(chat_id=message.chat_id, text=message.text)
+            except TelegramRetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                self.retried += 1
+                logger.warning(f"Flood control on chat {message.chat_id}, retrying in {e.retry_after}s")
+                chat_bucket.pause(e.retry_after)
+                continue
+            self.sent += 1
+            self._delivered.extend(message.ids)
+            if len(self._delivered) >= self.batch_size:
+                await self.flush()
+            return
+
+    async def _worker(self, queue: asyncio.Queue) -> None:
+        while True:
+            message = await queue.get()
+            try:
+                if message is None:
+                    return
+                try:
+                    await self._send(message)
+                except Exception as e:
+                    self.failed += 1
+                    logger.error(f"Failed to send notification {list(message.ids)}: {str(e)}")
+                    if self.on_failed:
+                        await self._report_failure(message, e)
+            finally:
+                queue.task_done()
+
+    async def _report_failure(self, message: OutgoingMessage, error: Exception) -> None:
+        try:
+            await self.on_failed(list(message.ids), str(error))
+        except Exception as e:
+            logger.error(f"Failed to record failed notification {list(message.ids)}: {str(e)}")
+
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            if not self._delivered:
+                return
+            ids, self._delivered = self._delivered, []
+            try:
+                await self.on_delivered(ids)
+            except Exception as e:
+                logger.error(f"Failed to record {len(ids)} delivered notifications: {str(e)}")
+
+    async def send_all(self, messages: Union[Iterable[OutgoingMessage], AsyncIterable[OutgoingMessage]]) -> Tuple[int, int]:
+        """Send everything, flush the last batch and return (sent, failed)"""
+        # A bounded queue so a large (streamed) input is not read far ahead
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        workers = [asyncio.create_task(self._worker(queue)) for _ in range(self.concurrency)]
+        try:
+            if hasattr(messages, "__aiter__"):
+                async for message in messages:
+                    await queue.put(message)
+            else:
+                for message in messages:
+                    await queue.put(message)
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await self.flush()
+        return self.sent, self.failed
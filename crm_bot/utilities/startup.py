@@ -0,0 +1,46 @@
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.methods import GetUpdates, SetWebhook
+from typing import Dict, Optional
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class StartupTimer:
+    """Durations of the startup stages, logged once the bot asks for its first updates"""
+
+    def __init__(self, started: float):
+        self.started = started
+        self.last = started
+        self.stages: Dict[str, float] = {}
+        self.reported = False
+
+    def mark(self, stage: str, now: Optional[float] = None) -> None:
+        now = time.perf_counter() if now is None else now
+        self.stages[stage] = now - self.last
+        self.last = now
+
+    def report(self) -> None:
+        if self.reported:
+            return
+        self.reported = True
+        total = self.last - self.started
+        breakdown = ", ".join(f"{stage} {seconds * 1000:.0f}ms" for stage, seconds in self.stages.items())
+        logger.info(f"Startup took {total * 1000:.0f}ms: {breakdown}")
+
+
+class FirstPollMiddleware(BaseRequestMiddleware):
+    """
+    Closes the "first_poll" stage when the first getUpdates (or setWebhook)
+    request goes out; the long-poll wait itself is not counted.
+    """
+
+    def __init__(self, timer: StartupTimer):
+        self.timer = timer
+
+    async def __call__(self, make_request, bot, method):
+        if not self.timer.reported and isinstance(method, (GetUpdates, SetWebhook)):
+            self.timer.mark("first_poll")
+            self.timer.report()
+        return await make_request(bot, method)
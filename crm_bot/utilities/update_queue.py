@@ -0,0 +1,180 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Counters of chats idle for this long are dropped (checked once a minute)
+CHAT_STATS_TTL = 3600
+PRUNE_INTERVAL = 60
+
+
+class ChatStats:
+    __slots__ = ("depth", "max_depth", "processed", "total_wait", "max_wait", "last_active")
+
+    def __init__(self):
+        self.depth = 0  # queued + running
+        self.max_depth = 0
+        self.processed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.last_active = time.perf_counter()
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "processed": self.processed,
+            "avg_wait_ms": round(self.total_wait / self.processed * 1000, 1) if self.processed else 0.0,
+            "max_wait_ms": round(self.max_wait * 1000, 1),
+        }
+
+
+class ChatQueues:
+    """
+    Runs jobs one at a time per chat, in submission order, and at most
+    ``concurrency`` at once overall. A job waits for its chat first and only
+    then for a global slot, so a busy chat never holds slots it cannot use.
+    ``max_waiting`` (0 = unbounded) is the backlog above which callers
+    should shed work instead of queueing it.
+    """
+
+    def __init__(self, concurrency: int, max_waiting: int = 0):
+        self.concurrency = max(1, concurrency)
+        self.max_waiting = max_waiting
+        self._slots = asyncio.Semaphore(self.concurrency)
+        # asyncio.Lock wakes waiters in FIFO order
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._stats: Dict[int, ChatStats] = {}
+        self._pruned_at = time.perf_counter()
+        self.running = 0
+        self.waiting = 0
+        self.shed = 0
+
+    def overloaded(self) -> bool:
+        return self.max_waiting > 0 and self.waiting >= self.max_waiting
+
+    def _prune(self, now: float) -> None:
+        if now - self._pruned_at < PRUNE_INTERVAL:
+            return
+        self._pruned_at = now
+        idle = [
+            chat_id for chat_id, stats in self._stats.items()
+            if stats.depth == 0 and now - stats.last_active > CHAT_STATS_TTL
+        ]
+        for chat_id in idle:
+            del self._stats[chat_id]
+
+    async def run(self, chat_id: Optional[int], job: Callable[[], Awaitable[Any]]) -> Any:
+        if chat_id is None:
+            async with self._slots:
+                return await job()
+
+        queued_at = time.perf_counter()
+        self._prune(queued_at)
+        stats = self._stats.get(chat_id)
+        if stats is None:
+            stats = self._stats[chat_id] = ChatStats()
+        lock = self._locks.get(chat_id)
+        if lock is None:
+            lock = self._locks[chat_id] = asyncio.Lock()
+        stats.depth += 1
+        stats.max_depth = max(stats.max_depth, stats.depth)
+        self.waiting += 1
+        started = False
+        try:
+            async with lock:
+                async with self._slots:
+                    self.waiting -= 1
+                    started = True
+                    wait = time.perf_counter() - queued_at
+                    stats.total_wait += wait
+                    stats.max_wait = max(stats.max_wait, wait)
+                    self.running += 1
+                    try:
+                        return await job()
+                    finally:
+                        self.running -= 1
+                        stats.processed += 1
+        finally:
+            if not started:
+                self.waiting -= 1
+            stats.depth -= 1
+            stats.last_active = time.perf_counter()
+            if stats.depth == 0:
+                # Idle chats keep their counters but not their lock
+                self._locks.pop(chat_id, None)
+
+    def depth(self, chat_id: int) -> int:
+        stats = self._stats.get(chat_id)
+        return stats.depth if stats else 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "concurrency": self.concurrency,
+            "waiting": self.waiting,
+            "shed": self.shed,
+            "chats": {chat_id: stats.as_dict() for chat_id, stats in self._stats.items()},
+        }
+
+
+def update_chat_id(update: Update) -> Optional[int]:
+    """Chat an update belongs to (the user's id for chat-less updates)"""
+    try:
+        event = update.event
+    except Exception:
+        return None
+    message = getattr(event, "message", None)  # callback queries
+    chat = getattr(event, "chat", None) or getattr(message, "chat", None)
+    if chat is not None:
+        return chat.id
+    user = getattr(event, "from_user", None)
+    return user.id if user is not None else None
+
+
+class OrderedDispatcher(Dispatcher):
+    """
+    Dispatcher whose updates are processed strictly in order within a chat
+    and in parallel across chats, with UPDATE_CONCURRENCY handlers running
+    at most. Works for polling (updates handled as tasks) and webhooks.
+    Past UPDATE_MAX_WAITING queued updates, new ones skip the queue flagged
+    ``overloaded`` so ThrottlingMiddleware answers "busy" right away.
+    """
+
+    def __init__(
+        self,
+        *args: Any,
+        concurrency: int = Config.UPDATE_CONCURRENCY,
+        max_waiting: int = Config.UPDATE_MAX_WAITING,
+        **kwargs: Any
+    ):
+        super().__init__(*args, **kwargs)
+        self.chat_queues = ChatQueues(concurrency, max_waiting)
+
+    async def feed_update(self, bot: Bot, update: Update, **kwargs: Any) -> Any:
+        if self.chat_queues.overloaded():
+            self.chat_queues.shed += 1
+            return await super().feed_update(bot, update, overloaded=True, **kwargs)
+        # Nothing is awaited before the chat lock is requested, so updates
+        # keep the order in which they were fed
+        return await self.chat_queues.run(
+            update_chat_id(update),
+            lambda: super(OrderedDispatcher, self).feed_update(bot, update, **kwargs)
+        )
+
+
+async def log_update_stats(dp: Dispatcher, interval: float, throttling=None, fsm_buffer=None) -> None:
+    """Periodically log per-chat queue depth and wait times, throttling counters and FSM operations saved"""
+    while True:
+        await asyncio.sleep(interval)
+        if isinstance(dp, OrderedDispatcher):
+            logger.info("Update queue stats: %s", dp.chat_queues.stats())
+        if throttling is not None:
+            logger.info("Throttling stats: %s", throttling.stats())
+        if fsm_buffer is not None:
+            logger.info("FSM buffer stats: %s", fsm_buffer.stats())
@@ -0,0 +1,77 @@
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+from config import Config
+import asyncio
+import hashlib
+import hmac
+import logging
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def webhook_secret() -> str:
+    """Configured secret, or one derived from the bot token (same on every instance)"""
+    if Config.WEBHOOK_SECRET:
+        return Config.WEBHOOK_SECRET
+    return hashlib.sha256(f"webhook:{Config.BOT_TOKEN}".encode()).hexdigest()[:48]
+
+
+class SecretTokenRequestHandler(SimpleRequestHandler):
+    """
+    Webhook endpoint that rejects requests without Telegram's secret token
+    header and processes at most ``max_in_flight`` updates at once. Updates
+    are handled before the response is sent, so Telegram keeps (and resends)
+    anything the bot did not finish.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, secret_token: str, max_in_flight: int, **data):
+        super().__init__(dispatcher, bot, handle_in_background=False, **data)
+        self.secret_token = secret_token
+        self.max_in_flight = max(1, max_in_flight)
+        self._slots = asyncio.Semaphore(self.max_in_flight)
+        self.in_flight = 0
+        self.rejected = 0
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), self.secret_token):
+            self.rejected += 1
+            return web.Response(status=401)
+        async with self._slots:
+            self.in_flight += 1
+            try:
+                return await super().handle(request)
+            finally:
+                self.in_flight -= 1
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot) -> None:
+    """Serve updates on an embedded aiohttp server until cancelled"""
+    app = web.Application()
+    secret = webhook_secret()
+    handler = SecretTokenRequestHandler(dp, bot, secret_token=secret, max_in_flight=Config.WEBHOOK_MAX_IN_FLIGHT)
+    handler.register(app, path=Config.WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    try:
+        site = web.TCPSite(runner, Config.WEBHOOK_HOST, Config.WEBHOOK_PORT)
+        await site.start()
+        # Updates queued while the bot was down are kept and delivered
+        await bot.set_webhook(
+            url=Config.WEBHOOK_URL.rstrip("/") + Config.WEBHOOK_PATH,
+            secret_token=secret,
+            max_connections=Config.WEBHOOK_MAX_IN_FLIGHT,
+            allowed_updates=dp.resolve_used_update_types(),
+            drop_pending_updates=False
+        )
+        logger.info(
+            f"Webhook mode: listening on {Config.WEBHOOK_HOST}:{Config.WEBHOOK_PORT}{Config.WEBHOOK_PATH}, "
+            f"max {handler.max_in_flight} updates in flight"
+        )
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
@@ -0,0 +1,80 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict
+from config import Config
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ReportWorkerPool:
+    """
+    Bounded thread pool for CPU-heavy report building (openpyxl), so chat
+    handlers keep running on the event loop while an export is produced.
+    At most ``max_workers`` jobs run at once; the rest wait in a queue.
+    """
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max(1, max_workers)
+        self._executor = None
+        self._semaphore = None
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.max_queued = 0
+
+    @asynccontextmanager
+    async def slot(self, name: str) -> AsyncIterator[Callable[..., Awaitable[Any]]]:
+        """
+        Hold one worker for a multi-step job (e.g. a streamed export) and
+        yield a function that runs its steps on the pool without queueing
+        again for every step.
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix="report")
+            self._semaphore = asyncio.Semaphore(self.max_workers)
+
+        self.queued += 1
+        self.max_queued = max(self.max_queued, self.queued)
+        enqueued_at = time.perf_counter()
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.queued -= 1
+
+        waited = time.perf_counter() - enqueued_at
+        if waited > 1:
+            logger.info("Report job %s waited %.1fs for a worker (queue depth %d)", name, waited, self.queued)
+        self.running += 1
+        try:
+            yield self._execute
+        finally:
+            self.running -= 1
+            self.completed += 1
+            self._semaphore.release()
+
+    async def _execute(self, fn: Callable[..., Any], *args) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def run(self, fn: Callable[..., Any], *args) -> Any:
+        async with self.slot(getattr(fn, "__qualname__", repr(fn))) as execute:
+            return await execute(fn, *args)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "max_workers": self.max_workers,
+            "running": self.running,
+            "queued": self.queued,
+            "max_queued": self.max_queued,
+            "completed": self.completed,
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+report_pool = ReportWorkerPool(Config.REPORT_WORKERS)